@@ -0,0 +1,326 @@
+import os
+import numpy as np
+from app.db.client import get_supabase
+from app.profile_fields import parse_embedding
+from app.candidate_matrix import GATHER_MAX_FRACTION, quantize_int8
+
+# ---------------------------
+# ANN Index for overall_vibe
+# ---------------------------
+#
+# Pluggable top-k search over the candidate embeddings:
+#   "exact"    - brute force over the CandidateMatrix (default, no index)
+#   "ivf"      - in-process inverted file: spherical k-means lists, probe the
+#                nprobe closest lists only
+#   "pgvector" - the users_embedding_idx ivfflat index through an RPC
+#   "int8"     - scan the int8 codes the candidate store keeps instead of a
+#                float32 matrix, then re-rank the best ANN_RERANK at full
+#                precision
+#
+# ANN_NPROBE is the recall/latency knob for both ivf and pgvector: more probed
+# lists = closer to exact, slower. ANN_RERANK is the one for int8.
+
+ANN_INDEX = os.environ.get("ANN_INDEX", "exact")
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "8"))
+# 0 = pick from the pool size (about sqrt(n) lists)
+ANN_NLIST = int(os.environ.get("ANN_NLIST", "0"))
+# 0 = rank on the int8 scores alone
+ANN_RERANK = int(os.environ.get("ANN_RERANK", "200"))
+# pgvector over-fetch cap, as a multiple of k: past it the kept rows are
+# scored exactly instead of pulling ever more of the table
+PGVECTOR_MAX_FETCH = int(os.environ.get("PGVECTOR_MAX_FETCH", "64"))
+
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE_PER_LIST = 32
+ASSIGN_CHUNK = 8192
+# int8 rows converted per block: small enough that the float32 copy stays in
+# cache for the matrix-vector product
+QUANTIZED_CHUNK = 256
+
+
+def query_vector(query, dim):
+    """
+    float32 query vector, or None when it is unusable or all zeros.
+    """
+    vec = parse_embedding(query)
+    try:
+        vec = np.asarray(vec, dtype=np.float32)
+    except Exception:
+        return None
+    if vec.shape != (dim,) or not np.any(vec):
+        return None
+    return vec
+
+
+def _top_k(rows, sims, k):
+    """
+    Highest sims first, ties broken by row order (same as a stable sort).
+    """
+    order = np.lexsort((rows, -sims))[:k]
+    return rows[order]
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, query, k, keep):
+        """
+        Row indices of the k kept rows with the highest cosine to query.
+        """
+        rows = np.flatnonzero(keep)
+        if rows.size == 0:
+            return rows
+        sims = self.matrix.semantic_scores(query, rows)
+        return _top_k(rows, sims, k)
+
+    def updated(self, matrix, changed):
+        return ExactIndex(matrix)
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, matrix, nlist=ANN_NLIST, nprobe=ANN_NPROBE, seed=0):
+        self.matrix = matrix
+        self.nprobe = nprobe
+        n_valid = int(self._indexable(np.arange(len(matrix))).sum())
+        nlist = nlist or max(1, int(np.sqrt(n_valid)))
+        self.centroids = self._train(min(nlist, max(1, n_valid)), seed)
+        self.assign = self._assign(np.arange(len(matrix)))
+        self._build_lists()
+
+    def _indexable(self, rows):
+        m = self.matrix
+        nonzero = np.zeros(len(rows), dtype=bool)
+        for start in range(0, len(rows), ASSIGN_CHUNK):
+            chunk = rows[start:start + ASSIGN_CHUNK]
+            nonzero[start:start + len(chunk)] = np.any(m.embeddings[chunk] != 0, axis=1)
+        return m.alive[rows] & m.has_embedding[rows] & nonzero
+
+    def _unit(self, rows):
+        m = self.matrix
+        return m.embeddings[rows] / m.norms[rows, None]
+
+    def _train(self, nlist, seed):
+        rng = np.random.default_rng(seed)
+        rows = np.arange(len(self.matrix))
+        rows = rows[self._indexable(rows)]
+        if rows.size == 0:
+            return np.zeros((1, self.matrix.dim), dtype=np.float32)
+        sample = rng.choice(rows, size=min(rows.size, nlist * KMEANS_SAMPLE_PER_LIST), replace=False)
+        data = self._unit(np.sort(sample))
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+        return centroids
+
+    def _assign(self, rows):
+        """
+        Nearest list per row. Alive rows with no usable direction (missing,
+        zero or unparsable embeddings) go to list -1, which every search scans;
+        free slots go to list nlist, which is never scanned.
+        """
+        nlist = len(self.centroids)
+        assign = np.where(self.matrix.alive[rows], -1, nlist).astype(np.int32)
+        indexable = self._indexable(rows)
+        valid = rows[indexable]
+        out = np.empty(len(valid), dtype=np.int32)
+        for start in range(0, len(valid), ASSIGN_CHUNK):
+            chunk = valid[start:start + ASSIGN_CHUNK]
+            out[start:start + len(chunk)] = np.argmax(self._unit(chunk) @ self.centroids.T, axis=1)
+        assign[indexable] = out
+        return assign
+
+    def _build_lists(self):
+        self.order = np.argsort(self.assign, kind="stable")
+        counts = np.bincount(self.assign + 1, minlength=len(self.centroids) + 2)
+        # list c is order[offsets[c + 1]:offsets[c + 2]]
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def _list(self, c):
+        return self.order[self.offsets[c + 1]:self.offsets[c + 2]]
+
+    def search(self, query, k, keep):
+        vec = query_vector(query, self.matrix.dim)
+        if vec is None:
+            # No direction to probe with: every row ties, so scan exactly
+            return ExactIndex(self.matrix).search(query, k, keep)
+        probe = np.argsort(-(self.centroids @ vec))[:self.nprobe]
+        rows = np.concatenate([self._list(-1)] + [self._list(c) for c in probe])
+        rows = rows[keep[rows]]
+        if rows.size == 0:
+            return rows
+        sims = self.matrix.semantic_scores(vec, rows)
+        return _top_k(rows, sims, k)
+
+    def updated(self, matrix, changed):
+        """
+        Same centroids over a new snapshot of the same slots; only changed and
+        newly added slots are reassigned. Retrains when the pool has doubled.
+        """
+        if changed is None or len(matrix) > 2 * len(self.matrix):
+            return IVFIndex(matrix, nprobe=self.nprobe)
+        index = IVFIndex.__new__(IVFIndex)
+        index.matrix = matrix
+        index.nprobe = self.nprobe
+        index.centroids = self.centroids
+        assign = np.full(len(matrix), len(self.centroids), dtype=np.int32)
+        kept = min(len(self.assign), len(matrix))
+        assign[:kept] = self.assign[:kept]
+        stale = sorted(set(s for s in changed if s < len(matrix)) | set(range(kept, len(matrix))))
+        if stale:
+            stale = np.array(stale, dtype=np.int64)
+            assign[stale] = index._assign(stale)
+        index.assign = assign
+        index._build_lists()
+        return index
+
+
+class PgVectorIndex:
+    """
+    Delegates the search to match_users_by_embedding (migrations/005), which
+    orders by <=> on users_embedding_idx with ivfflat.probes = nprobe.
+    Users without an embedding are not in the index and are never returned.
+    Rows are only scored against this matrix, so results are mapped back by
+    user_id and anything not kept is skipped. When too few hits are kept
+    (strict dealbreakers, a small location pool) the fetch grows up to
+    PGVECTOR_MAX_FETCH * k rows, then falls back to exact scoring.
+    """
+    kind = "pgvector"
+
+    def __init__(self, matrix, nprobe=ANN_NPROBE, row_of=None):
+        self.matrix = matrix
+        self.nprobe = nprobe
+        if row_of is None:
+            row_of = {r["user_id"]: i for i, r in enumerate(matrix.rows) if r and matrix.alive[i]}
+        self.row_of = row_of
+
+    def search(self, query, k, keep):
+        vec = query_vector(query, self.matrix.dim)
+        if vec is None:
+            return ExactIndex(self.matrix).search(query, k, keep)
+        supabase = get_supabase()
+        limit = max(k, min(len(self.matrix), k * PGVECTOR_MAX_FETCH))
+        count = min(k * 4, limit)
+        while True:
+            res = supabase.rpc("match_users_by_embedding", {
+                "query_embedding": vec.tolist(),
+                "match_count": count,
+                "probes": self.nprobe,
+            }).execute()
+            hits = res.data or []
+            rows = [self.row_of.get(h["user_id"]) for h in hits]
+            rows = np.array([r for r in rows if r is not None and keep[r]], dtype=np.int64)
+            if len(rows) >= k or len(hits) < count:
+                break
+            if count >= limit:
+                return ExactIndex(self.matrix).search(vec, k, keep)
+            count = min(count * 4, limit)
+        if rows.size == 0:
+            return rows
+        return _top_k(rows, self.matrix.semantic_scores(vec, rows), k)
+
+    def updated(self, matrix, changed):
+        """
+        Same user_id -> row map with only the changed slots rewritten.
+        """
+        if changed is None:
+            return PgVectorIndex(matrix, nprobe=self.nprobe)
+        row_of = dict(self.row_of)
+        for slot in changed:
+            old = self.matrix.rows[slot] if slot < len(self.matrix) else None
+            if old and row_of.get(old["user_id"]) == slot:
+                del row_of[old["user_id"]]
+        for slot in changed:
+            if slot < len(matrix) and matrix.alive[slot]:
+                row_of[matrix.rows[slot]["user_id"]] = slot
+        return PgVectorIndex(matrix, nprobe=self.nprobe, row_of=row_of)
+
+
+class QuantizedIndex:
+    """
+    Scores every kept row on the matrix's int8 codes, keeps the best rerank
+    rows and orders those by the exact semantic score. With the candidate
+    store the codes are its resident embeddings and the float32 rows it
+    re-ranks from are on disk; a matrix without codes is quantized here.
+    """
+    kind = "int8"
+
+    def __init__(self, matrix, rerank=ANN_RERANK):
+        self.matrix = matrix
+        self.rerank = rerank
+        if matrix.codes is None:
+            codes = np.empty((len(matrix), matrix.dim), dtype=np.int8)
+            scales = np.ones(len(matrix), dtype=np.float32)
+            for start in range(0, len(matrix), ASSIGN_CHUNK):
+                block = slice(start, start + ASSIGN_CHUNK)
+                codes[block], scales[block] = quantize_int8(matrix.embeddings[block] / matrix.norms[block, None])
+            matrix.codes, matrix.scales = codes, scales
+
+    def approximate_scores(self, vec, rows):
+        """
+        Approximate semantic score ((cosine + 1) / 2, 0.0 for unparsable
+        embeddings) of the given sorted rows.
+        """
+        m = self.matrix
+        unit = vec / (float(np.linalg.norm(vec)) or 1.0)
+        if len(rows) <= GATHER_MAX_FRACTION * len(m):
+            dots = (m.codes[rows].astype(np.float32) @ unit) * m.scales[rows]
+        else:
+            dots = np.empty(len(m), dtype=np.float32)
+            block = np.empty((QUANTIZED_CHUNK, m.dim), dtype=np.float32)
+            for start in range(0, len(m), QUANTIZED_CHUNK):
+                codes = m.codes[start:start + QUANTIZED_CHUNK]
+                b = block[:len(codes)]
+                b[...] = codes
+                np.dot(b, unit, out=dots[start:start + len(codes)])
+            dots = dots[rows] * m.scales[rows]
+        return np.where(m.has_embedding[rows], (dots + 1) / 2, 0.0)
+
+    def search(self, query, k, keep):
+        vec = query_vector(query, self.matrix.dim)
+        if vec is None:
+            return ExactIndex(self.matrix).search(query, k, keep)
+        rows = np.flatnonzero(keep)
+        if rows.size == 0:
+            return rows
+        if self.rerank and rows.size <= self.rerank:
+            return _top_k(rows, self.matrix.semantic_scores(vec, rows), k)
+        approx = self.approximate_scores(vec, rows)
+        if not self.rerank:
+            return _top_k(rows, approx, k)
+        best = np.argpartition(-approx, self.rerank - 1)[:self.rerank]
+        rows = np.sort(rows[best])
+        return _top_k(rows, self.matrix.semantic_scores(vec, rows), k)
+
+    def updated(self, matrix, changed):
+        # The codes belong to the matrix
+        return QuantizedIndex(matrix, rerank=self.rerank)
+
+
+INDEX_TYPES = {
+    "exact": ExactIndex,
+    "ivf": IVFIndex,
+    "pgvector": PgVectorIndex,
+    "int8": QuantizedIndex,
+}
+
+
+def build_index(matrix, kind=None, previous=None, changed=None):
+    """
+    Index of the requested kind over matrix. previous is the index of the last
+    snapshot of the same store; changed the slots written since (None when the
+    slot layout itself changed).
+    """
+    kind = kind or ANN_INDEX
+    if previous is not None and previous.kind == kind:
+        return previous.updated(matrix, changed)
+    return INDEX_TYPES[kind](matrix)
@@ -0,0 +1,292 @@
+import numpy as np
+from app.profile_fields import EMBEDDING_DIM, parse_embedding, parse_list_field, normalize_location
+from app.tag_vocab import TagVocabulary, TagBitsets
+
+# ---------------------------
+# Candidate Matrix
+# ---------------------------
+#
+# Column-oriented view of the candidate pool so every category score can be
+# computed for all candidates at once instead of one dict at a time.
+
+LIST_FIELDS = ("interests", "personality_traits", "looking_for")
+# semantic_scores gathers the wanted embedding rows only when they are at most
+# this share of the matrix; above it one full matrix-vector product is cheaper
+# than copying the rows out. A quantized matrix always gathers: its float32
+# rows are on disk (see CandidateStore).
+GATHER_MAX_FRACTION = 0.1
+
+
+def parse_embedding_row(raw, dim=EMBEDDING_DIM):
+    """
+    Returns (vector, ok). A missing embedding behaves like the zero-vector
+    placeholder; one that cannot be parsed to dim floats is not ok.
+    """
+    if not raw:
+        return np.zeros(dim, dtype=np.float32), True
+    vec = parse_embedding(raw)
+    try:
+        vec = np.asarray(vec, dtype=np.float32)
+    except Exception:
+        return np.zeros(dim, dtype=np.float32), False
+    if vec.shape != (dim,):
+        return np.zeros(dim, dtype=np.float32), False
+    return vec, True
+
+
+def parse_embedding_rows(rows, dim=EMBEDDING_DIM):
+    embeddings = np.zeros((len(rows), dim), dtype=np.float32)
+    has_embedding = np.ones(len(rows), dtype=bool)
+    for i, r in enumerate(rows):
+        embeddings[i], has_embedding[i] = parse_embedding_row(r.get("embedding"), dim)
+    return embeddings, has_embedding
+
+
+def location_code(vocab, row):
+    """
+    Interned normalized city of a users row (vocab: city -> code).
+    """
+    return vocab.setdefault(normalize_location(row.get("city")), len(vocab))
+
+
+def meeting_code(vocab, row):
+    # -1 marks an empty meeting preference, which never scores on activity
+    pref = row.get("meeting_preferences")
+    return vocab.setdefault(pref, len(vocab)) if pref else -1
+
+
+def quantize_int8(unit):
+    """
+    (int8 codes, float32 scale per row) for rows of unit vectors. Symmetric:
+    each row's largest component maps to 127.
+    """
+    unit = np.atleast_2d(unit)
+    scales = (np.abs(unit).max(axis=1) / 127).astype(np.float32)
+    scales[scales == 0] = 1.0
+    return np.rint(unit / scales[:, None]).astype(np.int8), scales
+
+
+def embedding_norms(embeddings):
+    norms = np.linalg.norm(embeddings, axis=-1)
+    norms[norms == 0] = 1.0
+    return norms
+
+
+class CandidateMatrix:
+    """
+    Stacked candidate embeddings (float32, with precomputed norms) and
+    interned list/location fields for a batch of users rows.
+
+    rows may contain None for unused slots (see CandidateStore); those rows are
+    never kept. When embeddings/has_embedding/norms, vocab/tags or alive and
+    the location/meeting codes are given they are used as-is instead of
+    parsing each row's columns; rows then keeps its None entries.
+
+    codes/scales are the int8 unit vectors from quantize_int8 when the store
+    keeps them (ANN_INDEX=int8), None otherwise.
+    """
+
+    def __init__(self, rows, dim=EMBEDDING_DIM, embeddings=None, has_embedding=None, norms=None,
+                 vocab=None, tags=None, alive=None, location_codes=None, location_vocab=None,
+                 meeting_codes=None, meeting_vocab=None, codes=None, scales=None):
+        if alive is None:
+            alive = np.array([r is not None for r in rows], dtype=bool)
+            rows = [r if r is not None else {} for r in rows]
+        self.alive = alive
+        self.rows = rows
+        self.dim = dim
+
+        # ----- Embeddings -----
+        if embeddings is None:
+            embeddings, has_embedding = parse_embedding_rows(rows, dim)
+        self.embeddings = embeddings
+        # Rows whose embedding could not be parsed score 0.0 semantically
+        self.has_embedding = has_embedding
+        if norms is None:
+            norms = embedding_norms(embeddings)
+        self.norms = norms
+        self.codes = codes
+        self.scales = scales
+
+        # ----- Tag fields -----
+        self.vocab = vocab or TagVocabulary()
+        if tags is None:
+            tags = {
+                field: TagBitsets(self.vocab, [parse_list_field(r.get(field)) for r in rows])
+                for field in LIST_FIELDS
+            }
+        self.tags = tags
+
+        # ----- Scalar fields -----
+        if location_codes is None:
+            location_vocab = {}
+            location_codes = np.array([location_code(location_vocab, r) for r in rows], dtype=np.int32)
+        self.location_vocab = location_vocab
+        self.location_codes = location_codes
+        if meeting_codes is None:
+            meeting_vocab = {}
+            meeting_codes = np.array([meeting_code(meeting_vocab, r) for r in rows], dtype=np.int32)
+        self.meeting_vocab = meeting_vocab
+        self.meeting_codes = meeting_codes
+
+    def __len__(self):
+        return len(self.rows)
+
+    def jaccard(self, field, tags, rows=None):
+        """
+        Vectorised jaccard(tags, candidate[field]) for every row, or only the
+        given sorted row indices.
+        """
+        column = self.tags[field]
+        sizes = column.sizes if rows is None else column.sizes[rows]
+        scores = np.zeros(len(sizes), dtype=np.float64)
+        user_set = set(tags)
+        if not user_set:
+            return scores
+        inter = column.intersection_counts(self.vocab.query(user_set), rows)
+        union = len(user_set) + sizes - inter
+        ok = (sizes > 0) & (union > 0)
+        scores[ok] = inter[ok] / union[ok]
+        return scores
+
+    def dealbreaker_conflicts(self, dealbreakers):
+        """
+        Boolean mask of rows carrying any of the given dealbreaker tags.
+        """
+        conflicts = np.zeros(len(self), dtype=bool)
+        if not dealbreakers:
+            return conflicts
+        query = self.vocab.query(set(dealbreakers))
+        for field in LIST_FIELDS:
+            conflicts |= self.tags[field].any_of(query)
+        return conflicts
+
+    def semantic_scores(self, user_embedding, rows=None):
+        """
+        cosine_similarity(user_embedding, row) mapped to [0,1] for every row
+        (or only the given row indices), from a single matrix-vector product.
+        """
+        if rows is None:
+            rows = slice(None)
+            n = len(self)
+        else:
+            n = len(rows)
+        scores = np.zeros(n, dtype=np.float64)
+        vec = parse_embedding(user_embedding)
+        try:
+            vec = np.asarray(vec, dtype=np.float32)
+        except Exception:
+            return scores
+        if vec.shape != (self.dim,):
+            return scores
+        user_norm = float(np.linalg.norm(vec)) or 1.0
+        if self.codes is None and (isinstance(rows, slice) or n > GATHER_MAX_FRACTION * len(self)):
+            # Indexing the embeddings would copy most of the matrix: score
+            # every row in place and pick the wanted ones afterwards
+            dots = (self.embeddings @ vec)[rows]
+        else:
+            dots = self.embeddings[rows] @ vec
+        cosine = dots / (self.norms[rows] * user_norm)
+        valid = self.has_embedding[rows]
+        scores[valid] = (cosine[valid] + 1) / 2
+        return scores
+
+    def block_semantic_scores(self, user_rows):
+        """
+        semantic_scores for several users of this matrix at once: one
+        (len(user_rows), len(self)) matrix-matrix product. Users whose own
+        embedding could not be parsed score 0.0 against everyone.
+        """
+        user_rows = np.asarray(user_rows, dtype=np.int64)
+        cosine = (self.embeddings[user_rows] @ self.embeddings.T) / (self.norms[user_rows, None] * self.norms[None, :])
+        scores = np.where(self.has_embedding[None, :], (cosine + 1) / 2, 0.0).astype(np.float64)
+        scores[~self.has_embedding[user_rows]] = 0.0
+        return scores
+
+    def location_scores(self, city, rows=None):
+        codes = self.location_codes if rows is None else self.location_codes[rows]
+        code = self.location_vocab.get(normalize_location(city))
+        if code is None:
+            return np.zeros(len(codes), dtype=np.float64)
+        return (codes == code).astype(np.float64)
+
+    def activity_scores(self, meeting_pref, rows=None):
+        codes = self.meeting_codes if rows is None else self.meeting_codes[rows]
+        code = self.meeting_vocab.get(meeting_pref) if meeting_pref else None
+        if code is None:
+            return np.zeros(len(codes), dtype=np.float64)
+        return (codes == code).astype(np.float64)
+
+    def candidate_rows(self, dealbreakers, excluded=None, exclude=None, within=None):
+        """
+        Sorted indices of the rows worth scoring: alive, not the requesting
+        user (exclude), and without dealbreaker conflicts. excluded is the
+        precomputed (sorted) conflict set from a DealbreakerIndex; without it
+        the conflicts are found from the tag bitsets. within limits the rows
+        to those sorted indices, and then only they are looked at.
+        """
+        if within is not None:
+            rows = within[self.alive[within]]
+            if excluded is not None:
+                if len(excluded):
+                    at = np.minimum(np.searchsorted(excluded, rows), len(excluded) - 1)
+                    rows = rows[excluded[at] != rows]
+            else:
+                rows = rows[~self.dealbreaker_conflicts(dealbreakers)[rows]]
+            if exclude is not None:
+                rows = rows[rows != exclude]
+            return rows
+        if excluded is not None:
+            keep = self.alive.copy()
+            keep[excluded[excluded < len(keep)]] = False
+        else:
+            keep = self.alive & ~self.dealbreaker_conflicts(dealbreakers)
+        if exclude is not None:
+            keep[exclude] = False
+        return np.flatnonzero(keep)
+
+
+def composite_scores(interest_score, semantic, location_score, personality_score):
+    # Same weighting as the per-candidate loop in matching_engine
+    return (
+        (interest_score * 0.3) +
+        (semantic * 0.3) +
+        (location_score * 0.2) +
+        (personality_score * 0.2)
+    )
+
+
+def score_candidates(matrix, profile, user_embedding, rows, semantic=True, semantic_all=None):
+    """
+    Computes every category score plus the composite for the given rows
+    (see CandidateMatrix.candidate_rows). Returns a dict of arrays aligned with
+    rows. With semantic=False the semantic and composite scores are left as
+    None for the caller to fill in for the rows it keeps. semantic_all is an
+    already computed semantic score for every matrix row (e.g. one row of a
+    block matrix-matrix product).
+    """
+    interests = parse_list_field(profile.get("interests"))
+    personality = parse_list_field(profile.get("personality_traits"))
+    meeting_pref = profile.get("meeting_preferences") or ""
+
+    interest_score = matrix.jaccard("interests", interests, rows)
+    personality_score = matrix.jaccard("personality_traits", personality, rows)
+    activity_score = matrix.activity_scores(meeting_pref, rows)
+    location_score = matrix.location_scores(profile.get("city"), rows)
+    if semantic_all is not None:
+        semantic_score = semantic_all[rows]
+        composite_score = composite_scores(interest_score, semantic_score, location_score, personality_score)
+    elif semantic:
+        semantic_score = matrix.semantic_scores(user_embedding, rows)
+        composite_score = composite_scores(interest_score, semantic_score, location_score, personality_score)
+    else:
+        semantic_score = composite_score = None
+
+    return {
+        "semantic_score": semantic_score,
+        "interest_score": interest_score,
+        "activity_score": activity_score,
+        "personality_score": personality_score,
+        "location_score": location_score,
+        "score": composite_score,
+    }
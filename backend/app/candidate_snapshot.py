@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+from app.candidate_matrix import LIST_FIELDS
+from app.tag_vocab import TagVocabulary, TagBitsets
+from app.dealbreaker_index import DealbreakerIndex
+
+# ---------------------------
+# Candidate Store Snapshots
+# ---------------------------
+#
+# A candidate store written to disk so a starting worker can skip the full
+# users fetch. Each snapshot is a directory holding the slot-aligned arrays
+# (embeddings, tag bitsets, alive mask, location/meeting codes) and the
+# dealbreaker posting lists as .npy files, the rows (for display) in
+# rows.json, and the user ids, tag / location / meeting vocabularies and
+# overflow tags in meta.json. Nothing is rebuilt row by row on load. CURRENT names the newest one and is replaced
+# atomically, so readers never see a half-written snapshot.
+#
+# The embedding matrix is opened with np.load(mmap_mode="c"): workers share
+# the page cache copy, and the store only writes changed users to free slots
+# (see CandidateStore._retire), so only those pages become private.
+
+SNAPSHOT_FORMAT = 2
+# Older snapshot directories kept next to CURRENT (a worker may still map them)
+SNAPSHOT_KEEP = 2
+# Free slots written past the last row, so new users after the snapshot don't
+# force the mapped matrix to be copied into a bigger one straight away
+SNAPSHOT_HEADROOM = 0.1
+
+
+def _current_path(directory):
+    return os.path.join(directory, "CURRENT")
+
+
+def write_snapshot(store, directory):
+    """
+    Writes the store's current state as a new snapshot under directory and
+    points CURRENT at it. Returns the snapshot path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"snapshot-{int(time.time() * 1000)}-{os.getpid()}"
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+
+    with store.lock:
+        n = len(store.rows)
+        spare = max(16, int(n * SNAPSHOT_HEADROOM))
+
+        def save(name, values, fill=0):
+            # Written through a map, so a disk-backed array is never copied to memory
+            padded = np.lib.format.open_memmap(os.path.join(path, name), mode="w+", dtype=values.dtype,
+                                               shape=(n + spare,) + values.shape[1:])
+            padded[:n] = values[:n]
+            padded[n:] = fill
+            padded.flush()
+            del padded
+
+        save("embeddings.npy", store.embeddings)
+        save("has_embedding.npy", store.has_embedding, False)
+        save("norms.npy", store.norms, 1)
+        save("alive.npy", store.alive, False)
+        save("location_codes.npy", store.location_codes)
+        save("meeting_codes.npy", store.meeting_codes, -1)
+        if store.codes is not None:
+            save("codes.npy", store.codes)
+            save("scales.npy", store.scales, 1)
+        for field, column in store.tags.items():
+            save(f"tags_{field}.npy", column.bits)
+            save(f"sizes_{field}.npy", column.sizes)
+        posting_tags, offsets, slots = store.dealbreakers.posting_arrays()
+        np.save(os.path.join(path, "posting_offsets.npy"), offsets)
+        np.save(os.path.join(path, "posting_slots.npy"), slots)
+        meta = {
+            "format": SNAPSHOT_FORMAT,
+            "dim": store.dim,
+            "written_at": time.time(),
+            "high_water": store.high_water,
+            # In slot order, one per alive slot
+            "user_ids": [store.rows[slot]["user_id"] for slot in np.flatnonzero(store.alive[:n]).tolist()],
+            "vocab": sorted(store.vocab.ids, key=store.vocab.ids.get),
+            "location_vocab": sorted(store.location_vocab, key=store.location_vocab.get),
+            "meeting_vocab": sorted(store.meeting_vocab, key=store.meeting_vocab.get),
+            "posting_tags": posting_tags,
+            "tag_capacity": store.vocab.capacity,
+            "overflow": {
+                field: {str(slot): sorted(ids) for slot, ids in column.overflow.items() if slot < n}
+                for field, column in store.tags.items()
+            },
+        }
+        rows = store.rows[:n] + [None] * spare
+    with open(os.path.join(path, "rows.json"), "w") as f:
+        json.dump(rows, f, default=str)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, default=str)
+
+    tmp = f"{_current_path(directory)}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(name)
+    os.replace(tmp, _current_path(directory))
+    _prune(directory, name)
+    return path
+
+
+def _prune(directory, current):
+    names = sorted(
+        (n for n in os.listdir(directory) if n.startswith("snapshot-") and n != current),
+        key=lambda n: int(n.split("-")[1]),
+    )
+    for name in names[:max(0, len(names) - SNAPSHOT_KEEP)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def read_snapshot(directory, dim, max_age=None):
+    """
+    The newest snapshot under directory as a dict of store attributes plus
+    its written_at, or None if there is none (or it is for another dim, or
+    older than max_age seconds).
+    """
+    try:
+        with open(_current_path(directory)) as f:
+            path = os.path.join(directory, f.read().strip())
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get("format") != SNAPSHOT_FORMAT or meta.get("dim") != dim:
+        return None
+    if max_age is not None and time.time() - meta["written_at"] > max_age:
+        return None
+
+    with open(os.path.join(path, "rows.json")) as f:
+        rows = json.load(f)
+    vocab = TagVocabulary(capacity=meta["tag_capacity"], seed=meta["vocab"])
+    tags = {}
+    for field in LIST_FIELDS:
+        column = TagBitsets(vocab)
+        column.bits = np.load(os.path.join(path, f"tags_{field}.npy"))
+        column.sizes = np.load(os.path.join(path, f"sizes_{field}.npy"))
+        column.overflow = {int(slot): frozenset(ids) for slot, ids in meta["overflow"].get(field, {}).items()}
+        tags[field] = column
+
+    alive = np.load(os.path.join(path, "alive.npy"))
+    slots = np.flatnonzero(alive)
+    index = dict(zip(meta["user_ids"], slots.tolist()))
+    # Lowest slots are handed out first, as after _grow
+    free = np.flatnonzero(~alive)[::-1].tolist()
+    location_codes = np.load(os.path.join(path, "location_codes.npy"))
+    meeting_codes = np.load(os.path.join(path, "meeting_codes.npy"))
+    dealbreakers = DealbreakerIndex.from_postings(
+        meta["posting_tags"],
+        np.load(os.path.join(path, "posting_offsets.npy")),
+        np.load(os.path.join(path, "posting_slots.npy")),
+    )
+    # int8 codes, when the writing store kept them (ANN_INDEX=int8)
+    codes = scales = None
+    if os.path.exists(os.path.join(path, "codes.npy")):
+        codes = np.load(os.path.join(path, "codes.npy"))
+        scales = np.load(os.path.join(path, "scales.npy"))
+
+    return {
+        "index": index,
+        "rows": rows,
+        "free": free,
+        "alive": alive,
+        "embeddings": np.load(os.path.join(path, "embeddings.npy"), mmap_mode="c"),
+        "has_embedding": np.load(os.path.join(path, "has_embedding.npy")),
+        "norms": np.load(os.path.join(path, "norms.npy")),
+        "codes": codes,
+        "scales": scales,
+        "vocab": vocab,
+        "tags": tags,
+        "dealbreakers": dealbreakers,
+        "locations": _locations(meta["location_vocab"], location_codes, slots),
+        "location_vocab": {city: code for code, city in enumerate(meta["location_vocab"])},
+        "location_codes": location_codes,
+        "meeting_vocab": {pref: code for code, pref in enumerate(meta["meeting_vocab"])},
+        "meeting_codes": meeting_codes,
+        "high_water": meta["high_water"],
+        "written_at": meta["written_at"],
+    }
+
+
+def _locations(cities, codes, slots):
+    # normalized city -> set of alive slots, one group per city
+    order = np.argsort(codes[slots], kind="stable")
+    grouped, slot_codes = slots[order], codes[slots][order]
+    bounds = np.flatnonzero(np.diff(slot_codes)) + 1
+    return {
+        cities[int(group_codes[0])]: set(group.tolist())
+        for group, group_codes in zip(np.split(grouped, bounds), np.split(slot_codes, bounds))
+        if len(group)
+    }
@@ -0,0 +1,565 @@
+import os
+import time
+import weakref
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from collections import deque
+import numpy as np
+from app.db.client import get_supabase
+from app.profile_fields import EMBEDDING_DIM, CANDIDATE_COLUMNS
+from app.profile_fields import parse_list_field, normalize_location
+from app.candidate_matrix import CandidateMatrix, LIST_FIELDS, parse_embedding_row, location_code, meeting_code
+from app.candidate_matrix import quantize_int8
+from app.tag_vocab import TagVocabulary, TagBitsets
+from app.dealbreaker_index import DealbreakerIndex
+from app.ann_index import ANN_INDEX, build_index
+from app.candidate_snapshot import write_snapshot, read_snapshot
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# ---------------------------
+# Resident Candidate Store
+# ---------------------------
+#
+# Keeps every candidate's parsed embedding and list fields in process so match
+# requests stop re-downloading the users table. Loaded once at startup, then
+# kept fresh by:
+#   - patch(user_id) from the tools that write users rows
+#   - an incremental refresh of rows whose updated_at moved (other workers)
+#   - a full reload once the snapshot is older than the TTL (catches deletes)
+# Refreshes and reloads run in a background thread; requests keep reading the
+# current snapshot meanwhile.
+#
+# Matrices handed to requests share the store's arrays instead of copying
+# them, so a slot alive in any matrix still in use is never written: a changed
+# user is written to a free slot and their old slot retired, and retired slots
+# only become free again once every matrix that could see them is gone.
+#
+# With CANDIDATE_SNAPSHOT_DIR set, every full load is also written to disk
+# (app.candidate_snapshot) and a starting worker maps the newest snapshot and
+# only fetches rows updated since, instead of the whole table.
+#
+# With ANN_INDEX=int8 the resident embeddings are int8 codes with a per-row
+# scale (a quarter of float32). The float32 rows, only read to re-rank and to
+# score single users, live in an unlinked file under
+# CANDIDATE_STORE_SPILL_DIR (or the snapshot) that the page cache holds as
+# needed.
+
+CANDIDATE_STORE_ENABLED = os.environ.get("CANDIDATE_STORE_ENABLED", "1") == "1"
+CANDIDATE_STORE_TTL_SECONDS = float(os.environ.get("CANDIDATE_STORE_TTL_SECONDS", "3600"))
+CANDIDATE_STORE_REFRESH_SECONDS = float(os.environ.get("CANDIDATE_STORE_REFRESH_SECONDS", "30"))
+# updated_at is the writing transaction's start time, so a row committed after
+# the watermark passed it would be missed: each refresh re-reads this much
+# before the newest updated_at held (unchanged rows are skipped)
+CANDIDATE_STORE_REFRESH_OVERLAP_SECONDS = float(os.environ.get("CANDIDATE_STORE_REFRESH_OVERLAP_SECONDS", "60"))
+# 0 = unbounded. Otherwise the least recently updated users are evicted first.
+CANDIDATE_STORE_MAX_ROWS = int(os.environ.get("CANDIDATE_STORE_MAX_ROWS", "0"))
+# Shared snapshot directory, "" = off
+CANDIDATE_SNAPSHOT_DIR = os.environ.get("CANDIDATE_SNAPSHOT_DIR", "")
+# Where the float32 rows go with ANN_INDEX=int8, "" = the system temp dir
+CANDIDATE_STORE_SPILL_DIR = os.environ.get("CANDIDATE_STORE_SPILL_DIR", "")
+# (version, user_id) entries kept for changes_since
+CANDIDATE_STORE_CHANGE_LOG = int(os.environ.get("CANDIDATE_STORE_CHANGE_LOG", "10000"))
+
+STORE_COLUMNS = CANDIDATE_COLUMNS + ",updated_at"
+PAGE_SIZE = 1000
+
+
+class CandidateStore:
+    def __init__(self, ttl=CANDIDATE_STORE_TTL_SECONDS, refresh_interval=CANDIDATE_STORE_REFRESH_SECONDS,
+                 max_rows=CANDIDATE_STORE_MAX_ROWS, dim=EMBEDDING_DIM, quantized=ANN_INDEX == "int8"):
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_rows = max_rows
+        self.dim = dim
+        self.quantized = quantized
+        self.lock = threading.RLock()
+        # Held while a load/refresh is fetching so concurrent requests don't pile on
+        self.fetch_lock = threading.Lock()
+        # When the last background fetch failed; retried after refresh_interval
+        self.failed_at = 0.0
+        # Bumped whenever a candidate is added, changed or dropped
+        self.version = 0
+        self.changes = deque(maxlen=CANDIDATE_STORE_CHANGE_LOG)
+        self._reset()
+
+    def _reset(self):
+        self.index = {}          # user_id -> slot
+        self.rows = []           # slot -> row without its embedding (None = free)
+        self.free = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+        self.has_embedding = np.zeros(0, dtype=bool)
+        self.norms = np.ones(0, dtype=np.float32)
+        # int8 unit vectors and their scales when quantized, else None
+        self.codes = np.zeros((0, self.dim), dtype=np.int8) if self.quantized else None
+        self.scales = np.ones(0, dtype=np.float32) if self.quantized else None
+        self.location_vocab = {}
+        self.location_codes = np.zeros(0, dtype=np.int32)
+        self.meeting_vocab = {}
+        self.meeting_codes = np.full(0, -1, dtype=np.int32)
+        # Tag bitsets patched in place, one per list field
+        self.vocab = TagVocabulary()
+        self.tags = {field: TagBitsets(self.vocab) for field in LIST_FIELDS}
+        self.dealbreakers = DealbreakerIndex()
+        self.locations = {}      # normalized city -> set of slots
+        self.high_water = None   # newest updated_at seen
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self.ready = False
+        self._matrix = None
+        self._index = None
+        # Matrices built so far, and the live ones by generation
+        self.generation = 0
+        self._live = weakref.WeakValueDictionary()
+        self.retired = deque()   # (generation when retired, slot)
+        self.changed = None      # slots written since the index was built (None = rebuild)
+
+    def __len__(self):
+        return len(self.index)
+
+    # -----------------------------------
+    # Slot management
+    # -----------------------------------
+
+    def _new_embeddings(self, capacity):
+        if not self.quantized:
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+        # Unlinked on creation; the mapping keeps it until the array is gone
+        with tempfile.TemporaryFile(dir=CANDIDATE_STORE_SPILL_DIR or None) as f:
+            return np.memmap(f, dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+
+    def _grow(self, capacity):
+        old = len(self.rows)
+        if capacity <= old:
+            return
+        embeddings = self._new_embeddings(capacity)
+        embeddings[:old] = self.embeddings
+        self.embeddings = embeddings
+        extra = capacity - old
+        if self.quantized:
+            codes = np.zeros((capacity, self.dim), dtype=np.int8)
+            codes[:old] = self.codes
+            self.codes = codes
+            self.scales = np.concatenate([self.scales, np.ones(extra, dtype=np.float32)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.has_embedding = np.concatenate([self.has_embedding, np.zeros(extra, dtype=bool)])
+        self.norms = np.concatenate([self.norms, np.ones(extra, dtype=np.float32)])
+        self.location_codes = np.concatenate([self.location_codes, np.zeros(extra, dtype=np.int32)])
+        self.meeting_codes = np.concatenate([self.meeting_codes, np.full(extra, -1, dtype=np.int32)])
+        for column in self.tags.values():
+            column.grow(capacity)
+        self.rows.extend([None] * (capacity - old))
+        self.free.extend(range(capacity - 1, old - 1, -1))
+
+    def _release_retired(self):
+        # Retired slots no live matrix was built before are free again
+        oldest = min(self._live.keys(), default=None)
+        while self.retired and (oldest is None or self.retired[0][0] < oldest):
+            slot = self.retired.popleft()[1]
+            for column in self.tags.values():
+                column.set_row(slot, [])
+            self.free.append(slot)
+
+    def _take_slot(self):
+        self._release_retired()
+        if not self.free:
+            self._grow(with_headroom(len(self.rows)))
+        return self.free.pop()
+
+    def _retire(self, slot):
+        # Only the store's own bookkeeping changes; the slot's array rows stay
+        # as they are for matrices still reading them
+        self._unlocate(slot)
+        self.dealbreakers.set_row(slot, None)
+        self.rows[slot] = None
+        self.alive[slot] = False
+        self.retired.append((self.generation, slot))
+        if self.changed is not None:
+            self.changed.add(slot)
+
+    def _put(self, row):
+        user_id = row.get("user_id")
+        old = self.index.get(user_id)
+        updated_at = row.get("updated_at")
+        if old is not None and updated_at is not None and self.rows[old].get("updated_at") == updated_at:
+            # Already held (e.g. re-read by the refresh overlap)
+            return
+        self.version += 1
+        self.changes.append((self.version, user_id))
+        self._matrix = None
+        slot = self._take_slot()
+        if old is not None:
+            self._retire(old)
+        self.index[user_id] = slot
+        self.locations.setdefault(normalize_location(row.get("city")), set()).add(slot)
+
+        vec, ok = parse_embedding_row(row.get("embedding"), self.dim)
+        self.embeddings[slot] = vec
+        self.has_embedding[slot] = ok
+        self.norms[slot] = float(np.linalg.norm(vec)) or 1.0
+        if self.quantized:
+            codes, scales = quantize_int8(vec / self.norms[slot])
+            self.codes[slot], self.scales[slot] = codes[0], scales[0]
+        for field, column in self.tags.items():
+            column.set_row(slot, parse_list_field(row.get(field)))
+        self.dealbreakers.set_row(slot, row)
+        self.location_codes[slot] = location_code(self.location_vocab, row)
+        self.meeting_codes[slot] = meeting_code(self.meeting_vocab, row)
+
+        row = {k: v for k, v in row.items() if k != "embedding"}
+        self.rows[slot] = row
+        self.alive[slot] = True
+        if self.changed is not None:
+            self.changed.add(slot)
+
+        if updated_at and (self.high_water is None or updated_at > self.high_water):
+            self.high_water = updated_at
+
+    def _drop(self, user_id):
+        slot = self.index.pop(user_id, None)
+        if slot is None:
+            return
+        self.version += 1
+        self.changes.append((self.version, user_id))
+        self._matrix = None
+        self._retire(slot)
+
+    def _unlocate(self, slot):
+        city = normalize_location(self.rows[slot].get("city"))
+        slots = self.locations.get(city)
+        if slots is not None:
+            slots.discard(slot)
+            if not slots:
+                del self.locations[city]
+
+    def _evict(self):
+        if not self.max_rows or len(self.index) <= self.max_rows:
+            return
+        by_age = sorted(self.index, key=lambda uid: self.rows[self.index[uid]].get("updated_at") or "")
+        for user_id in by_age[:len(self.index) - self.max_rows]:
+            self._drop(user_id)
+
+    # -----------------------------------
+    # Loading
+    # -----------------------------------
+
+    def _fetch_pages(self, since=None):
+        supabase = get_supabase()
+        start = 0
+        while True:
+            query = supabase.table("users").select(STORE_COLUMNS)
+            if since:
+                query = query.gte("updated_at", overlap_start(since))
+            # Newest first so a max_rows cap keeps the most recently active users
+            res = query.order("updated_at", desc=True).order("user_id").range(start, start + PAGE_SIZE - 1).execute()
+            page = res.data or []
+            yield from page
+            if len(page) < PAGE_SIZE:
+                return
+            start += PAGE_SIZE
+            if since is None and self.max_rows and start >= self.max_rows:
+                return
+
+    def _swap_in(self, fresh, loaded_at):
+        with self.lock:
+            for attr in ("index", "rows", "free", "alive", "embeddings", "has_embedding", "norms", "codes", "scales",
+                         "vocab", "tags",
+                         "dealbreakers", "locations", "location_vocab", "location_codes", "meeting_vocab",
+                         "meeting_codes", "high_water",
+                         "_matrix", "_index", "changed", "generation", "_live", "retired"):
+                setattr(self, attr, getattr(fresh, attr))
+            self.loaded_at = loaded_at
+            self.refreshed_at = time.time()
+            # Individual changes are unknown across a reload: see changes_since
+            self.version += 1
+            self.changes.clear()
+            self.ready = True
+
+    def load(self):
+        """
+        Full (re)load of the users table. The new snapshot is built off to the
+        side and swapped in, so readers keep the old one until it is ready.
+        """
+        rows = list(self._fetch_pages())
+        fresh = CandidateStore(self.ttl, self.refresh_interval, self.max_rows, self.dim, self.quantized)
+        # Spare slots for the changes that follow, so the first ones don't
+        # grow (copy) the arrays under the lock
+        fresh._grow(with_headroom(len(rows)))
+        for row in rows:
+            fresh._put(row)
+        fresh._evict()
+        # Build the matrix and ANN index here too, off the request path
+        fresh._current_matrix()
+        fresh._current_index()
+        self._swap_in(fresh, time.time())
+        logger.info("Candidate store loaded %d users", len(self))
+        if CANDIDATE_SNAPSHOT_DIR:
+            try:
+                write_snapshot(fresh, CANDIDATE_SNAPSHOT_DIR)
+            except Exception as e:
+                logger.error("Error writing candidate snapshot: %s", e)
+
+    def load_snapshot(self, directory):
+        """
+        Maps the newest snapshot under directory and applies the rows updated
+        since it was written. Returns False (leaving the store untouched) when
+        there is none or it is older than the TTL.
+        """
+        snapshot = read_snapshot(directory, self.dim, max_age=self.ttl)
+        if snapshot is None:
+            return False
+        fresh = CandidateStore(self.ttl, self.refresh_interval, self.max_rows, self.dim, self.quantized)
+        for attr, value in snapshot.items():
+            if attr not in ("written_at", "codes", "scales"):
+                setattr(fresh, attr, value)
+        if self.quantized:
+            fresh._quantize_snapshot(snapshot.get("codes"), snapshot.get("scales"))
+        # The delta: rows the users table has updated since the snapshot's
+        # newest one, re-fetched (there is no change log to replay)
+        for row in fresh._fetch_pages(since=fresh.high_water):
+            fresh._put(row)
+        fresh._evict()
+        fresh._current_index()
+        # Age from the snapshot, so the TTL reload still catches deletes
+        self._swap_in(fresh, snapshot["written_at"])
+        logger.info("Candidate store mapped %d users from %s", len(self), directory)
+        return True
+
+    def _quantize_snapshot(self, codes, scales):
+        # A snapshot written without int8 codes is quantized from its rows
+        if codes is None or len(codes) != len(self.rows):
+            n = len(self.rows)
+            codes = np.zeros((n, self.dim), dtype=np.int8)
+            scales = np.ones(n, dtype=np.float32)
+            for start in range(0, n, PAGE_SIZE):
+                block = slice(start, start + PAGE_SIZE)
+                codes[block], scales[block] = quantize_int8(self.embeddings[block] / self.norms[block, None])
+        self.codes, self.scales = codes, scales
+
+    def refresh(self):
+        """
+        Pulls only rows updated since the newest one already held (less the
+        overlap window). The matrix and ANN index are rebuilt here when
+        something changed, not on the next request.
+        """
+        if not self.ready:
+            return self.load()
+        rows = list(self._fetch_pages(since=self.high_water))
+        with self.lock:
+            for row in rows:
+                self._put(row)
+            self._evict()
+            self._current_matrix()
+            self._current_index()
+            self.refreshed_at = time.time()
+
+    def patch(self, user_id: str):
+        """
+        Re-reads a single user after a write through the tools.
+        """
+        if not self.ready:
+            return
+        supabase = get_supabase()
+        res = supabase.table("users").select(STORE_COLUMNS).eq("user_id", user_id).execute()
+        with self.lock:
+            if res.data:
+                self._put(res.data[0])
+                self._evict()
+            else:
+                self._drop(user_id)
+
+    # -----------------------------------
+    # Reads
+    # -----------------------------------
+
+    def ensure_fresh(self):
+        """
+        Starts a background refresh (or full reload, past the TTL) when one is
+        due. Never waits for it: the current snapshot is served meanwhile.
+        """
+        now = time.time()
+        if now - self.refreshed_at <= self.refresh_interval and now - self.loaded_at <= self.ttl:
+            return
+        if now - self.failed_at <= self.refresh_interval:
+            return
+        if not self.fetch_lock.acquire(blocking=False):
+            # Already refreshing
+            return
+        reload = now - self.loaded_at > self.ttl
+        threading.Thread(target=self._fetch_in_background, args=(reload,), daemon=True,
+                         name="candidate-store-refresh").start()
+
+    def _fetch_in_background(self, reload):
+        try:
+            if reload:
+                self.load()
+            else:
+                self.refresh()
+        except Exception as e:
+            self.failed_at = time.time()
+            logger.error("Error refreshing candidate store: %s", e)
+        finally:
+            self.fetch_lock.release()
+
+    def _current_matrix(self):
+        # Caller holds self.lock. Views of the store's arrays, not copies
+        # (see _retire); only rows and alive are copied.
+        if self._matrix is None:
+            n = len(self.rows)
+            self._matrix = CandidateMatrix(
+                list(self.rows),
+                dim=self.dim,
+                embeddings=self.embeddings[:n],
+                has_embedding=self.has_embedding[:n],
+                norms=self.norms[:n],
+                vocab=self.vocab,
+                tags={field: column.view(n) for field, column in self.tags.items()},
+                alive=self.alive[:n].copy(),
+                location_codes=self.location_codes[:n],
+                location_vocab=self.location_vocab,
+                meeting_codes=self.meeting_codes[:n],
+                meeting_vocab=self.meeting_vocab,
+                codes=self.codes[:n] if self.quantized else None,
+                scales=self.scales[:n] if self.quantized else None,
+            )
+            self.generation += 1
+            self._live[self.generation] = self._matrix
+        return self._matrix
+
+    def _current_index(self):
+        # Caller holds self.lock. None means exact scoring on the full matrix.
+        if ANN_INDEX == "exact":
+            return None
+        matrix = self._current_matrix()
+        if self._index is None or self._index.matrix is not matrix:
+            self._index = build_index(matrix, previous=self._index, changed=self.changed)
+            self.changed = set()
+        return self._index
+
+    def matrix(self):
+        """
+        CandidateMatrix over every slot (free slots are never kept).
+        Its arrays are shared with the store, which never writes a slot the
+        matrix can see.
+        """
+        self.ensure_fresh()
+        with self.lock:
+            return self._current_matrix()
+
+    def versions(self, user_id: str):
+        """
+        (the user's updated_at or None, pool version) for cache validation.
+        """
+        self.ensure_fresh()
+        with self.lock:
+            slot = self.index.get(user_id)
+            user_version = self.rows[slot].get("updated_at") if slot is not None else None
+            return user_version, self.version
+
+    def changes_since(self, version):
+        """
+        (user_ids added, changed or dropped after version, current version).
+        The ids are None when the log no longer reaches back that far, e.g.
+        across a full reload: treat everything as changed.
+        """
+        with self.lock:
+            if version >= self.version:
+                return set(), self.version
+            changed = set()
+            for v, user_id in reversed(self.changes):
+                if v <= version:
+                    return changed, self.version
+                changed.add(user_id)
+            if self.changes and self.changes[0][0] == version + 1:
+                return changed, self.version
+            return None, self.version
+
+    def slots(self, user_ids):
+        """
+        user_id -> slot for the given users that are held.
+        """
+        with self.lock:
+            return {uid: self.index[uid] for uid in user_ids if uid in self.index}
+
+    def display_rows(self, user_ids):
+        """
+        user_id -> held row (no embedding) for the given users that are held.
+        """
+        with self.lock:
+            return {uid: self.rows[self.index[uid]] for uid in user_ids if uid in self.index}
+
+    def snapshot(self, user_id: str, dealbreakers=None, city=None):
+        """
+        (matrix, slot of user_id or None, ANN index or None, slots excluded by
+        dealbreakers, sorted slots of the users in city), read under one lock.
+        Without a city no slots are looked up.
+        """
+        self.ensure_fresh()
+        with self.lock:
+            local = np.zeros(0, dtype=np.int64)
+            if city:
+                local = np.array(sorted(self.locations.get(normalize_location(city), ())), dtype=np.int64)
+            return (
+                self._current_matrix(),
+                self.index.get(user_id),
+                self._current_index(),
+                self.dealbreakers.excluded(dealbreakers),
+                local,
+            )
+
+
+def with_headroom(n):
+    # An eighth more slots: changed users need a free slot each until the
+    # matrices holding their old one are gone
+    return max(16, n + n // 8)
+
+
+def overlap_start(high_water):
+    """
+    The updated_at a refresh reads from: CANDIDATE_STORE_REFRESH_OVERLAP_SECONDS
+    before high_water.
+    """
+    try:
+        start = datetime.fromisoformat(high_water) - timedelta(seconds=CANDIDATE_STORE_REFRESH_OVERLAP_SECONDS)
+    except (TypeError, ValueError):
+        return high_water
+    return start.isoformat()
+
+
+candidate_store = CandidateStore()
+
+
+def get_candidate_store():
+    """
+    The process-wide store, or None when disabled or not loaded yet.
+    """
+    if not CANDIDATE_STORE_ENABLED or not candidate_store.ready:
+        return None
+    return candidate_store
+
+
+def load_candidate_store():
+    if not CANDIDATE_STORE_ENABLED:
+        return
+    try:
+        if CANDIDATE_SNAPSHOT_DIR and candidate_store.load_snapshot(CANDIDATE_SNAPSHOT_DIR):
+            return
+        candidate_store.load()
+    except Exception as e:
+        logger.error("Error loading candidate store: %s", e)
+
+
+def notify_user_changed(user_id: str):
+    """
+    Called by the tools after they write a users row.
+    """
+    store = get_candidate_store()
+    if not store:
+        return
+    try:
+        store.patch(user_id)
+    except Exception as e:
+        logger.error("Error patching candidate store: %s", e)
@@ -1,19 +1,67 @@
 import os
-from supabase import create_client, Client
+import asyncio
+import httpx
+from supabase import create_client, Client, create_async_client, AsyncClient, AsyncClientOptions
 from dotenv import load_dotenv
+from app.metrics import instrument_client
+from app.log import get_logger
+
+logger = get_logger(__name__)
 
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 
-if not url or not key:
-    print("Warning: SUPABASE_URL or SUPABASE_KEY not found in environment variables.")
+# Connection pool shared by every async request (see ASYNC_MODE in main.py)
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", "20"))
+
+# "supabase", or "local" for the SQLite backend in app/db/local.py
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase")
+
+if STORAGE_BACKEND == "local":
+    from app.db.local import LocalClient, AsyncLocalClient
+    local_client = LocalClient()
+    supabase = local_client
+elif not url or not key:
+    logger.warning("SUPABASE_URL or SUPABASE_KEY not found in environment variables.")
     supabase: Client = None
 else:
     supabase: Client = create_client(url, key)
+# Times every query when METRICS_ENABLED=1 (see app/metrics.py)
+supabase = instrument_client(supabase)
+
+async_supabase: AsyncClient = None
+_async_lock = asyncio.Lock()
 
 def get_supabase() -> Client:
     if not supabase:
         raise Exception("Supabase client not initialized. Check environment variables.")
     return supabase
+
+async def get_async_supabase() -> AsyncClient:
+    """
+    Async counterpart of get_supabase, created on first use with a bounded
+    httpx pool of SUPABASE_MAX_CONNECTIONS.
+    """
+    global async_supabase
+    if async_supabase:
+        return async_supabase
+    if STORAGE_BACKEND == "local":
+        async_supabase = instrument_client(AsyncLocalClient(local_client))
+        return async_supabase
+    if not url or not key:
+        raise Exception("Supabase client not initialized. Check environment variables.")
+    async with _async_lock:
+        if not async_supabase:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=SUPABASE_MAX_CONNECTIONS,
+                ),
+                timeout=120,
+            )
+            async_supabase = instrument_client(await create_async_client(
+                url, key, options=AsyncClientOptions(httpx_client=http_client)
+            ))
+    return async_supabase
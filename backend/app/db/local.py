@@ -0,0 +1,425 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from app.profile_fields import parse_embedding
+
+# ---------------------------
+# Local Storage Backend
+# ---------------------------
+#
+# A SQLite stand-in for the Supabase client (STORAGE_BACKEND=local), so the
+# tools, the bulk job and the perf scripts run without a Supabase project.
+# It implements the slice of the PostgREST query builder the code uses:
+#   table().select/insert/upsert/update/delete
+#          .eq/neq/gt/gte/lt/lte/in_/order/limit/range/single().execute()
+# with PostgREST's conventions: writes return the written rows (none with
+# returning="minimal"), upserts with ignore_duplicates return only inserted
+# rows, unknown columns are errors and updated_at moves on every update
+# (migrations/004). rpc() calls fail like a missing function, so callers take
+# their non-RPC fallbacks.
+#
+# Tables mirror schema.sql plus the migrations. Array columns are stored as
+# JSON text, vector columns as float32 blobs returned in pgvector's text form.
+# LOCAL_DB_PATH is ":memory:" (one process) or a file shared by processes.
+
+LOCAL_DB_PATH = os.environ.get("LOCAL_DB_PATH", ":memory:")
+
+TABLES = {
+    "users": {
+        "key": ("user_id",),
+        "columns": {
+            "user_id": "text", "email": "text", "phone": "text", "name": "text", "age": "integer",
+            "age_range": "text", "city": "text", "area": "text", "gender": "text", "occupation": "text",
+            "interests": "array", "personality_traits": "array", "looking_for": "array",
+            "meeting_preferences": "text", "dealbreakers": "array", "tagline": "text",
+            "created_at": "timestamp", "updated_at": "timestamp",
+            "embedding": "vector", "embedding_hash": "text",
+        },
+        "indexes": [("updated_at",)],
+        # migrations/004's trigger
+        "touch": True,
+    },
+    "threads": {
+        "key": ("thread_id",),
+        "columns": {
+            "thread_id": "text", "user_id": "text", "title": "text",
+            "created_at": "timestamp", "updated_at": "timestamp",
+        },
+        "indexes": [("user_id",)],
+    },
+    "matches": {
+        "key": ("match_id",),
+        "unique": ("user_id", "match_user_id"),
+        "columns": {
+            "match_id": "uuid", "user_id": "text", "match_user_id": "text", "score": "real",
+            "overlap_interests": "array", "status": "text", "match_reason": "text",
+            "created_at": "timestamp",
+        },
+        "defaults": {"status": "pending"},
+        "indexes": [("match_user_id",)],
+    },
+    "messages": {
+        "key": ("id",),
+        "columns": {
+            "id": "uuid", "sender_id": "text", "receiver_id": "text", "content": "text",
+            "created_at": "timestamp", "read_at": "timestamp",
+        },
+        "indexes": [("sender_id", "receiver_id"), ("receiver_id", "sender_id")],
+    },
+    "embedding_cache": {
+        "key": ("content_hash",),
+        "columns": {
+            "content_hash": "text", "model": "text", "embedding": "vector", "created_at": "timestamp",
+        },
+    },
+}
+
+SQL_TYPES = {"text": "TEXT", "integer": "INTEGER", "real": "REAL", "array": "TEXT",
+             "vector": "BLOB", "timestamp": "TEXT", "uuid": "TEXT"}
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def encode(kind, value):
+    if value is None:
+        return None
+    if kind == "array":
+        return json.dumps(list(value)) if isinstance(value, (list, tuple, set)) else value
+    if kind == "vector":
+        try:
+            vector = np.asarray(parse_embedding(value), dtype=np.float32)
+        except (TypeError, ValueError):
+            vector = None
+        if vector is None or vector.ndim != 1 or not vector.size:
+            raise LocalError(f"invalid input syntax for type vector: \"{str(value)[:40]}\"")
+        return vector.tobytes()
+    if kind == "timestamp" and str(value).lower() in ("now()", "now"):
+        return now()
+    return value
+
+
+def decode(kind, value):
+    if value is None:
+        return None
+    if kind == "array":
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    if kind == "vector":
+        return json.dumps(np.frombuffer(value, dtype=np.float32).tolist())
+    return value
+
+
+class LocalError(Exception):
+    pass
+
+
+class LocalResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    def __init__(self, client, table):
+        if table not in TABLES:
+            raise LocalError(f"relation \"public.{table}\" does not exist")
+        self.client = client
+        self.table = table
+        self.schema = TABLES[table]
+        self.op = "select"
+        self.columns = None
+        self.payload = None
+        self.on_conflict = None
+        self.ignore_duplicates = False
+        self.filters = []
+        self.orders = []
+        self.bounds = None
+        self.one = False
+        # "minimal" skips sending written rows back, as Prefer: return=minimal
+        self.returning = "representation"
+
+    # ----- Operations -----
+
+    def select(self, columns="*", **kwargs):
+        self.op = "select"
+        self.columns = [c.strip() for c in columns.split(",")] if columns.strip() != "*" else None
+        return self
+
+    def insert(self, rows, returning="representation", **kwargs):
+        self.op, self.payload, self.returning = "insert", rows, returning
+        return self
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False, returning="representation", **kwargs):
+        self.op, self.payload, self.returning = "upsert", rows, returning
+        self.on_conflict = tuple(c.strip() for c in on_conflict.split(",")) if on_conflict else None
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values, returning="representation", **kwargs):
+        self.op, self.payload, self.returning = "update", values, returning
+        return self
+
+    def delete(self, returning="representation", **kwargs):
+        self.op, self.returning = "delete", returning
+        return self
+
+    # ----- Filters and modifiers -----
+
+    def _filter(self, column, sql, value):
+        self._column(column)
+        self.filters.append((f'"{column}" {sql}', value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "= ?", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "!= ?", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "> ?", value)
+
+    def gte(self, column, value):
+        return self._filter(column, ">= ?", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "< ?", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "<= ?", value)
+
+    def in_(self, column, values):
+        values = list(values)
+        self._column(column)
+        self.filters.append((f'"{column}" IN ({", ".join("?" * len(values)) or "NULL"})', values))
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self._column(column)
+        # Postgres puts NULLs last ascending and first descending
+        self.orders.append(f'"{column}" DESC NULLS FIRST' if desc else f'"{column}" ASC NULLS LAST')
+        return self
+
+    def limit(self, count, **kwargs):
+        self.bounds = (0, count - 1)
+        return self
+
+    def range(self, start, end, **kwargs):
+        self.bounds = (start, end)
+        return self
+
+    def single(self):
+        self.one = True
+        return self
+
+    # ----- Execution -----
+
+    def _column(self, column):
+        if column not in self.schema["columns"]:
+            raise LocalError(f"Could not find the '{column}' column of '{self.table}' in the schema cache")
+        return column
+
+    def _where(self):
+        if not self.filters:
+            return "", []
+        params = []
+        for _, value in self.filters:
+            params.extend(value if isinstance(value, list) else [value])
+        return " WHERE " + " AND ".join(sql for sql, _ in self.filters), params
+
+    def _rows(self, cursor):
+        names = [d[0] for d in cursor.description]
+        kinds = [self.schema["columns"][n] for n in names]
+        return [{n: decode(k, v) for n, k, v in zip(names, kinds, row)} for row in cursor.fetchall()]
+
+    def _returning(self):
+        columns = self.columns or list(self.schema["columns"])
+        return ", ".join(f'"{self._column(c)}"' for c in columns)
+
+    def _select(self, db):
+        where, params = self._where()
+        sql = f'SELECT {self._returning()} FROM "{self.table}"{where}'
+        if self.orders:
+            sql += " ORDER BY " + ", ".join(self.orders)
+        if self.bounds:
+            sql += f" LIMIT {self.bounds[1] - self.bounds[0] + 1} OFFSET {self.bounds[0]}"
+        return self._rows(db.execute(sql, params))
+
+    def _with_defaults(self, row):
+        row = dict(row)
+        for column in row:
+            self._column(column)
+        for column, kind in self.schema["columns"].items():
+            if kind == "uuid" and column in self.schema["key"]:
+                row.setdefault(column, str(uuid.uuid4()))
+        for column, value in self.schema.get("defaults", {}).items():
+            row.setdefault(column, value)
+        stamp = now()
+        for column in ("created_at", "updated_at"):
+            if column in self.schema["columns"]:
+                row.setdefault(column, stamp)
+        return row
+
+    def _run(self, db, sql, params):
+        if self.returning == "minimal":
+            db.execute(sql, params)
+            return []
+        return self._rows(db.execute(sql + f" RETURNING {self._returning()}", params))
+
+    def _write(self, db):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        if not rows:
+            return []
+        sent = list(dict.fromkeys(c for row in rows for c in row))
+        rows = [self._with_defaults({c: row.get(c) for c in sent}) for row in rows]
+        columns = list(rows[0])
+        sql = f'INSERT INTO "{self.table}" ({", ".join(f"{chr(34)}{c}{chr(34)}" for c in columns)}) ' \
+              f'VALUES ({", ".join("?" * len(columns))})'
+        if self.op == "upsert":
+            # PostgREST upserts on the primary key unless on_conflict names another
+            conflict = self.on_conflict or self.schema["key"]
+            updates = [c for c in sent if c not in conflict]
+            if self.schema.get("touch") and "updated_at" not in updates:
+                updates.append("updated_at")
+            target = ", ".join(f'"{c}"' for c in conflict)
+            if self.ignore_duplicates or not updates:
+                sql += f" ON CONFLICT ({target}) DO NOTHING"
+            else:
+                sql += f" ON CONFLICT ({target}) DO UPDATE SET " + ", ".join(f'"{c}" = excluded."{c}"' for c in updates)
+        params = [[encode(self.schema["columns"][c], row[c]) for c in columns] for row in rows]
+        if self.returning == "minimal":
+            db.executemany(sql, params)
+            return []
+        out = []
+        for values in params:
+            out.extend(self._run(db, sql, values))
+        return out
+
+    def _update(self, db):
+        values = dict(self.payload)
+        if self.schema.get("touch"):
+            values["updated_at"] = now()
+        columns = [self._column(c) for c in values]
+        where, params = self._where()
+        sql = f'UPDATE "{self.table}" SET ' + ", ".join(f'"{c}" = ?' for c in columns) + where
+        params = [encode(self.schema["columns"][c], values[c]) for c in columns] + params
+        return self._run(db, sql, params)
+
+    def _delete(self, db):
+        where, params = self._where()
+        return self._run(db, f'DELETE FROM "{self.table}"{where}', params)
+
+    def execute(self):
+        with self.client.transaction() as db:
+            if self.op == "select":
+                data = self._select(db)
+            elif self.op in ("insert", "upsert"):
+                data = self._write(db)
+            elif self.op == "update":
+                data = self._update(db)
+            else:
+                data = self._delete(db)
+        if self.one:
+            if len(data) != 1:
+                raise LocalError(f"JSON object requested, multiple (or no) rows returned ({len(data)})")
+            data = data[0]
+        return LocalResponse(data)
+
+
+class LocalRpc:
+    def __init__(self, name):
+        self.name = name
+
+    def execute(self):
+        raise LocalError(f"Could not find the function public.{self.name} in the schema cache")
+
+
+class LocalClient:
+    """
+    get_supabase() for STORAGE_BACKEND=local. One SQLite connection per
+    process, opened on first use (so forked workers get their own), with
+    every statement serialised through a lock.
+    """
+
+    def __init__(self, path=LOCAL_DB_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+        self.pid = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+        for table, schema in TABLES.items():
+            columns = [f'"{c}" {SQL_TYPES[k]}' for c, k in schema["columns"].items()]
+            columns.append(f"PRIMARY KEY ({', '.join(schema['key'])})")
+            if schema.get("unique"):
+                columns.append(f"UNIQUE ({', '.join(schema['unique'])})")
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(columns)})')
+            for i, index in enumerate(schema.get("indexes", [])):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_idx_{i}" ON "{table}" ({", ".join(index)})')
+        return conn
+
+    def transaction(self):
+        client = self
+
+        class Transaction:
+            def __enter__(self):
+                client.lock.acquire()
+                if client.conn is None or client.pid != os.getpid():
+                    client.conn, client.pid = client._connect(), os.getpid()
+                client.conn.execute("BEGIN IMMEDIATE")
+                return client.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                try:
+                    client.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+                finally:
+                    client.lock.release()
+
+        return Transaction()
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, params=None, **kwargs):
+        return LocalRpc(name)
+
+
+# ----- Async counterparts for get_async_supabase -----
+
+class AsyncLocalQuery(LocalQuery):
+    async def execute(self):
+        return LocalQuery.execute(self)
+
+
+class AsyncLocalRpc(LocalRpc):
+    async def execute(self):
+        return LocalRpc.execute(self)
+
+
+class AsyncLocalClient:
+    def __init__(self, client):
+        self.client = client
+
+    def table(self, name):
+        return AsyncLocalQuery(self.client, name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, params=None, **kwargs):
+        return AsyncLocalRpc(name)
@@ -0,0 +1,21 @@
+-- Keep users.updated_at current on every UPDATE.
+-- The in-process candidate store refreshes incrementally by updated_at,
+-- so rows changed by any writer must move it forward.
+
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_set_updated_at ON users;
+CREATE TRIGGER users_set_updated_at
+    BEFORE UPDATE ON users
+    FOR EACH ROW
+    EXECUTE FUNCTION set_updated_at();
+
+CREATE INDEX
+IF NOT EXISTS users_updated_at_idx ON users
+(updated_at);
@@ -0,0 +1,25 @@
+-- Top-k users by cosine similarity, served by users_embedding_idx (ivfflat).
+-- Used by the "pgvector" ANN index for the overall_vibe category.
+-- probes is the recall/latency knob: ivfflat scans that many of its lists.
+
+CREATE OR REPLACE FUNCTION match_users_by_embedding(
+    query_embedding vector(1536),
+    match_count INTEGER DEFAULT 20,
+    probes INTEGER DEFAULT 8,
+    exclude_user_id TEXT DEFAULT NULL
+)
+RETURNS TABLE (user_id TEXT, similarity FLOAT)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    PERFORM set_config('ivfflat.probes', probes::TEXT, true);
+    RETURN QUERY
+        SELECT u.user_id, 1 - (u.embedding <=> query_embedding) AS similarity
+        FROM users u
+        WHERE u.embedding IS NOT NULL
+          AND (exclude_user_id IS NULL OR u.user_id <> exclude_user_id)
+        ORDER BY u.embedding <=> query_embedding
+        LIMIT match_count;
+END;
+$$;
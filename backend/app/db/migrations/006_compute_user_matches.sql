@@ -0,0 +1,100 @@
+-- Server-side version of compute_matches_for_user.
+-- Applies the dealbreaker filter, scores every candidate with the same
+-- formulas as app/matching_engine.py and returns only the rows that make
+-- the top p_per_category of at least one category (at most 5 x p_per_category
+-- rows), with the full score breakdown. The caller classifies them.
+
+CREATE OR REPLACE FUNCTION tag_jaccard(a TEXT[], b TEXT[])
+RETURNS FLOAT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN COALESCE(cardinality(a), 0) = 0 OR COALESCE(cardinality(b), 0) = 0 THEN 0.0
+        ELSE (SELECT count(*) FROM (SELECT unnest(a) INTERSECT SELECT unnest(b)) i)::FLOAT
+           / (SELECT count(*) FROM (SELECT unnest(a) UNION SELECT unnest(b)) u)::FLOAT
+    END;
+$$;
+
+CREATE OR REPLACE FUNCTION compute_user_matches(
+    p_user_id TEXT,
+    p_per_category INTEGER DEFAULT 5
+)
+RETURNS TABLE (
+    match_user_id TEXT,
+    name TEXT,
+    age INTEGER,
+    city TEXT,
+    tagline TEXT,
+    overlap_interests TEXT[],
+    semantic_score FLOAT,
+    interest_score FLOAT,
+    activity_score FLOAT,
+    personality_score FLOAT,
+    location_score FLOAT,
+    score FLOAT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH me AS (
+        SELECT * FROM users WHERE users.user_id = p_user_id
+    ),
+    pool AS (
+        SELECT
+            c.user_id AS match_user_id,
+            c.name,
+            c.age,
+            c.city,
+            c.tagline,
+            ARRAY(SELECT unnest(me.interests) INTERSECT SELECT unnest(c.interests)) AS overlap_interests,
+            -- Missing embeddings behave like the zero-vector placeholder (cosine 0)
+            CASE
+                WHEN me.embedding IS NULL OR c.embedding IS NULL THEN 0.5
+                ELSE COALESCE(NULLIF((2 - (c.embedding <=> me.embedding)) / 2, 'NaN'::FLOAT), 0.5)
+            END AS semantic_score,
+            tag_jaccard(me.interests, c.interests) AS interest_score,
+            CASE
+                WHEN COALESCE(me.meeting_preferences, '') <> ''
+                 AND COALESCE(c.meeting_preferences, '') <> ''
+                 AND me.meeting_preferences = c.meeting_preferences THEN 1.0
+                ELSE 0.0
+            END AS activity_score,
+            tag_jaccard(me.personality_traits, c.personality_traits) AS personality_score,
+            -- Same-city boost
+            CASE
+                WHEN lower(btrim(COALESCE(c.city, ''))) = lower(btrim(COALESCE(me.city, ''))) THEN 1.0
+                ELSE 0.0
+            END AS location_score
+        FROM users c, me
+        WHERE c.user_id <> p_user_id
+          AND NOT (
+              (COALESCE(c.interests, '{}') || COALESCE(c.personality_traits, '{}') || COALESCE(c.looking_for, '{}'))
+              && COALESCE(me.dealbreakers, '{}')
+          )
+    ),
+    scored AS (
+        SELECT
+            pool.*,
+            (interest_score * 0.3) + (semantic_score * 0.3) + (location_score * 0.2) + (personality_score * 0.2) AS score
+        FROM pool
+    ),
+    picked AS (
+        (SELECT s.match_user_id FROM scored s ORDER BY s.location_score DESC, s.match_user_id LIMIT p_per_category)
+        UNION
+        (SELECT s.match_user_id FROM scored s ORDER BY s.interest_score DESC, s.match_user_id LIMIT p_per_category)
+        UNION
+        (SELECT s.match_user_id FROM scored s ORDER BY s.activity_score DESC, s.match_user_id LIMIT p_per_category)
+        UNION
+        (SELECT s.match_user_id FROM scored s ORDER BY s.personality_score DESC, s.match_user_id LIMIT p_per_category)
+        UNION
+        (SELECT s.match_user_id FROM scored s ORDER BY s.semantic_score DESC, s.match_user_id LIMIT p_per_category)
+    )
+    SELECT
+        s.match_user_id, s.name, s.age, s.city, s.tagline, s.overlap_interests,
+        s.semantic_score, s.interest_score, s.activity_score,
+        s.personality_score, s.location_score, s.score
+    FROM scored s
+    JOIN picked p ON p.match_user_id = s.match_user_id
+    ORDER BY s.match_user_id;
+$$;
@@ -0,0 +1,14 @@
+-- Content hash of the profile text each users.embedding was generated from.
+-- save_profile_section skips the embeddings API call and the embedding
+-- UPDATE when the new profile text hashes to the stored value.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS embedding_hash TEXT;
+
+-- Optional shared tier of the embedding cache (EMBEDDING_CACHE_TIER=db):
+-- embeddings by content hash, reused across users and processes.
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    content_hash TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    embedding vector(1536) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
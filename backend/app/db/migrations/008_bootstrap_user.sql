@@ -0,0 +1,36 @@
+-- Session bootstrap in one round trip: make sure the users row exists and
+-- return the profile fields injected as user_profile_context
+-- (PROFILE_CONTEXT_COLUMNS in app/profile_fields.py). Existing rows are not
+-- written, so updated_at only moves for new users.
+
+CREATE OR REPLACE FUNCTION bootstrap_user(p_user_id TEXT)
+RETURNS TABLE (
+    user_id TEXT,
+    name TEXT,
+    age INTEGER,
+    age_range TEXT,
+    city TEXT,
+    area TEXT,
+    gender TEXT,
+    occupation TEXT,
+    interests TEXT[],
+    personality_traits TEXT[],
+    looking_for TEXT[],
+    meeting_preferences TEXT,
+    dealbreakers TEXT[],
+    tagline TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO users (user_id) VALUES (p_user_id)
+    ON CONFLICT ON CONSTRAINT users_pkey DO NOTHING;
+
+    RETURN QUERY
+    SELECT u.user_id, u.name, u.age, u.age_range, u.city, u.area, u.gender,
+           u.occupation, u.interests, u.personality_traits, u.looking_for,
+           u.meeting_preferences, u.dealbreakers, u.tagline
+    FROM users u
+    WHERE u.user_id = p_user_id;
+END;
+$$;
@@ -0,0 +1,59 @@
+-- Profile save in one statement: insert or update the users row with the
+-- attributes present in p_attributes (absent keys keep their stored value)
+-- and return the merged profile context fields, the stored embedding_hash
+-- and whether an embedding is set. p_attributes may carry embedding and
+-- embedding_hash when the caller already has the embedding for the merged
+-- profile text. Concurrent saves of the same user serialize on the row.
+
+CREATE OR REPLACE FUNCTION save_profile(p_user_id TEXT, p_attributes JSONB)
+RETURNS TABLE (
+    user_id TEXT,
+    name TEXT,
+    age INTEGER,
+    age_range TEXT,
+    city TEXT,
+    area TEXT,
+    gender TEXT,
+    occupation TEXT,
+    interests TEXT[],
+    personality_traits TEXT[],
+    looking_for TEXT[],
+    meeting_preferences TEXT,
+    dealbreakers TEXT[],
+    tagline TEXT,
+    embedding_hash TEXT,
+    has_embedding BOOLEAN
+)
+LANGUAGE sql
+AS $$
+    INSERT INTO users AS u (
+        user_id, name, age, age_range, city, area, gender, occupation,
+        interests, personality_traits, looking_for, meeting_preferences,
+        dealbreakers, tagline, embedding, embedding_hash
+    )
+    SELECT
+        p_user_id, a.name, a.age, a.age_range, a.city, a.area, a.gender, a.occupation,
+        a.interests, a.personality_traits, a.looking_for, a.meeting_preferences,
+        a.dealbreakers, a.tagline, a.embedding, a.embedding_hash
+    FROM jsonb_populate_record(NULL::users, p_attributes) a
+    ON CONFLICT (user_id) DO UPDATE SET
+        name = CASE WHEN p_attributes ? 'name' THEN EXCLUDED.name ELSE u.name END,
+        age = CASE WHEN p_attributes ? 'age' THEN EXCLUDED.age ELSE u.age END,
+        age_range = CASE WHEN p_attributes ? 'age_range' THEN EXCLUDED.age_range ELSE u.age_range END,
+        city = CASE WHEN p_attributes ? 'city' THEN EXCLUDED.city ELSE u.city END,
+        area = CASE WHEN p_attributes ? 'area' THEN EXCLUDED.area ELSE u.area END,
+        gender = CASE WHEN p_attributes ? 'gender' THEN EXCLUDED.gender ELSE u.gender END,
+        occupation = CASE WHEN p_attributes ? 'occupation' THEN EXCLUDED.occupation ELSE u.occupation END,
+        interests = CASE WHEN p_attributes ? 'interests' THEN EXCLUDED.interests ELSE u.interests END,
+        personality_traits = CASE WHEN p_attributes ? 'personality_traits' THEN EXCLUDED.personality_traits ELSE u.personality_traits END,
+        looking_for = CASE WHEN p_attributes ? 'looking_for' THEN EXCLUDED.looking_for ELSE u.looking_for END,
+        meeting_preferences = CASE WHEN p_attributes ? 'meeting_preferences' THEN EXCLUDED.meeting_preferences ELSE u.meeting_preferences END,
+        dealbreakers = CASE WHEN p_attributes ? 'dealbreakers' THEN EXCLUDED.dealbreakers ELSE u.dealbreakers END,
+        tagline = CASE WHEN p_attributes ? 'tagline' THEN EXCLUDED.tagline ELSE u.tagline END,
+        embedding = CASE WHEN p_attributes ? 'embedding' THEN EXCLUDED.embedding ELSE u.embedding END,
+        embedding_hash = CASE WHEN p_attributes ? 'embedding_hash' THEN EXCLUDED.embedding_hash ELSE u.embedding_hash END
+    RETURNING
+        u.user_id, u.name, u.age, u.age_range, u.city, u.area, u.gender, u.occupation,
+        u.interests, u.personality_traits, u.looking_for, u.meeting_preferences,
+        u.dealbreakers, u.tagline, u.embedding_hash, u.embedding IS NOT NULL;
+$$;
@@ -0,0 +1,79 @@
+import numpy as np
+from app.candidate_matrix import LIST_FIELDS
+from app.profile_fields import parse_list_field
+
+# ---------------------------
+# Dealbreaker Inverted Index
+# ---------------------------
+#
+# tag -> slots of the users carrying it in interests, personality_traits or
+# looking_for. A user's dealbreaker exclusion set is the union of the posting
+# lists of their dealbreakers, known before any candidate is scored.
+
+
+class DealbreakerIndex:
+    def __init__(self):
+        self.postings = {}     # tag -> set of slots
+        self.slot_tags = {}    # slot -> frozenset of tags, to undo on rewrite
+        # False when built from_postings: slot_tags is then filled on demand
+        self.complete = True
+
+    @classmethod
+    def from_postings(cls, tags, offsets, slots):
+        """
+        Index from posting lists stored flat (see posting_arrays): tag i
+        holds slots[offsets[i]:offsets[i + 1]].
+        """
+        index = cls()
+        index.complete = False
+        for i, tag in enumerate(tags):
+            index.postings[tag] = set(slots[offsets[i]:offsets[i + 1]].tolist())
+        return index
+
+    def posting_arrays(self):
+        """
+        (tags, offsets, slots): every posting list concatenated, sorted by
+        slot, for from_postings.
+        """
+        tags = list(self.postings)
+        lengths = [len(self.postings[tag]) for tag in tags]
+        offsets = np.zeros(len(tags) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        slots = np.empty(offsets[-1], dtype=np.int64)
+        for i, tag in enumerate(tags):
+            slots[offsets[i]:offsets[i + 1]] = sorted(self.postings[tag])
+        return tags, offsets, slots
+
+    def _tags_of(self, slot):
+        old = self.slot_tags.pop(slot, None)
+        if old is None and not self.complete:
+            old = frozenset(tag for tag, posting in self.postings.items() if slot in posting)
+        return old or frozenset()
+
+    def set_row(self, slot, row):
+        """
+        Re-indexes one slot from a users row (None clears it).
+        """
+        old = self._tags_of(slot)
+        new = frozenset()
+        if row is not None:
+            new = frozenset(t for field in LIST_FIELDS for t in parse_list_field(row.get(field)))
+        for tag in old - new:
+            posting = self.postings.get(tag)
+            if posting is not None:
+                posting.discard(slot)
+                if not posting:
+                    del self.postings[tag]
+        for tag in new - old:
+            self.postings.setdefault(tag, set()).add(slot)
+        if new:
+            self.slot_tags[slot] = new
+
+    def excluded(self, dealbreakers):
+        """
+        Sorted slots of every user carrying any of the dealbreakers.
+        """
+        slots = set()
+        for tag in set(dealbreakers or []):
+            slots |= self.postings.get(tag, set())
+        return np.array(sorted(slots), dtype=np.int64)
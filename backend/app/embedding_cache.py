@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# ---------------------------
+# Embedding Cache
+# ---------------------------
+#
+# Embeddings keyed by a hash of (model, normalized text). An in-process LRU
+# sits in front of an optional shared tier: "disk" (one JSON file per hash
+# under EMBEDDING_CACHE_DIR) or "db" (the embedding_cache table, see
+# migrations/007_embedding_hash.sql). Memory entries are float32 arrays
+# (6 KB at 1536 dims instead of ~50 KB as a list of Python floats).
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TIER = os.environ.get("EMBEDDING_CACHE_TIER", "")
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def content_hash(text: str, model: str) -> str:
+    """
+    Key for an embedding: same model and same text up to whitespace.
+    """
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class DiskTier:
+    def __init__(self, directory=EMBEDDING_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, model, embedding):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(embedding, f)
+        os.replace(tmp, path)
+
+
+class DbTier:
+    def get(self, key):
+        from app.db.client import get_supabase
+        res = get_supabase().table("embedding_cache").select("embedding").eq("content_hash", key).limit(1).execute()
+        if not res.data:
+            return None
+        embedding = res.data[0].get("embedding")
+        # pgvector comes back as its text form
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        return embedding
+
+    def put(self, key, model, embedding):
+        from app.db.client import get_supabase
+        get_supabase().table("embedding_cache").upsert({
+            "content_hash": key,
+            "model": model,
+            "embedding": embedding,
+        }, on_conflict="content_hash").execute()
+
+
+TIERS = {"disk": DiskTier, "db": DbTier}
+
+
+class EmbeddingCache:
+    def __init__(self, size=EMBEDDING_CACHE_SIZE, tier=EMBEDDING_CACHE_TIER):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.tier_name = tier if tier in TIERS else None
+        self.tier = TIERS[tier]() if self.tier_name else None
+        self.hits = 0          # served from memory
+        self.tier_hits = 0     # served from the disk/db tier
+        self.misses = 0        # had to call the embeddings API
+        self.unchanged = 0     # saves whose stored embedding already matched
+
+    def get(self, key):
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return embedding.tolist()
+
+        if self.tier:
+            try:
+                embedding = self.tier.get(key)
+            except Exception as e:
+                logger.error("Error reading embedding cache tier: %s", e)
+                embedding = None
+            if embedding is not None:
+                with self.lock:
+                    self.tier_hits += 1
+                    self._remember(key, embedding)
+                return embedding
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def peek(self, key):
+        """
+        Memory tier only and not counted: for opportunistic lookups that fall
+        back to the queue (and a counted get) on a miss.
+        """
+        with self.lock:
+            embedding = self.entries.get(key)
+            return None if embedding is None else embedding.tolist()
+
+    def put(self, key, model, embedding):
+        with self.lock:
+            self._remember(key, embedding)
+        if self.tier:
+            try:
+                self.tier.put(key, model, embedding)
+            except Exception as e:
+                logger.error("Error writing embedding cache tier: %s", e)
+
+    def _remember(self, key, embedding):
+        if self.size <= 0:
+            return
+        self.entries[key] = np.asarray(embedding, dtype=np.float32)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def record_unchanged(self):
+        with self.lock:
+            self.unchanged += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.tier_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "size": self.size,
+                "tier": self.tier_name,
+                "hits": self.hits,
+                "tier_hits": self.tier_hits,
+                "misses": self.misses,
+                "unchanged": self.unchanged,
+                "hit_rate": (self.hits + self.tier_hits) / lookups if lookups else 0.0,
+            }
+
+
+embedding_cache = EmbeddingCache()
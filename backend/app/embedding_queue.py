@@ -0,0 +1,182 @@
+import os
+import time
+import threading
+from app.db.client import get_supabase
+from app.tools.generate_embedding import generate_embeddings
+from app.candidate_store import notify_user_changed
+from app.match_cache import match_cache
+from app.profile_context import profile_context_cache
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# ---------------------------
+# Background Embedding Queue
+# ---------------------------
+#
+# save_profile_section hands the new profile text to this queue and returns.
+# Saves for the same user within EMBEDDING_DEBOUNCE_SECONDS coalesce into the
+# latest text; due texts from all users go out as one embeddings request of up
+# to EMBEDDING_BATCH_SIZE, and the results are written back in one upsert.
+
+EMBEDDING_QUEUE_ENABLED = os.environ.get("EMBEDDING_QUEUE_ENABLED", "1") == "1"
+EMBEDDING_DEBOUNCE_SECONDS = float(os.environ.get("EMBEDDING_DEBOUNCE_SECONDS", "1.0"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+
+
+class EmbeddingQueue:
+    def __init__(self, debounce=EMBEDDING_DEBOUNCE_SECONDS, batch_size=EMBEDDING_BATCH_SIZE,
+                 embed=None, write=None):
+        self.debounce = debounce
+        self.batch_size = batch_size
+        # Pluggable for tests: embed(texts) -> embeddings, write(rows)
+        self.embed = embed or generate_embeddings
+        self.write = write or write_embeddings
+        self.cond = threading.Condition()
+        self.pending = {}        # user_id -> (text, text_hash, due, seq)
+        self.seq = 0
+        self.claimed = set()     # seqs of entries being embedded right now
+        self.in_flight = 0
+        self.thread = None
+        self.batches = 0
+        self.written = 0
+        self.coalesced = 0
+
+    def submit(self, user_id, text, text_hash):
+        with self.cond:
+            if user_id in self.pending:
+                self.coalesced += 1
+            self.seq += 1
+            self.pending[user_id] = (text, text_hash, time.monotonic() + self.debounce, self.seq)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="embedding-queue", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def discard(self, user_id):
+        """
+        Drops the user's pending (or in-flight) embedding, e.g. because a save
+        already wrote the embedding for the newest profile text.
+        """
+        with self.cond:
+            self.pending.pop(user_id, None)
+
+    def _waiting(self):
+        return [(user_id, entry) for user_id, entry in self.pending.items() if entry[3] not in self.claimed]
+
+    def _take_due(self, now, force=False):
+        due = sorted(
+            (entry[2], user_id) for user_id, entry in self._waiting()
+            if force or entry[2] <= now
+        )[:self.batch_size]
+        batch = [(user_id, *self.pending[user_id]) for _, user_id in due]
+        self.claimed.update(seq for *_, seq in batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self.cond:
+                batch = self._take_due(time.monotonic())
+                while not batch:
+                    waiting = self._waiting()
+                    wait = None
+                    if waiting:
+                        wait = max(0.0, min(e[2] for _, e in waiting) - time.monotonic())
+                    self.cond.wait(wait)
+                    batch = self._take_due(time.monotonic())
+                self.in_flight += 1
+            try:
+                self._process(batch)
+            finally:
+                with self.cond:
+                    self.in_flight -= 1
+                    self.cond.notify_all()
+
+    def _process(self, batch):
+        try:
+            embeddings = self.embed([text for _, text, _, _, _ in batch])
+        except Exception as e:
+            logger.error("Error generating embeddings for %d users: %s", len(batch), e)
+            embeddings = [None] * len(batch)
+
+        rows = []
+        with self.cond:
+            for (user_id, _, text_hash, _, seq), emb in zip(batch, embeddings):
+                self.claimed.discard(seq)
+                entry = self.pending.get(user_id)
+                # A newer save arrived while this batch was embedding: let it win
+                if entry is None or entry[3] != seq:
+                    continue
+                del self.pending[user_id]
+                if emb:
+                    rows.append({"user_id": user_id, "embedding": emb, "embedding_hash": text_hash})
+            self.batches += 1
+
+        if not rows:
+            return
+        try:
+            self.write(rows)
+            with self.cond:
+                self.written += len(rows)
+        except Exception as e:
+            logger.error("Error writing back %d embeddings: %s", len(rows), e)
+
+    def flush(self, timeout=30.0):
+        """
+        Embeds everything pending now, ignoring the debounce, and waits for the
+        write-back. For scripts and tests; returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.cond:
+                while self.in_flight and time.monotonic() < deadline:
+                    self.cond.wait(max(0.0, deadline - time.monotonic()))
+                if self.in_flight:
+                    return False
+                batch = self._take_due(time.monotonic(), force=True)
+                if not batch:
+                    return True
+                self.in_flight += 1
+            try:
+                self._process(batch)
+            finally:
+                with self.cond:
+                    self.in_flight -= 1
+                    self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "pending": len(self.pending),
+                "batches": self.batches,
+                "written": self.written,
+                "coalesced": self.coalesced,
+            }
+
+
+def write_embeddings(rows):
+    """
+    One upsert for a batch of {user_id, embedding, embedding_hash} rows.
+    """
+    supabase = get_supabase()
+    supabase.table("users").upsert(rows, on_conflict="user_id").execute()
+    for row in rows:
+        profile_context_cache.set_embedding_hash(row["user_id"], row["embedding_hash"])
+        notify_user_changed(row["user_id"])
+        match_cache.invalidate(row["user_id"])
+
+
+embedding_queue = EmbeddingQueue()
+
+
+def enqueue_embedding(user_id: str, text: str, text_hash: str):
+    """
+    Schedules the user's embedding from text. With EMBEDDING_QUEUE_ENABLED=0
+    it is generated and written before returning, as before the queue.
+    """
+    if EMBEDDING_QUEUE_ENABLED:
+        embedding_queue.submit(user_id, text, text_hash)
+        return
+    emb = generate_embeddings([text])[0]
+    if emb:
+        write_embeddings([{"user_id": user_id, "embedding": emb, "embedding_hash": text_hash}])
@@ -0,0 +1,222 @@
+import os
+import sys
+import copy
+import json
+import queue
+import random
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---------------------------
+# Logging
+# ---------------------------
+#
+# Every app.* logger goes through one QueueHandler: the request thread only
+# filters the record and puts it on a bounded queue, and a listener thread
+# formats and writes it. When the queue is full the record is dropped and
+# counted rather than blocking the request.
+#
+# DEBUG/INFO records are sampled at LOG_SAMPLE_RATE (warnings and errors are
+# always kept). Per-request debug detail stays off unless LOG_LEVEL=DEBUG or
+# the record's user (extra={"user_id": ...}, or the request's user set with
+# log_user()) is one of LOG_DEBUG_USER_IDS; those records skip sampling.
+
+LOG_LEVEL = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+if not isinstance(LOG_LEVEL, int):
+    LOG_LEVEL = logging.INFO
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_DEBUG_USER_IDS = {u.strip() for u in os.environ.get("LOG_DEBUG_USER_IDS", "").split(",") if u.strip()}
+
+# The user the current request is for; copied into worker threads by
+# asyncio.to_thread
+current_user = contextvars.ContextVar("log_user_id", default=None)
+
+# LogRecord attributes that are not extra= fields
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS and key != "sample_rate" and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestFilter(logging.Filter):
+    """
+    Tags records with the request's user_id, keeps records below LOG_LEVEL
+    only for debug users and samples DEBUG/INFO. Runs on the caller's thread,
+    before anything is queued.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.sampled_out = 0
+
+    def filter(self, record):
+        user_id = getattr(record, "user_id", None) or current_user.get()
+        record.user_id = user_id
+        if user_id is not None and user_id in LOG_DEBUG_USER_IDS:
+            return True
+        if record.levelno < LOG_LEVEL:
+            return False
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = LOG_SAMPLE_RATE if record.levelno < logging.WARNING else 1.0
+        if rate < 1.0 and random.random() >= rate:
+            with self.lock:
+                self.sampled_out += 1
+            return False
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks: a full queue drops the record.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.lock_counts = threading.Lock()
+        self.queued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args and format the traceback now; the listener formats the rest
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock_counts:
+                self.dropped += 1
+            return
+        with self.lock_counts:
+            self.queued += 1
+
+
+def _build_output():
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "text":
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        output.setFormatter(JsonFormatter())
+    return output
+
+
+request_filter = RequestFilter()
+handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+handler.addFilter(request_filter)
+listener = QueueListener(handler.queue, _build_output())
+
+
+def _apply_level():
+    # Debug users need their DEBUG records created; RequestFilter drops
+    # everyone else's
+    logging.getLogger("app").setLevel(logging.DEBUG if LOG_DEBUG_USER_IDS else LOG_LEVEL)
+
+
+def _configure():
+    app_logger = logging.getLogger("app")
+    app_logger.addHandler(handler)
+    app_logger.propagate = False
+    _apply_level()
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork, and the old queue's lock may
+    # have been held when it happened: give the child its own of both
+    global listener
+    handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    listener = QueueListener(handler.queue, *listener.handlers)
+    listener.start()
+
+
+_configure()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+# ---------------------------
+# Helpers
+# ---------------------------
+
+def get_logger(name):
+    """
+    logger = get_logger(__name__) in app modules.
+    """
+    return logging.getLogger(name)
+
+
+@contextmanager
+def log_user(user_id):
+    """
+    with log_user(user_id): ... attributes the block's records to user_id.
+    """
+    token = current_user.set(user_id)
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+
+def debug_enabled(user_id=None):
+    """
+    Whether debug records for user_id (default: the current request's user)
+    would be written; guard expensive debug detail with it.
+    """
+    if LOG_LEVEL <= logging.DEBUG:
+        return True
+    return bool(LOG_DEBUG_USER_IDS) and (user_id or current_user.get()) in LOG_DEBUG_USER_IDS
+
+
+def set_debug_users(user_ids):
+    """
+    Replaces LOG_DEBUG_USER_IDS at runtime, e.g. from a shell while
+    troubleshooting one user.
+    """
+    global LOG_DEBUG_USER_IDS
+    LOG_DEBUG_USER_IDS = {u for u in user_ids if u}
+    _apply_level()
+
+
+def stats():
+    with handler.lock_counts:
+        return {
+            "queued": handler.queued,
+            "dropped": handler.dropped,
+            "sampled_out": request_filter.sampled_out,
+            "backlog": handler.queue.qsize(),
+            "debug_users": len(LOG_DEBUG_USER_IDS),
+        }
@@ -1,21 +1,49 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
+import httpx
 import json
 import uuid
+from typing import Literal
+import threading
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from app.tools.save_profile_section import save_profile_section, SaveProfileSectionRequest
-from app.tools.get_user_profile import get_user_profile
-from app.tools.trigger_matching import trigger_matching
-from app.tools.get_matches import get_matches
-from app.tools.sync_user import sync_user, SyncUserRequest
-from app.tools.threads import save_thread, get_user_threads, SaveThreadRequest
+from app.tools.save_profile_section import save_profile_section, save_profile_section_async, SaveProfileSectionRequest
+from app.tools.get_user_profile import get_user_profile, get_user_profile_async
+from app.tools.trigger_matching import trigger_matching, trigger_matching_async
+from app.tools.get_matches import get_matches, get_matches_async
+from app.tools.sync_user import sync_user, sync_user_async, SyncUserRequest
+from app.tools.threads import save_thread, get_user_threads, save_thread_async, get_user_threads_async, SaveThreadRequest
+from app.candidate_store import load_candidate_store
+from app.embedding_cache import embedding_cache
+from app.embedding_queue import embedding_queue
+from app.match_cache import match_cache
+from app.profile_context import bootstrap_profile_context, bootstrap_profile_context_async
+from app.metrics import METRICS_ENABLED, MetricsMiddleware, external, render_metrics
+from app.log import get_logger, stats as log_stats
+
+logger = get_logger(__name__)
 
 load_dotenv()
 
-app = FastAPI()
+# "1" serves the API from async routes on async Supabase/OpenAI clients with
+# bounded connection pools; "0" keeps the threadpool-backed sync routes.
+ASYNC_MODE = os.environ.get("ASYNC_MODE", "0") == "1"
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "20"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the candidate store without delaying startup; matching falls back
+    # to a direct users fetch until it is ready.
+    threading.Thread(target=load_candidate_store, daemon=True).start()
+    yield
+    # Don't drop embeddings still waiting out their debounce
+    embedding_queue.flush()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -30,25 +58,109 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency histograms (METRICS_ENABLED=1), served at /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    http_client=httpx.AsyncClient(limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+    )),
+) if ASYNC_MODE else None
 CHATKIT_WORKFLOW_ID = os.environ.get("CHATKIT_WORKFLOW_ID")
 
 class SessionRequest(BaseModel):
     user_id: str | None = None
 
-@app.post("/api/users/sync")
+def build_session_payload(user_id: str, profile, known_user: bool):
+    """
+    ChatKit session arguments, with the user's profile context fields (if
+    any) injected as the user_profile_context state variable.
+    """
+    profile_context = "{}"
+    if known_user:
+        if profile:
+            profile_context = json.dumps(profile)
+            # The profile is personal data: debug users only
+            logger.debug("Injected profile context: %s", profile_context[:100], extra={"user_id": user_id})
+        else:
+            logger.debug("No profile found, injecting empty context", extra={"user_id": user_id})
+
+    return {
+        "workflow": {
+            "id": CHATKIT_WORKFLOW_ID,
+            "state_variables": {
+                "user_profile_context": profile_context
+            }
+        },
+        "user": user_id
+    }
+
+def chatkit_sessions(openai_client):
+    # Handle beta namespace if necessary
+    if hasattr(openai_client, 'beta') and hasattr(openai_client.beta, 'chatkit'):
+        return openai_client.beta.chatkit.sessions
+    return openai_client.chatkit.sessions
+
+@app.get("/")
+def read_root():
+    return {"message": "Coffee Backend is running"}
+
+@app.get("/api/stats/embedding_cache")
+def api_embedding_cache_stats():
+    return embedding_cache.stats()
+
+@app.get("/api/stats/embedding_queue")
+def api_embedding_queue_stats():
+    return embedding_queue.stats()
+
+@app.get("/api/stats/match_cache")
+def api_match_cache_stats():
+    return match_cache.stats()
+
+@app.get("/api/stats/logging")
+def api_logging_stats():
+    return log_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def api_metrics():
+    """
+    Prometheus text format: latency histograms plus the cache and queue counters.
+    """
+    gauges = {}
+    for prefix, stats in (
+        ("coffee_embedding_cache", embedding_cache.stats()),
+        ("coffee_embedding_queue", embedding_queue.stats()),
+        ("coffee_match_cache", match_cache.stats()),
+        ("coffee_log", log_stats()),
+    ):
+        for name, value in stats.items():
+            if isinstance(value, (int, float)):
+                gauges[f"{prefix}_{name}"] = value
+    return PlainTextResponse(render_metrics(gauges), media_type="text/plain; version=0.0.4")
+
+# ---------------------------
+# Sync routes (ASYNC_MODE=0)
+# ---------------------------
+
+sync_router = APIRouter()
+
+@sync_router.post("/api/users/sync")
 def api_sync_user(request: SyncUserRequest):
     return sync_user(request.user_id, request.email, request.phone)
 
-@app.post("/api/threads")
+@sync_router.post("/api/threads")
 def api_save_thread(request: SaveThreadRequest):
     return save_thread(request.user_id, request.thread_id, request.title)
 
-@app.get("/api/threads/{user_id}")
+@sync_router.get("/api/threads/{user_id}")
 def api_get_threads(user_id: str):
     return get_user_threads(user_id)
 
-@app.post("/api/chatkit/session")
+@sync_router.post("/api/chatkit/session")
 def create_chatkit_session(request: SessionRequest):
     if not CHATKIT_WORKFLOW_ID:
         raise HTTPException(status_code=500, detail="CHATKIT_WORKFLOW_ID not configured")
@@ -56,57 +168,86 @@ def create_chatkit_session(request: SessionRequest):
     try:
         user_id = request.user_id or f"user_{uuid.uuid4().hex[:16]}"
         
-        # Ensure user exists if we have a real ID
-        if request.user_id:
-            sync_user(request.user_id)
-
-        # Fetch user profile to inject as context
-        profile_context = "{}"
-        if request.user_id:
-            profile_res = get_user_profile(request.user_id)
-            if profile_res.get("status") == "success" and profile_res.get("profile"):
-                profile_context = json.dumps(profile_res.get("profile"))
-                print(f"✅ Injected profile context for {request.user_id}: {profile_context[:100]}...")
-            else:
-                print(f"⚠️ No profile found for {request.user_id}, injecting empty context.")
-
-        session_payload = {
-            "workflow": {
-                "id": CHATKIT_WORKFLOW_ID,
-                "state_variables": {
-                    "user_profile_context": profile_context
-                }
-            },
-            "user": user_id
-        }
-        
-        # Handle beta namespace if necessary
-        if hasattr(client, 'beta') and hasattr(client.beta, 'chatkit'):
-            session = client.beta.chatkit.sessions.create(**session_payload)
-        else:
-            session = client.chatkit.sessions.create(**session_payload)
+        # Ensure user exists and fetch the profile context in one round trip
+        # (or none, when cached)
+        profile = bootstrap_profile_context(request.user_id) if request.user_id else None
+        session_payload = build_session_payload(user_id, profile, bool(request.user_id))
+
+        with external("openai", "chatkit.sessions"):
+            session = chatkit_sessions(client).create(**session_payload)
         
         return {"client_secret": session.client_secret, "user_id": user_id}
     except Exception as e:
-        print(f"Error creating session: {e}")
+        logger.error("Error creating session: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/")
-def read_root():
-    return {"message": "Coffee Backend is running"}
-
-@app.post("/api/tools/save_profile_section")
+@sync_router.post("/api/tools/save_profile_section")
 def tool_save_profile_section(request: SaveProfileSectionRequest):
     return save_profile_section(request.user_id, request.attributes.dict())
 
-@app.get("/api/tools/get_user_profile/{user_id}")
-def tool_get_user_profile(user_id: str):
-    return get_user_profile(user_id)
+@sync_router.get("/api/tools/get_user_profile/{user_id}")
+def tool_get_user_profile(user_id: str, fields: Literal["context", "matching", "full"] = "context"):
+    return get_user_profile(user_id, fields)
 
-@app.post("/api/tools/trigger_matching/{user_id}")
+@sync_router.post("/api/tools/trigger_matching/{user_id}")
 def tool_trigger_matching(user_id: str):
     return trigger_matching(user_id)
 
-@app.get("/api/tools/get_matches/{user_id}")
+@sync_router.get("/api/tools/get_matches/{user_id}")
 def tool_get_matches(user_id: str, limit: int = 10):
     return get_matches(user_id, limit)
+
+# ---------------------------
+# Async routes (ASYNC_MODE=1)
+# ---------------------------
+
+async_router = APIRouter()
+
+@async_router.post("/api/users/sync")
+async def api_sync_user_async(request: SyncUserRequest):
+    return await sync_user_async(request.user_id, request.email, request.phone)
+
+@async_router.post("/api/threads")
+async def api_save_thread_async(request: SaveThreadRequest):
+    return await save_thread_async(request.user_id, request.thread_id, request.title)
+
+@async_router.get("/api/threads/{user_id}")
+async def api_get_threads_async(user_id: str):
+    return await get_user_threads_async(user_id)
+
+@async_router.post("/api/chatkit/session")
+async def create_chatkit_session_async(request: SessionRequest):
+    if not CHATKIT_WORKFLOW_ID:
+        raise HTTPException(status_code=500, detail="CHATKIT_WORKFLOW_ID not configured")
+
+    try:
+        user_id = request.user_id or f"user_{uuid.uuid4().hex[:16]}"
+
+        profile = await bootstrap_profile_context_async(request.user_id) if request.user_id else None
+        session_payload = build_session_payload(user_id, profile, bool(request.user_id))
+
+        with external("openai", "chatkit.sessions"):
+            session = await chatkit_sessions(async_client).create(**session_payload)
+
+        return {"client_secret": session.client_secret, "user_id": user_id}
+    except Exception as e:
+        logger.error("Error creating session: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@async_router.post("/api/tools/save_profile_section")
+async def tool_save_profile_section_async(request: SaveProfileSectionRequest):
+    return await save_profile_section_async(request.user_id, request.attributes.dict())
+
+@async_router.get("/api/tools/get_user_profile/{user_id}")
+async def tool_get_user_profile_async(user_id: str, fields: Literal["context", "matching", "full"] = "context"):
+    return await get_user_profile_async(user_id, fields)
+
+@async_router.post("/api/tools/trigger_matching/{user_id}")
+async def tool_trigger_matching_async(user_id: str):
+    return await trigger_matching_async(user_id)
+
+@async_router.get("/api/tools/get_matches/{user_id}")
+async def tool_get_matches_async(user_id: str, limit: int = 10):
+    return await get_matches_async(user_id, limit)
+
+app.include_router(async_router if ASYNC_MODE else sync_router)
@@ -0,0 +1,376 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app.db.client import get_supabase
+from app.candidate_store import get_candidate_store
+from app.matching_engine import compute_matches_for_user
+from app.match_invalidation import bucket_cutoffs, affected_users
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# ---------------------------
+# Materialized Match Results
+# ---------------------------
+#
+# get_matches serves a user's last computed flat_matches instead of scoring
+# the whole pool on every call. Lookups go to an in-process LRU first, then
+# the matches table. An LRU entry records the user's own updated_at and is
+# fresh while it is unchanged and no change to another candidate has been
+# found to affect it (see app.match_invalidation); without a candidate store,
+# entries are fresh for MATCH_CACHE_TTL_SECONDS. The tools that write a user's
+# own row drop that user's entry either way (invalidate). Stale entries (and matches
+# table rows, which carry no version) are served as-is while a background
+# recompute replaces them. Finding the entries a change affects also runs in
+# the background: a lookup only compares the store's version with the last
+# one propagated.
+
+MATCH_CACHE_SIZE = int(os.environ.get("MATCH_CACHE_SIZE", "10000"))
+MATCH_CACHE_TTL_SECONDS = float(os.environ.get("MATCH_CACHE_TTL_SECONDS", "300"))
+MATCH_CACHE_STALE_WHILE_REVALIDATE = os.environ.get("MATCH_CACHE_STALE_WHILE_REVALIDATE", "1") == "1"
+
+MATCH_DISPLAY_COLUMNS = "user_id,name,age,city,tagline"
+# Pool version of entries that are stale, e.g. matches table rows
+UNVERSIONED = -1
+
+
+def current_versions(user_id: str):
+    """
+    (the user's updated_at, candidate pool version) from the candidate store,
+    or (None, None) when it is disabled or not loaded yet.
+    """
+    store = get_candidate_store()
+    if not store:
+        return None, None
+    return store.versions(user_id)
+
+
+class MatchCache:
+    def __init__(self, size=MATCH_CACHE_SIZE, ttl=MATCH_CACHE_TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        # user_id -> (flat_matches, user_version, pool_version, computed_at, bucket cutoffs)
+        self.entries = OrderedDict()
+        # user_id -> when their own row last changed, so a result computed
+        # before that is not stored (at most size users)
+        self.changed_at = OrderedDict()
+        # match_user_id -> users whose entry contains it
+        self.holders = {}
+        self.lock = threading.Lock()
+        # Candidate store version up to which changes have been propagated,
+        # and the one the running propagation is taking it to
+        self.propagated = 0
+        self.propagating = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.table_hits = 0
+        self.misses = 0
+        self.requeued = 0
+
+    def _fresh(self, entry, versions):
+        _, user_version, pool_version, computed_at, _ = entry
+        if pool_version == UNVERSIONED:
+            return False
+        if versions[1] is None or pool_version is None:
+            return time.monotonic() - computed_at <= self.ttl
+        return user_version == versions[0]
+
+    def lookup(self, user_id, versions):
+        """
+        (flat_matches or None, whether they are fresh for versions).
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None, False
+            self.entries.move_to_end(user_id)
+            fresh = self._fresh(entry, versions)
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return entry[0], fresh
+
+    def _unlink(self, user_id, entry):
+        for m in entry[0]:
+            users = self.holders.get(m["match_user_id"])
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self.holders[m["match_user_id"]]
+
+    def put(self, user_id, flat_matches, versions, cutoffs=None, started=None):
+        """
+        started is when the result's computation began (time.monotonic());
+        a result started before the user's last invalidate is dropped.
+        """
+        if self.size <= 0:
+            return
+        with self.lock:
+            if started is not None and user_id in self.changed_at:
+                if started < self.changed_at[user_id]:
+                    return
+                del self.changed_at[user_id]
+            old = self.entries.pop(user_id, None)
+            if old is not None:
+                self._unlink(user_id, old)
+            self.entries[user_id] = (flat_matches, versions[0], versions[1], time.monotonic(), cutoffs)
+            for m in flat_matches:
+                self.holders.setdefault(m["match_user_id"], set()).add(user_id)
+            while len(self.entries) > self.size:
+                self._unlink(*self.entries.popitem(last=False))
+
+    def mark_stale(self, user_ids=None):
+        """
+        Marks the users' entries (all entries when None) stale. Returns the
+        users that had one.
+        """
+        with self.lock:
+            marked = []
+            for user_id in list(self.entries) if user_ids is None else user_ids:
+                entry = self.entries.get(user_id)
+                if entry is not None:
+                    self.entries[user_id] = (entry[0], entry[1], UNVERSIONED, entry[3], entry[4])
+                    marked.append(user_id)
+            return marked
+
+    def invalidate(self, user_id):
+        """
+        Drops the user's entry after their own row changed. Works without
+        the candidate store, unlike the version check in _fresh.
+        """
+        with self.lock:
+            entry = self.entries.pop(user_id, None)
+            if entry is not None:
+                self._unlink(user_id, entry)
+            self.changed_at[user_id] = time.monotonic()
+            self.changed_at.move_to_end(user_id)
+            while len(self.changed_at) > self.size:
+                self.changed_at.popitem(last=False)
+
+    def count(self, name, n=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "table_hits": self.table_hits,
+                "misses": self.misses,
+                "requeued": self.requeued,
+            }
+
+
+match_cache = MatchCache()
+
+_revalidate_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="match-cache")
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+_propagate_lock = threading.Lock()
+_propagate_pending = threading.Event()
+
+
+def read_stored_matches(user_id: str):
+    """
+    The user's rows from the matches table as engine-style flat matches,
+    best score first, or None if there are none.
+    """
+    supabase = get_supabase()
+    res = (
+        supabase.table("matches")
+        .select("match_user_id,score,overlap_interests")
+        .eq("user_id", user_id)
+        .order("score", desc=True)
+        .execute()
+    )
+    rows = res.data or []
+    if not rows:
+        return None
+
+    ids = [r["match_user_id"] for r in rows]
+    store = get_candidate_store()
+    if store:
+        people = store.display_rows(ids)
+    else:
+        people_res = supabase.table("users").select(MATCH_DISPLAY_COLUMNS).in_("user_id", ids).execute()
+        people = {p["user_id"]: p for p in people_res.data or []}
+
+    flat_matches = []
+    for r in rows:
+        person = people.get(r["match_user_id"]) or {}
+        flat_matches.append({
+            "match_user_id": r["match_user_id"],
+            "name": person.get("name"),
+            "age": person.get("age"),
+            "city": person.get("city"),
+            "tagline": person.get("tagline"),
+            "score": r.get("score") or 0.0,
+            "overlap_interests": r.get("overlap_interests") or [],
+        })
+    return flat_matches
+
+
+def _entries_to_check(user_ids=None):
+    # user_id -> cutoffs of fresh entries, and the holders index
+    with match_cache.lock:
+        ids = match_cache.entries if user_ids is None else user_ids
+        entries = {
+            uid: match_cache.entries[uid][4] for uid in ids
+            if uid in match_cache.entries and match_cache.entries[uid][2] != UNVERSIONED
+        }
+        holders = {mid: set(users) for mid, users in match_cache.holders.items()}
+    return entries, holders
+
+
+def propagate_changes():
+    """
+    Finds the cached users affected by candidate store changes since the
+    last call, marks them stale and requeues them for recomputation.
+    """
+    store = get_candidate_store()
+    if not store:
+        return
+    with _propagate_lock:
+        changed, version = store.changes_since(match_cache.propagated)
+        # Set before the entries are read: a result stored after that
+        # checks itself (see recompute_matches)
+        match_cache.propagating = version
+        if changed is not None and not changed:
+            match_cache.propagated = version
+            return
+        if changed is None:
+            # The log does not reach back far enough (e.g. a full reload)
+            match_cache.mark_stale()
+            match_cache.propagated = version
+            return
+        entries, holders = _entries_to_check()
+        affected = affected_users(store, changed, entries, holders)
+        match_cache.propagated = version
+
+    for user_id in match_cache.mark_stale(affected):
+        match_cache.count("requeued")
+        schedule_revalidate(user_id)
+
+
+def _propagate():
+    try:
+        propagate_changes()
+    except Exception as e:
+        logger.error("Error propagating match changes: %s", e)
+    finally:
+        _propagate_pending.clear()
+
+
+def schedule_propagate():
+    """
+    Queues propagate_changes on the revalidation pool when the candidate
+    store has changed since the last propagation, once at a time.
+    """
+    store = get_candidate_store()
+    if not store or store.version <= match_cache.propagating:
+        return
+    with _revalidating_lock:
+        if _propagate_pending.is_set():
+            return
+        _propagate_pending.set()
+    _revalidate_pool.submit(_propagate)
+
+
+def _check_missed(store, user_id, since):
+    # Changes propagated while user_id was being recomputed did not see its new entry
+    try:
+        changed, _ = store.changes_since(since)
+        if changed is None:
+            match_cache.mark_stale([user_id])
+            return
+        entries, holders = _entries_to_check([user_id])
+        if entries and affected_users(store, changed, entries, holders):
+            match_cache.mark_stale([user_id])
+    except Exception as e:
+        logger.error("Error checking missed match changes: %s", e)
+
+
+def recompute_matches(user_id: str):
+    """
+    Scores the user against the pool, stores flat_matches in the cache and
+    returns the engine result. The matches table is left to trigger_matching
+    and scripts/match_all_users.py.
+    """
+    # Read before scoring, so a change that lands mid-compute leaves the entry stale
+    started = time.monotonic()
+    versions = current_versions(user_id)
+    result = compute_matches_for_user(user_id)
+    if result.get("status") != "success":
+        return result
+
+    flat_matches = result["flat_matches"]
+    store = get_candidate_store()
+    if store and versions[1] is not None:
+        slots = store.slots([m["match_user_id"] for m in flat_matches])
+        match_cache.put(user_id, flat_matches, versions, bucket_cutoffs(flat_matches, slots), started=started)
+        if versions[1] < match_cache.propagating:
+            _revalidate_pool.submit(_check_missed, store, user_id, versions[1])
+    else:
+        match_cache.put(user_id, flat_matches, versions, started=started)
+    return result
+
+
+def _revalidate(user_id: str):
+    try:
+        recompute_matches(user_id)
+    except Exception as e:
+        logger.error("Error revalidating matches: %s", e)
+    finally:
+        with _revalidating_lock:
+            _revalidating.discard(user_id)
+
+
+def schedule_revalidate(user_id: str):
+    """
+    Recomputes the user's matches in the background, once at a time per user.
+    """
+    with _revalidating_lock:
+        if user_id in _revalidating:
+            return
+        _revalidating.add(user_id)
+    _revalidate_pool.submit(_revalidate, user_id)
+
+
+def cached_matches(user_id: str):
+    """
+    {"status": "success", "flat_matches": [...], "source": ...} where source
+    is "cache" (fresh), "stale" (LRU entry being revalidated), "table"
+    (matches table rows being revalidated) or "computed". Returns the
+    engine's error result if it had to compute and failed.
+    """
+    schedule_propagate()
+    versions = current_versions(user_id)
+    flat_matches, fresh = match_cache.lookup(user_id, versions)
+    if flat_matches is not None:
+        if fresh:
+            return {"status": "success", "flat_matches": flat_matches, "source": "cache"}
+        if MATCH_CACHE_STALE_WHILE_REVALIDATE:
+            schedule_revalidate(user_id)
+            return {"status": "success", "flat_matches": flat_matches, "source": "stale"}
+    elif MATCH_CACHE_STALE_WHILE_REVALIDATE:
+        try:
+            flat_matches = read_stored_matches(user_id)
+        except Exception as e:
+            logger.error("Error reading stored matches: %s", e)
+            flat_matches = None
+        if flat_matches is not None:
+            match_cache.count("table_hits")
+            match_cache.put(user_id, flat_matches, (None, UNVERSIONED))
+            schedule_revalidate(user_id)
+            return {"status": "success", "flat_matches": flat_matches, "source": "table"}
+
+    match_cache.count("misses")
+    result = recompute_matches(user_id)
+    if result.get("status") != "success":
+        return result
+    return {"status": "success", "flat_matches": result["flat_matches"], "source": "computed"}
@@ -0,0 +1,93 @@
+import numpy as np
+from app.candidate_matrix import score_candidates
+from app.matching_engine import CATEGORY_SIZE
+
+# ---------------------------
+# Match Change Propagation
+# ---------------------------
+#
+# When user X changes, a cached result for user U can only be wrong if X is
+# already in it (X's scores moved, or X now hits U's dealbreakers) or X now
+# scores high enough to enter one of U's category buckets. Every category
+# score is symmetric, so one scoring pass with X as the "user" gives X's score
+# in every U's eyes, and comparing it with each bucket's cutoff finds the
+# users X would newly rank for. Only those users are recomputed.
+
+# Category buckets in classify_matches, in the order cutoffs are stored
+BUCKET_KEYS = ("location_score", "interest_score", "activity_score", "personality_score", "semantic_score")
+
+# A bucket that is not full admits anyone
+OPEN_CUTOFF = (-np.inf, np.iinfo(np.int64).max)
+
+
+def bucket_cutoffs(flat_matches, slots):
+    """
+    (score, slot) of the last member of each category bucket, in BUCKET_KEYS
+    order. Buckets are the top CATEGORY_SIZE of flat_matches with ties in
+    slot order, as score_matrix ranks them. slots maps user_id -> store slot.
+    """
+    missing = OPEN_CUTOFF[1]
+    cutoffs = []
+    for key in BUCKET_KEYS:
+        ranked = sorted(
+            (-float(m.get(key) or 0.0), slots.get(m["match_user_id"], missing)) for m in flat_matches
+        )
+        if len(ranked) < CATEGORY_SIZE:
+            cutoffs.append(OPEN_CUTOFF)
+        else:
+            score, slot = ranked[CATEGORY_SIZE - 1]
+            cutoffs.append((-score, slot))
+    return cutoffs
+
+
+def changed_user_scores(matrix, slot, rows):
+    """
+    Every category score between the user in slot and the given sorted rows.
+    """
+    profile = matrix.rows[slot]
+    scores = score_candidates(matrix, profile, matrix.embeddings[slot], rows)
+    if not matrix.has_embedding[slot]:
+        # Nobody scores an unparsable embedding above 0.0
+        scores["semantic_score"] = np.zeros(len(rows), dtype=np.float64)
+    return scores
+
+
+def affected_users(store, changed_ids, entries, holders):
+    """
+    The cached users whose results changed_ids can alter. entries maps
+    user_id -> bucket cutoffs (None when unknown) and holders maps a
+    match_user_id -> users whose cached result contains it.
+    """
+    affected = set()
+    for user_id in changed_ids:
+        affected |= holders.get(user_id, set())
+
+    matrix = store.matrix()
+    slots = store.slots(list(entries) + list(changed_ids))
+
+    def held(uid):
+        # Slots newer than the matrix (changed again since) are not in it
+        slot = slots.get(uid)
+        return slot is not None and slot < len(matrix) and matrix.alive[slot]
+
+    checked = [uid for uid, cutoffs in entries.items() if cutoffs is not None and held(uid)]
+    if not checked:
+        return affected
+    user_slots = np.array([slots[uid] for uid in checked], dtype=np.int64)
+    # Only the cached users' rows are scored
+    rows, position = np.unique(user_slots, return_inverse=True)
+    cutoffs = np.array([entries[uid] for uid in checked], dtype=np.float64)
+    cut_scores, cut_slots = cutoffs[:, :, 0], cutoffs[:, :, 1]
+
+    for user_id in changed_ids:
+        if not held(user_id):
+            # Dropped: only the holders are affected. Changed again since the
+            # matrix: a later propagation checks the newer row.
+            continue
+        slot = slots[user_id]
+        scores = changed_user_scores(matrix, slot, rows)
+        seen = np.stack([scores[key][position] for key in BUCKET_KEYS], axis=1)
+        enters = (seen > cut_scores) | ((seen == cut_scores) & (slot < cut_slots))
+        hit = enters.any(axis=1) & (user_slots != slot)
+        affected.update(checked[i] for i in np.flatnonzero(hit))
+    return affected
@@ -3,6 +3,22 @@ import os
 import json
 from app.db.client import get_supabase
 from app.tools.get_user_profile import get_user_profile
+from app.profile_fields import EMBEDDING_DIM, CANDIDATE_COLUMNS, parse_embedding, parse_list_field, normalize_location
+from app.candidate_matrix import CandidateMatrix, score_candidates, composite_scores
+from app.ann_index import ANN_INDEX, build_index, ExactIndex
+from app.candidate_store import get_candidate_store
+from app.metrics import span
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# "batch" scores all candidates with array ops, "loop" is the original per-candidate path,
+# "rpc" ranks in Postgres through compute_user_matches
+MATCHING_ENGINE_MODE = os.environ.get("MATCHING_ENGINE_MODE", "batch")
+# "1" scores only candidates in the user's own city (with the candidate store),
+# topped up from a global ANN pass when fewer than LOCATION_MIN_POOL live there
+LOCATION_PARTITIONING = os.environ.get("LOCATION_PARTITIONING", "0") == "1"
+LOCATION_MIN_POOL = int(os.environ.get("LOCATION_MIN_POOL", "200"))
 
 # ---------------------------
 # Helper Functions
@@ -19,34 +35,6 @@ def jaccard(a, b):
     return len(inter) / len(union)
 
 
-def parse_embedding(emb):
-    if emb is None:
-        return []
-    if isinstance(emb, str):
-        try:
-            return json.loads(emb)
-        except:
-            return []
-    return emb
-
-def parse_list_field(x):
-    if x is None:
-        return []
-    if isinstance(x, list):
-        return x
-    if isinstance(x, str):
-        try:
-            return json.loads(x)
-        except:
-            # Fallback: comma separated
-            return [s.strip() for s in x.split(",") if s.strip()]
-    return []
-
-def normalize_location(loc):
-    if not loc:
-        return ""
-    return str(loc).strip().lower()
-
 def cosine_similarity(a, b):
     # Parse if strings
     a = parse_embedding(a)
@@ -99,61 +87,38 @@ def conflict_with_dealbreakers(user_dealbreakers, candidate):
 
 
 # ---------------------------
-# Main Matching Engine
+# Candidate Scoring
 # ---------------------------
 
-def compute_matches_for_user(user_id: str):
-    """
-    Returns both:
-    - Classified match groups
-    - A unified flat match list
-    """
-    supabase = get_supabase()
-
-    # -----------------------------------
-    # 1. Get user profile
-    # -----------------------------------
-    user_profile_res = get_user_profile(user_id)
-    if user_profile_res.get("status") != "success":
-        return {"status": "error", "message": "User profile not found"}
-
-    profile = user_profile_res["profile"]
-    if not profile:
-        return {"status": "error", "message": "User profile is empty"}
+SCORE_KEYS = ("semantic_score", "interest_score", "activity_score", "personality_score", "location_score", "score")
+# Matches kept per category bucket
+CATEGORY_SIZE = 5
 
-    if isinstance(profile, str):
-        try:
-            profile = json.loads(profile)
-        except:
-            return {"status": "error", "message": "User profile is corrupted"}
 
-    if not isinstance(profile, dict):
-        return {"status": "error", "message": "User profile format error"}
-
-    # -----------------------------------
-    # 2. Ensure embedding exists
-    # -----------------------------------
-    user_embedding = profile.get("embedding")
-    if not user_embedding:
-        # Fallback if no embedding is present
-        user_embedding = [0.0] * 1536
-
-    # -----------------------------------
-    # 3. Get candidate profiles
-    # -----------------------------------
-    # Fetch all other users
-    candidates_res = supabase.table("users").select("user_id,name,age,city,tagline,interests,looking_for,personality_traits,meeting_preferences,embedding").neq("user_id", user_id).execute()
-    candidates = candidates_res.data
+def build_match(candidate, interests, c_interests, scores):
+    return {
+        "match_user_id": candidate.get("user_id"),
+        "name": candidate.get("name"),
+        "age": candidate.get("age"),
+        "city": candidate.get("city"),
+        "tagline": candidate.get("tagline"),
+        "overlap_interests": list(set(interests) & set(c_interests or [])),
+        "semantic_score": scores["semantic_score"],
+        "interest_score": scores["interest_score"],
+        "activity_score": scores["activity_score"],
+        "personality_score": scores["personality_score"],
+        "location_score": scores["location_score"],
+        "score": scores["score"] # For backward compatibility with widget
+    }
 
-    matches = []
 
-    # -----------------------------------
-    # Intermediate values
-    # -----------------------------------
+def score_candidates_loop(profile, user_embedding, candidates):
+    """
+    Reference path: scores candidates one at a time.
+    """
     city = profile.get("city")
     interests = parse_list_field(profile.get("interests"))
     personality = parse_list_field(profile.get("personality_traits"))
-    looking_for = parse_list_field(profile.get("looking_for"))
     meeting_pref = profile.get("meeting_preferences") or ""
     dealbreakers = parse_list_field(profile.get("dealbreakers"))
 
@@ -161,20 +126,14 @@ def compute_matches_for_user(user_id: str):
     user_embedding = parse_embedding(user_embedding)
     user_vec = np.array(user_embedding, dtype=float)
 
-    # -----------------------------------
-    # 4. Evaluate each candidate
-    # -----------------------------------
+    matches = []
     for candidate in candidates:
-        c_id = candidate.get("user_id")
-        c_name = candidate.get("name")
-        c_age = candidate.get("age")
         c_city = candidate.get("city")
-        c_tagline = candidate.get("tagline")
         c_interests = parse_list_field(candidate.get("interests"))
         c_looking_for = parse_list_field(candidate.get("looking_for"))
         c_personality = parse_list_field(candidate.get("personality_traits"))
         c_meeting_pref = candidate.get("meeting_preferences")
-        c_embedding = candidate.get("embedding") or [0.0] * 1536 # Placeholder
+        c_embedding = candidate.get("embedding") or [0.0] * EMBEDDING_DIM # Placeholder
 
         # ----- Dealbreaker filter -----
         candidate_profile_check = {
@@ -202,29 +161,265 @@ def compute_matches_for_user(user_id: str):
             (personality_score * 0.2)
         )
 
-        matches.append({
-            "match_user_id": c_id,
-            "name": c_name,
-            "age": c_age,
-            "city": c_city,
-            "tagline": c_tagline,
-            "overlap_interests": list(set(interests) & set(c_interests or [])),
+        matches.append(build_match(candidate, interests, c_interests, {
             "semantic_score": semantic,
             "interest_score": interest_score,
             "activity_score": activity_score,
             "personality_score": personality_score,
             "location_score": location_score,
-            "score": composite_score # For backward compatibility with widget
-        })
+            "score": composite_score,
+        }))
+
+    return matches
+
+
+def score_candidates_batch(profile, user_embedding, candidates):
+    """
+    Scores all candidates at once on a CandidateMatrix: one matrix-vector
+    product for the semantic score and array ops for the rest.
+    Produces the same match dicts, in the same order, as score_candidates_loop.
+    """
+    return score_matrix(profile, user_embedding, CandidateMatrix(candidates))
+
+
+def top_positions(values, n=CATEGORY_SIZE):
+    """
+    Positions of the n highest values; ties keep their order, like top_n's
+    stable sort.
+    """
+    return np.argsort(-values, kind="stable")[:n]
 
+
+def bucket_positions(columns, n=CATEGORY_SIZE):
+    """
+    top_positions for several equally long score arrays at once: one
+    argpartition over the stacked (len(columns), N) array finds each
+    column's n-th highest value in O(N), and only the values above it plus
+    the first tied ones are sorted. Returns one position array per column.
+    """
+    stacked = np.stack(columns)
+    size = stacked.shape[1]
+    if size <= n:
+        return [top_positions(values, n) for values in stacked]
+    kth = np.take_along_axis(stacked, np.argpartition(stacked, size - n, axis=1)[:, size - n:size - n + 1], axis=1)
+    above = stacked > kth
+    tied = stacked == kth
+    positions = []
+    for values, over, ties in zip(stacked, above, tied):
+        picked = np.flatnonzero(over)
+        picked = np.concatenate([picked, np.flatnonzero(ties)[:n - len(picked)]])
+        positions.append(picked[np.argsort(-values[picked], kind="stable")])
+    return positions
+
+
+def score_matrix(profile, user_embedding, matrix, exclude=None, index=None, excluded=None, semantic_all=None,
+                 within=None):
+    """
+    Match dicts for the rows of an already built CandidateMatrix that can
+    reach a category's top CATEGORY_SIZE, in row order. classify_matches on
+    this list gives the same result as on every kept row.
+
+    exclude is a row index to skip (the requesting user's own slot) and
+    excluded the dealbreaker conflicts from a DealbreakerIndex, so those rows
+    are never scored. With an ANN index the overall_vibe rows come from
+    index.search and semantic scores are only computed for the surviving rows.
+    semantic_all passes in precomputed semantic scores for every matrix row.
+    within limits scoring to those sorted rows (see local_pool); the pool is
+    then scored exactly without the index, so nothing costs O(len(matrix)).
+    """
+    if within is not None:
+        index = None
+    with span("engine.filter"):
+        dealbreakers = parse_list_field(profile.get("dealbreakers"))
+        rows = matrix.candidate_rows(dealbreakers, excluded=excluded, exclude=exclude, within=within)
+    with span("engine.score"):
+        scores = score_candidates(matrix, profile, user_embedding, rows, semantic=index is None,
+                                  semantic_all=semantic_all)
+
+    # Every bucket's top CATEGORY_SIZE in one partial selection; match dicts
+    # are only built for their union
+    with span("engine.select"):
+        keys = ["location_score", "interest_score", "activity_score", "personality_score"]
+        if index is None:
+            keys.append("semantic_score")
+        survivors = set()
+        for positions in bucket_positions([scores[key] for key in keys]):
+            survivors.update(positions.tolist())
+        if index is not None:
+            keep = np.zeros(len(matrix), dtype=bool)
+            keep[rows] = True
+            vibe_rows = index.search(user_embedding, CATEGORY_SIZE, keep)
+            survivors.update(np.searchsorted(rows, vibe_rows).tolist())
+        positions = np.array(sorted(survivors), dtype=np.int64)
+        picked = rows[positions]
+
+    row_scores = {k: scores[k][positions] for k in SCORE_KEYS if scores[k] is not None}
+    if index is not None:
+        with span("engine.score"):
+            row_scores["semantic_score"] = matrix.semantic_scores(user_embedding, picked)
+            row_scores["score"] = composite_scores(
+                row_scores["interest_score"], row_scores["semantic_score"],
+                row_scores["location_score"], row_scores["personality_score"],
+            )
+
+    with span("engine.format"):
+        interests = parse_list_field(profile.get("interests"))
+        matches = []
+        for j, i in enumerate(picked):
+            candidate = matrix.rows[i]
+            c_interests = parse_list_field(candidate.get("interests"))
+            matches.append(build_match(candidate, interests, c_interests, {
+                k: float(v[j]) for k, v in row_scores.items()
+            }))
+
+    return matches
+
+
+def local_pool(matrix, index, local, user_embedding, own_slot=None, min_pool=LOCATION_MIN_POOL):
+    """
+    Sorted rows in the user's city (local, from the same store snapshot as
+    matrix). When fewer than min_pool users live there, the min_pool nearest
+    users by embedding anywhere (from the ANN index, or an exact scan) are
+    added.
+    """
+    local = local[local < len(matrix)]
+    if len(local) >= min_pool:
+        return local
+    # One extra for the user's own row, dropped afterwards
+    nearby = (index or ExactIndex(matrix)).search(user_embedding, min_pool + 1, matrix.alive)
+    nearby = nearby[nearby != own_slot][:min_pool]
+    return np.union1d(local, nearby)
+
+
+def compute_matches_rpc(user_id: str):
+    """
+    Server-side path: compute_user_matches (migrations/006) filters, scores
+    and picks the per-category top rows in Postgres, so only those rows cross
+    the wire. Returns None when it has nothing to offer (e.g. unknown user),
+    leaving the Python engine to answer.
+    """
+    supabase = get_supabase()
+    res = supabase.rpc("compute_user_matches", {
+        "p_user_id": user_id,
+        "p_per_category": CATEGORY_SIZE,
+    }).execute()
+    if not res.data:
+        return None
+
+    matches = []
+    for row in res.data:
+        matches.append(build_match(
+            {**row, "user_id": row.get("match_user_id")},
+            row.get("overlap_interests") or [],
+            row.get("overlap_interests") or [],
+            {k: float(row.get(k) or 0.0) for k in SCORE_KEYS},
+        ))
+    return classify_matches(matches)
+
+
+# ---------------------------
+# Main Matching Engine
+# ---------------------------
+
+def compute_matches_for_user(user_id: str, mode: str | None = None):
+    """
+    Returns both:
+    - Classified match groups
+    - A unified flat match list
+
+    mode overrides MATCHING_ENGINE_MODE ("batch", "loop" or "rpc"). "rpc"
+    falls back to "batch" if the database function fails or returns nothing.
+    """
+    supabase = get_supabase()
+    mode = mode or MATCHING_ENGINE_MODE
+
+    if mode == "rpc":
+        try:
+            result = compute_matches_rpc(user_id)
+            if result:
+                return result
+        except Exception as e:
+            logger.warning("Error in compute_user_matches, falling back to the Python engine: %s", e)
+        mode = "batch"
+
+    # -----------------------------------
+    # 1. Get user profile
+    # -----------------------------------
+    with span("engine.fetch"):
+        user_profile_res = get_user_profile(user_id, fields="matching")
+    if user_profile_res.get("status") != "success":
+        return {"status": "error", "message": "User profile not found"}
+
+    profile = user_profile_res["profile"]
+    if not profile:
+        return {"status": "error", "message": "User profile is empty"}
+
+    if isinstance(profile, str):
+        try:
+            profile = json.loads(profile)
+        except:
+            return {"status": "error", "message": "User profile is corrupted"}
+
+    if not isinstance(profile, dict):
+        return {"status": "error", "message": "User profile format error"}
+
+    # -----------------------------------
+    # 2. Ensure embedding exists
+    # -----------------------------------
+    user_embedding = profile.get("embedding")
+    if not user_embedding:
+        # Fallback if no embedding is present
+        user_embedding = [0.0] * EMBEDDING_DIM
+
+    # -----------------------------------
+    # 3/4. Get and evaluate candidate profiles
+    # -----------------------------------
+    store = get_candidate_store() if mode != "loop" else None
+    if store:
+        # Resident candidate pool, no users table download
+        dealbreakers = parse_list_field(profile.get("dealbreakers"))
+        city = profile.get("city") if LOCATION_PARTITIONING else None
+        with span("engine.fetch"):
+            matrix, own_slot, index, excluded, local = store.snapshot(user_id, dealbreakers, city)
+        within = None
+        if LOCATION_PARTITIONING:
+            with span("engine.filter"):
+                within = local_pool(matrix, index, local, user_embedding, own_slot)
+        matches = score_matrix(profile, user_embedding, matrix, exclude=own_slot, index=index, excluded=excluded,
+                               within=within)
+    else:
+        # Fetch all other users
+        with span("engine.fetch"):
+            candidates_res = supabase.table("users").select(CANDIDATE_COLUMNS).neq("user_id", user_id).execute()
+        candidates = candidates_res.data
+
+        if mode == "loop":
+            with span("engine.score"):
+                matches = score_candidates_loop(profile, user_embedding, candidates)
+        else:
+            # Decodes every candidate's embedding and list fields
+            with span("engine.parse"):
+                matrix = CandidateMatrix(candidates)
+            # pgvector: the database index needs no per-request build
+            index = build_index(matrix) if ANN_INDEX == "pgvector" else None
+            matches = score_matrix(profile, user_embedding, matrix, index=index)
+
+    with span("engine.select"):
+        result = classify_matches(matches)
+    logger.debug("Computed matches", extra={"user_id": user_id, "mode": mode, "scored": len(matches),
+                                            "matches": len(result["flat_matches"])})
+    return result
+
+
+def classify_matches(matches):
     # -----------------------------------
     # 5. Category-based diversification
     # -----------------------------------
-    location_based     = top_n(matches, "location_score", 5)
-    interest_based     = top_n(matches, "interest_score", 5)
-    activity_based     = top_n(matches, "activity_score", 5)
-    personality_based  = top_n(matches, "personality_score", 5)
-    overall_vibe       = top_n(matches, "semantic_score", 5)
+    location_based     = top_n(matches, "location_score", CATEGORY_SIZE)
+    interest_based     = top_n(matches, "interest_score", CATEGORY_SIZE)
+    activity_based     = top_n(matches, "activity_score", CATEGORY_SIZE)
+    personality_based  = top_n(matches, "personality_score", CATEGORY_SIZE)
+    overall_vibe       = top_n(matches, "semantic_score", CATEGORY_SIZE)
 
     # -----------------------------------
     # 6. Merge into unique flat list
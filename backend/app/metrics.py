@@ -0,0 +1,232 @@
+import os
+import time
+import bisect
+import inspect
+import threading
+from contextlib import nullcontext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---------------------------
+# Metrics
+# ---------------------------
+#
+# Latency histograms in process, exposed at GET /metrics in the Prometheus
+# text format:
+#   coffee_http_request_seconds    per route, from MetricsMiddleware
+#   coffee_span_seconds            named stages (engine.fetch, engine.score, ...)
+#   coffee_external_seconds        each Supabase query and OpenAI call
+#
+# With METRICS_ENABLED=0 (the default) span() hands back one shared no-op
+# context manager, the middleware is not installed and the database client is
+# not wrapped, so instrumented code pays a function call and nothing else.
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+
+# Upper bounds in seconds; +Inf is implied
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "coffee_http_request_seconds": "HTTP request latency by route",
+    "coffee_span_seconds": "Latency of named stages inside a request",
+    "coffee_external_seconds": "Latency of Supabase and OpenAI calls",
+}
+
+
+class Histogram:
+    def __init__(self, name, label_names):
+        self.name = name
+        self.label_names = label_names
+        self.series = {}     # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {HELP.get(self.name, self.name)}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            total = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), values[:-1]):
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {total}')
+            lines.append(f"{self.name}_sum{{{base}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {total}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+http_requests = Histogram("coffee_http_request_seconds", ("method", "route", "status"))
+spans = Histogram("coffee_span_seconds", ("span",))
+external_calls = Histogram("coffee_external_seconds", ("service", "operation"))
+
+_NOOP = nullcontext()
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(self.labels, time.perf_counter() - self.started)
+        return False
+
+
+def span(name):
+    """
+    with span("engine.score"): ... records the block's duration.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Timer(spans, (name,))
+
+
+def external(service, operation):
+    """
+    with external("openai", "embeddings"): ... around a call to another service.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Timer(external_calls, (service, operation))
+
+
+# ---------------------------
+# Supabase query timing
+# ---------------------------
+
+QUERY_VERBS = ("select", "insert", "upsert", "update", "delete")
+
+
+class InstrumentedQuery:
+    """
+    Wraps a query builder so execute() is timed as
+    coffee_external_seconds{service="supabase",operation="<table>.<verb>"}.
+    Every other builder call passes through and stays wrapped.
+    """
+
+    def __init__(self, inner, operation):
+        self._inner = inner
+        self._operation = operation
+
+    def __getattr__(self, attr):
+        value = getattr(self._inner, attr)
+        if attr == "execute":
+            return self._timed(value)
+        if not callable(value):
+            return value
+        operation = self._operation
+        if attr in QUERY_VERBS and "." not in operation:
+            operation = f"{operation}.{attr}"
+
+        def call(*args, **kwargs):
+            return InstrumentedQuery(value(*args, **kwargs), operation)
+        return call
+
+    def _timed(self, execute):
+        if inspect.iscoroutinefunction(execute):
+            async def timed_async():
+                with external("supabase", self._operation):
+                    return await execute()
+            return timed_async
+
+        def timed():
+            with external("supabase", self._operation):
+                return execute()
+        return timed
+
+
+class InstrumentedClient:
+    """
+    A Supabase (or local) client whose table() and rpc() queries are timed.
+    """
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    def table(self, name):
+        return InstrumentedQuery(self._inner.table(name), name)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, name, *args, **kwargs):
+        return InstrumentedQuery(self._inner.rpc(name, *args, **kwargs), f"rpc.{name}")
+
+    def __getattr__(self, attr):
+        return getattr(self._inner, attr)
+
+
+def instrument_client(client):
+    if not METRICS_ENABLED or client is None:
+        return client
+    return InstrumentedClient(client)
+
+
+# ---------------------------
+# HTTP middleware and exposition
+# ---------------------------
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every HTTP request's latency under its route
+    template (e.g. /api/threads/{user_id}), so path parameters don't explode
+    the series count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            http_requests.observe((scope["method"], template, str(status[0])), time.perf_counter() - started)
+
+
+def render_metrics(gauges=None):
+    """
+    Prometheus text exposition of the histograms plus gauges, a dict of
+    metric name -> value (e.g. the caches' stats() counters).
+    """
+    lines = []
+    for histogram in (http_requests, spans, external_calls):
+        lines.extend(histogram.render())
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
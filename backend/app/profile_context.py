@@ -0,0 +1,176 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app.db.client import get_supabase, get_async_supabase
+from app.profile_fields import PROFILE_CONTEXT_COLUMNS
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# ---------------------------
+# Session Profile Context
+# ---------------------------
+#
+# The profile injected into every ChatKit session as user_profile_context.
+# bootstrap_user (migrations/008) creates the users row if needed and returns
+# the context columns in one round trip; results are kept for
+# PROFILE_CONTEXT_TTL_SECONDS so page reloads skip the database entirely.
+# Past half the TTL an entry is still served, and refreshed in the background
+# while the ChatKit session is being created.
+
+PROFILE_CONTEXT_TTL_SECONDS = float(os.environ.get("PROFILE_CONTEXT_TTL_SECONDS", "60"))
+PROFILE_CONTEXT_CACHE_SIZE = int(os.environ.get("PROFILE_CONTEXT_CACHE_SIZE", "10000"))
+
+
+class ProfileContextCache:
+    def __init__(self, ttl=PROFILE_CONTEXT_TTL_SECONDS, size=PROFILE_CONTEXT_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        # user_id -> (expires_at, profile, embedding_hash stored with it if known)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        # Bumped by invalidate so a read that raced a profile write is not cached
+        self.generations = {}
+
+    def lookup(self, user_id):
+        """
+        (profile or None, whether it should be refreshed in the background).
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None, False
+            remaining = entry[0] - time.monotonic()
+            if remaining < 0:
+                del self.entries[user_id]
+                return None, False
+            self.entries.move_to_end(user_id)
+            refresh = remaining < self.ttl / 2 and user_id not in self.refreshing
+            if refresh:
+                self.refreshing.add(user_id)
+            return entry[1], refresh
+
+    def peek(self, user_id):
+        """
+        (profile, embedding_hash) without touching the refresh state, or
+        (None, None).
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None, None
+            return entry[1], entry[2]
+
+    def refreshed(self, user_id):
+        with self.lock:
+            self.refreshing.discard(user_id)
+
+    def generation(self, user_id):
+        with self.lock:
+            return self.generations.get(user_id, 0)
+
+    def put(self, user_id, profile, generation=None, embedding_hash=None):
+        if self.ttl <= 0 or self.size <= 0:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generations.get(user_id, 0):
+                return
+            self.entries[user_id] = (time.monotonic() + self.ttl, profile, embedding_hash)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def set_embedding_hash(self, user_id, embedding_hash):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                self.entries[user_id] = (entry[0], entry[1], embedding_hash)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+
+
+profile_context_cache = ProfileContextCache()
+
+_refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="profile-context")
+_refresh_tasks = set()
+
+
+def _bootstrap_fallback(supabase, user_id):
+    # Without migrations/008: insert-if-missing, then a slim select
+    supabase.table("users").upsert({"user_id": user_id}, on_conflict="user_id", ignore_duplicates=True).execute()
+    return supabase.table("users").select(PROFILE_CONTEXT_COLUMNS).eq("user_id", user_id).execute()
+
+
+def bootstrap_profile_context(user_id: str):
+    """
+    Ensures the users row exists and returns its context fields, from the
+    cache when fresh. Returns None if the database could not be reached.
+    """
+    profile, refresh = profile_context_cache.lookup(user_id)
+    if profile is None:
+        return refresh_profile_context(user_id)
+    if refresh:
+        _refresh_pool.submit(refresh_profile_context, user_id)
+    return profile
+
+
+def refresh_profile_context(user_id: str):
+    generation = profile_context_cache.generation(user_id)
+    try:
+        supabase = get_supabase()
+        try:
+            res = supabase.rpc("bootstrap_user", {"p_user_id": user_id}).execute()
+        except Exception as e:
+            logger.warning("Error in bootstrap_user, falling back to upsert + select: %s", e)
+            res = _bootstrap_fallback(supabase, user_id)
+        profile = res.data[0] if res.data else None
+    except Exception as e:
+        logger.error("Error bootstrapping profile context: %s", e)
+        return None
+    finally:
+        profile_context_cache.refreshed(user_id)
+    if profile is not None:
+        profile_context_cache.put(user_id, profile, generation)
+    return profile
+
+
+async def bootstrap_profile_context_async(user_id: str):
+    """
+    bootstrap_profile_context on the async Supabase client.
+    """
+    profile, refresh = profile_context_cache.lookup(user_id)
+    if profile is None:
+        return await refresh_profile_context_async(user_id)
+    if refresh:
+        task = asyncio.create_task(refresh_profile_context_async(user_id))
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+    return profile
+
+
+async def refresh_profile_context_async(user_id: str):
+    generation = profile_context_cache.generation(user_id)
+    try:
+        supabase = await get_async_supabase()
+        try:
+            res = await supabase.rpc("bootstrap_user", {"p_user_id": user_id}).execute()
+        except Exception as e:
+            logger.warning("Error in bootstrap_user, falling back to upsert + select: %s", e)
+            await supabase.table("users").upsert({"user_id": user_id}, on_conflict="user_id", ignore_duplicates=True).execute()
+            res = await supabase.table("users").select(PROFILE_CONTEXT_COLUMNS).eq("user_id", user_id).execute()
+        profile = res.data[0] if res.data else None
+    except Exception as e:
+        logger.error("Error bootstrapping profile context: %s", e)
+        return None
+    finally:
+        profile_context_cache.refreshed(user_id)
+    if profile is not None:
+        profile_context_cache.put(user_id, profile, generation)
+    return profile
@@ -0,0 +1,52 @@
+import json
+
+# Dimension of OpenAI text-embedding-3-small vectors stored in users.embedding
+EMBEDDING_DIM = 1536
+
+# Columns pulled for every match candidate
+CANDIDATE_COLUMNS = "user_id,name,age,city,tagline,interests,looking_for,personality_traits,meeting_preferences,embedding"
+
+# Profile fields the agent sees as user_profile_context (never the embedding)
+PROFILE_CONTEXT_COLUMNS = (
+    "user_id,name,age,age_range,city,area,gender,occupation,interests,"
+    "personality_traits,looking_for,meeting_preferences,dealbreakers,tagline"
+)
+
+# Column sets for get_user_profile; callers ask for the smallest that works.
+#   context  - what the agent reads, no embedding
+#   matching - the requesting side of compute_matches_for_user
+#   full     - every column
+PROFILE_FIELD_SETS = {
+    "context": PROFILE_CONTEXT_COLUMNS,
+    "matching": CANDIDATE_COLUMNS + ",dealbreakers",
+    "full": "*",
+}
+
+
+def parse_embedding(emb):
+    if emb is None:
+        return []
+    if isinstance(emb, str):
+        try:
+            return json.loads(emb)
+        except:
+            return []
+    return emb
+
+def parse_list_field(x):
+    if x is None:
+        return []
+    if isinstance(x, list):
+        return x
+    if isinstance(x, str):
+        try:
+            return json.loads(x)
+        except:
+            # Fallback: comma separated
+            return [s.strip() for s in x.split(",") if s.strip()]
+    return []
+
+def normalize_location(loc):
+    if not loc:
+        return ""
+    return str(loc).strip().lower()
@@ -0,0 +1,148 @@
+import uuid
+import numpy as np
+from app.profile_fields import EMBEDDING_DIM
+from app.tag_vocab import INTERESTS, TRAITS, LOOKING_FOR
+
+# ---------------------------
+# Synthetic Users
+# ---------------------------
+#
+# Reproducible users rows for seeding, benchmarks and bulk import runs. Users
+# belong to personas: each persona has an embedding centre and favourite tags,
+# so embeddings form clusters (ANN recall means something) and tag overlap
+# follows the same structure. Cities follow a long-tailed distribution, a few
+# big cities and many small towns, as the location partitioning expects.
+#
+# Users are generated in fixed blocks, each seeded by (seed, block), so user i
+# is the same whatever chunk size a caller reads with.
+
+NAMES = [
+    "Aarav", "Vihaan", "Aditya", "Sai", "Arjun", "Reyansh", "Muhammad", "Rohan", "Krishna", "Ishaan",
+    "Diya", "Saanvi", "Ananya", "Aadhya", "Pari", "Kiara", "Myra", "Riya", "Fatima", "Zara",
+    "Rahul", "Priya", "Amit", "Sneha", "Vikram", "Neha", "Suresh", "Pooja", "Karthik", "Anjali"
+]
+
+AREAS = ["Indiranagar", "Koramangala", "HSR Layout", "Whitefield", "Jayanagar", "JP Nagar", "Malleshwaram"]
+
+OCCUPATIONS = [
+    "Software Engineer", "Product Manager", "Designer", "Data Scientist", "Founder",
+    "Marketing Specialist", "Content Creator", "Student", "Architect", "Consultant"
+]
+
+TAGLINES = [
+    "Always looking for the best coffee in town.",
+    "Tech enthusiast and weekend hiker.",
+    "Love to explore new places and meet new people.",
+    "Building the next big thing.",
+    "Just here for the vibes.",
+    "Bookworm and cat lover.",
+    "Let's grab a coffee and talk about life.",
+    "Badminton on weekends?",
+    "Foodie looking for a dining partner.",
+    "Startup founder looking to network."
+]
+
+CITIES = [
+    "Bangalore", "Mumbai", "Delhi", "Hyderabad", "Chennai", "Pune", "Kolkata", "Ahmedabad",
+    "Jaipur", "Kochi", "Chandigarh", "Indore", "Goa", "Mysore", "Coimbatore", "Nagpur",
+    "Vizag", "Bhopal", "Dehradun", "Shillong", "Pondicherry", "Udaipur", "Rishikesh", "Ooty"
+]
+
+MEETING_PREFERENCES = ["Cafe", "Park", "Co-working space", "Online first", "Weekend brunch"]
+GENDERS = ["Male", "Female", "Non-binary"]
+
+# Users per generation block (the unit of reproducibility)
+BLOCK_SIZE = 4096
+# Per-dimension noise around a persona's centre (centres are unit-variance)
+CLUSTER_SPREAD = 0.6
+# Chance that a tag is drawn from the persona's favourites rather than uniformly
+PERSONA_TAG_BIAS = 0.7
+DEALBREAKER_RATE = 0.1
+
+
+class SyntheticPopulation:
+    """
+    count synthetic users in clusters personas. Read them with chunks()
+    (rows without embeddings plus a float32 matrix) or rows() (users table
+    rows with list embeddings, ready to upsert).
+    """
+
+    def __init__(self, count, clusters=40, seed=0, dim=EMBEDDING_DIM):
+        self.count = count
+        self.clusters = clusters
+        self.seed = seed
+        self.dim = dim
+        rng = np.random.default_rng([seed, 2 ** 32 - 1])
+        self.centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+        self.favourite_interests = [rng.choice(len(INTERESTS), 4, replace=False) for _ in range(clusters)]
+        self.favourite_traits = [rng.choice(len(TRAITS), 3, replace=False) for _ in range(clusters)]
+        weights = 1.0 / np.arange(1, len(CITIES) + 1) ** 1.2
+        self.city_weights = weights / weights.sum()
+
+    def user_id(self, i):
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, f"synthetic-{self.seed}-{i}"))
+
+    def _tags(self, rng, vocab, favourites, low, high):
+        picked = set()
+        for _ in range(rng.integers(low, high + 1)):
+            if rng.random() < PERSONA_TAG_BIAS:
+                picked.add(vocab[favourites[rng.integers(len(favourites))]])
+            else:
+                picked.add(vocab[rng.integers(len(vocab))])
+        return sorted(picked)
+
+    def _block(self, b):
+        start = b * BLOCK_SIZE
+        n = min(BLOCK_SIZE, self.count - start)
+        rng = np.random.default_rng([self.seed, b])
+        labels = rng.integers(0, self.clusters, size=n)
+        embeddings = self.centres[labels] + rng.normal(scale=CLUSTER_SPREAD, size=(n, self.dim)).astype(np.float32)
+        cities = rng.choice(len(CITIES), size=n, p=self.city_weights)
+
+        rows = []
+        for j in range(n):
+            i = start + j
+            persona = labels[j]
+            name = NAMES[rng.integers(len(NAMES))]
+            rows.append({
+                "user_id": self.user_id(i),
+                "name": name,
+                "age": int(rng.integers(21, 36)),
+                "city": CITIES[cities[j]],
+                "area": AREAS[rng.integers(len(AREAS))] if cities[j] == 0 else None,
+                "gender": GENDERS[rng.integers(len(GENDERS))],
+                "occupation": OCCUPATIONS[rng.integers(len(OCCUPATIONS))],
+                "interests": self._tags(rng, INTERESTS, self.favourite_interests[persona], 3, 6),
+                "personality_traits": self._tags(rng, TRAITS, self.favourite_traits[persona], 2, 4),
+                "looking_for": sorted({LOOKING_FOR[k] for k in rng.integers(0, len(LOOKING_FOR), rng.integers(1, 4))}),
+                "meeting_preferences": MEETING_PREFERENCES[rng.integers(len(MEETING_PREFERENCES))],
+                "dealbreakers": [TRAITS[rng.integers(len(TRAITS))]] if rng.random() < DEALBREAKER_RATE else [],
+                "tagline": TAGLINES[rng.integers(len(TAGLINES))],
+                "email": f"{name.lower()}.{i}@example.com",
+            })
+        return rows, embeddings
+
+    def chunks(self, size=BLOCK_SIZE):
+        """
+        Yields (rows, embeddings) with up to size users each; rows carry no
+        embedding and embeddings[j] belongs to rows[j].
+        """
+        rows, embeddings = [], np.zeros((0, self.dim), dtype=np.float32)
+        for b in range((self.count + BLOCK_SIZE - 1) // BLOCK_SIZE):
+            block_rows, block_embeddings = self._block(b)
+            rows += block_rows
+            embeddings = np.concatenate([embeddings, block_embeddings])
+            start = 0
+            while len(rows) - start >= size:
+                yield rows[start:start + size], embeddings[start:start + size]
+                start += size
+            rows, embeddings = rows[start:], embeddings[start:]
+        if rows:
+            yield rows, embeddings
+
+    def rows(self, size=BLOCK_SIZE):
+        """
+        Yields lists of up to size users table rows with their embeddings.
+        """
+        for rows, embeddings in self.chunks(size):
+            yield [{**row, "embedding": vec.tolist()} for row, vec in zip(rows, embeddings)]
@@ -0,0 +1,174 @@
+import os
+import numpy as np
+
+# ---------------------------
+# Tag Vocabulary
+# ---------------------------
+#
+# interests / personality_traits / looking_for come from small, mostly closed
+# vocabularies. Each tag is interned to an integer id; the first TAG_BITS ids
+# get a bit in a packed uint64 mask, so set intersections become popcounts over
+# a few words per user. Tags past that (free text the agent saved) fall back to
+# an exact per-row overflow set.
+
+TAG_BITS = int(os.environ.get("TAG_BITS", "256"))
+
+INTERESTS = [
+    "Coffee", "Hiking", "Reading", "Tech", "Startups", "Yoga", "Photography",
+    "Foodie", "Travel", "Music", "Movies", "Board Games", "Badminton", "Cricket",
+    "Art", "Cooking", "Dancing", "Writing"
+]
+
+TRAITS = [
+    "Introvert", "Extrovert", "Chill", "Energetic", "Creative", "Analytical",
+    "Ambitious", "Kind", "Funny", "Thoughtful", "Adventurous"
+]
+
+LOOKING_FOR = [
+    "Friends", "Networking", "Dating", "Activity Partners", "Mentorship"
+]
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(x):
+        x = np.ascontiguousarray(x)
+        return _POPCOUNT_TABLE[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+
+class TagVocabulary:
+    def __init__(self, capacity=TAG_BITS, seed=(*INTERESTS, *TRAITS, *LOOKING_FOR)):
+        self.words = max(1, (capacity + 63) // 64)
+        self.capacity = self.words * 64
+        self.ids = {}
+        for tag in seed:
+            self.intern(tag)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, tag):
+        return self.ids.setdefault(tag, len(self.ids))
+
+    def query(self, tags):
+        """
+        (bit mask, overflow ids) for a set of tags, without interning new ones:
+        a tag no row carries cannot intersect anything.
+        """
+        bits = np.zeros(self.words, dtype=np.uint64)
+        overflow = set()
+        for tag in tags:
+            i = self.ids.get(tag)
+            if i is None:
+                continue
+            if i < self.capacity:
+                bits[i >> 6] |= np.uint64(1 << (i & 63))
+            else:
+                overflow.add(i)
+        return bits, overflow
+
+
+class TagBitsets:
+    """
+    One list field for a block of rows: a (rows, words) uint64 mask, the
+    number of distinct tags per row, and overflow ids for rows that have any.
+    Rows can be rewritten in place with set_row.
+    """
+
+    def __init__(self, vocab, rows=()):
+        self.vocab = vocab
+        n = len(rows)
+        self.bits = np.zeros((n, vocab.words), dtype=np.uint64)
+        self.sizes = np.zeros(n, dtype=np.int32)
+        self.overflow = {}
+
+        row_idx, tag_ids = [], []
+        for i, tags in enumerate(rows):
+            ids = {vocab.intern(t) for t in tags}
+            self.sizes[i] = len(ids)
+            spill = frozenset(t for t in ids if t >= vocab.capacity)
+            if spill:
+                self.overflow[i] = spill
+            for t in ids:
+                if t < vocab.capacity:
+                    row_idx.append(i)
+                    tag_ids.append(t)
+        if tag_ids:
+            tag_ids = np.array(tag_ids, dtype=np.uint64)
+            np.bitwise_or.at(
+                self.bits,
+                (np.array(row_idx, dtype=np.int64), (tag_ids >> np.uint64(6)).astype(np.int64)),
+                np.left_shift(np.uint64(1), tag_ids & np.uint64(63)),
+            )
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def grow(self, n):
+        old = len(self)
+        if n <= old:
+            return
+        bits = np.zeros((n, self.vocab.words), dtype=np.uint64)
+        bits[:old] = self.bits
+        self.bits = bits
+        self.sizes = np.concatenate([self.sizes, np.zeros(n - old, dtype=np.int32)])
+
+    def set_row(self, i, tags):
+        ids = {self.vocab.intern(t) for t in tags}
+        bits = np.zeros(self.vocab.words, dtype=np.uint64)
+        for t in ids:
+            if t < self.vocab.capacity:
+                bits[t >> 6] |= np.uint64(1 << (t & 63))
+        self.bits[i] = bits
+        self.sizes[i] = len(ids)
+        spill = frozenset(t for t in ids if t >= self.vocab.capacity)
+        if spill:
+            self.overflow[i] = spill
+        else:
+            self.overflow.pop(i, None)
+
+    def view(self, n=None):
+        """
+        The first n rows, sharing bits and sizes with this column (the store
+        only writes rows a view's readers never score). overflow is copied,
+        since set_row adds to it.
+        """
+        n = len(self) if n is None else n
+        clone = TagBitsets.__new__(TagBitsets)
+        clone.vocab = self.vocab
+        clone.bits = self.bits[:n]
+        clone.sizes = self.sizes[:n]
+        clone.overflow = {i: ids for i, ids in self.overflow.items() if i < n}
+        return clone
+
+    def intersection_counts(self, query, rows=None):
+        """
+        Per-row count of tags shared with query (from TagVocabulary.query),
+        for every row or only the given sorted row indices.
+        """
+        bits, overflow = query
+        selected = self.bits if rows is None else self.bits[rows]
+        inter = popcount(selected & bits).sum(axis=1, dtype=np.int64)
+        if overflow:
+            for i, ids in self.overflow.items():
+                shared = len(ids & overflow)
+                if not shared:
+                    continue
+                if rows is None:
+                    inter[i] += shared
+                else:
+                    j = np.searchsorted(rows, i)
+                    if j < len(rows) and rows[j] == i:
+                        inter[j] += shared
+        return inter
+
+    def any_of(self, query):
+        bits, overflow = query
+        hit = np.any(self.bits & bits, axis=1)
+        if overflow:
+            for i, ids in self.overflow.items():
+                if ids & overflow:
+                    hit[i] = True
+        return hit
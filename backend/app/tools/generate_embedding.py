@@ -1,22 +1,85 @@
 import os
+import hashlib
+import numpy as np
 from openai import OpenAI
 from dotenv import load_dotenv
+from app.embedding_cache import embedding_cache, content_hash, normalize_text
+from app.profile_fields import EMBEDDING_DIM
+from app.metrics import external
+from app.log import get_logger
+
+logger = get_logger(__name__)
 
 load_dotenv()
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+EMBEDDING_MODEL = "text-embedding-3-small"
+# "openai", or "fake" for deterministic local vectors (tests, load runs, offline dev)
+EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "openai")
 
-def generate_embedding(text: str):
+client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY")) if EMBEDDING_PROVIDER == "openai" else None
+
+def embedding_hash(text: str) -> str:
     """
-    Generates an embedding for the given text using OpenAI's text-embedding-3-small model.
+    Content hash of the text an embedding is generated from. Stored next to
+    users.embedding so an unchanged profile text needs no new embedding.
+    """
+    return content_hash(text, EMBEDDING_MODEL)
+
+def fake_embeddings(texts):
     """
+    Unit vectors seeded by each text's hash: the same text always gets the
+    same embedding and nothing leaves the process.
+    """
+    out = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vec = np.random.default_rng(seed).normal(size=EMBEDDING_DIM)
+        out.append((vec / np.linalg.norm(vec)).tolist())
+    return out
+
+def create_embeddings(texts):
+    """
+    One provider call for a list of already normalized texts.
+    """
+    if EMBEDDING_PROVIDER == "fake":
+        return fake_embeddings(texts)
+    with external("openai", "embeddings"):
+        response = client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def generate_embeddings(texts):
+    """
+    Embeddings for several texts with a single API request for all the ones
+    the embedding cache doesn't have (duplicates are sent once). Returns a
+    list aligned with texts; entries are None if the request failed.
+    """
+    keys = [embedding_hash(text) for text in texts]
+    results = [embedding_cache.get(key) for key in keys]
+
+    missing = {}
+    for i, key in enumerate(keys):
+        if results[i] is None:
+            missing.setdefault(key, []).append(i)
+    if not missing:
+        return results
+
     try:
-        text = text.replace("\n", " ")
-        response = client.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding
+        batch = [normalize_text(texts[positions[0]]) for positions in missing.values()]
+        embeddings = create_embeddings(batch)
     except Exception as e:
-        print(f"Error generating embedding: {e}")
-        return None
+        logger.error("Error generating embeddings: %s", e)
+        return results
+
+    for (key, positions), embedding in zip(missing.items(), embeddings):
+        embedding_cache.put(key, EMBEDDING_MODEL, embedding)
+        for i in positions:
+            results[i] = embedding
+    return results
+
+def generate_embedding(text: str):
+    """
+    Generates an embedding for the given text using OpenAI's text-embedding-3-small model.
+    Texts seen before (same model, same text up to whitespace) come from the
+    embedding cache without an API call.
+    """
+    return generate_embeddings([text])[0]
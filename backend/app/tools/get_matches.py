@@ -1,12 +1,23 @@
-from app.matching_engine import compute_matches_for_user
+import asyncio
+from app.match_cache import cached_matches
+from app.metrics import span
+from app.log import get_logger, log_user, debug_enabled
+
+logger = get_logger(__name__)
 
 def get_matches(user_id: str, limit: int = 6):
     """
     Retrieve matches for the user from the Coffee backend.
-    Directly uses the matching engine to compute matches on the fly.
+    Served from the materialized result in app.match_cache; the matching
+    engine only runs when the user or the candidate pool changed.
     """
+    with log_user(user_id):
+        return _get_matches(user_id, limit)
+
+def _get_matches(user_id: str, limit: int):
     try:
-        result = compute_matches_for_user(user_id)
+        with span("get_matches.lookup"):
+            result = cached_matches(user_id)
         
         if result.get("status") != "success":
             return result
@@ -15,21 +26,31 @@ def get_matches(user_id: str, limit: int = 6):
         flat_matches = result["flat_matches"][:limit]
         
         # Format them to match what the frontend expects
-        formatted_matches = []
-        for m in flat_matches:
-            formatted_matches.append({
-                "user_id": m["match_user_id"],
-                "name": m.get("name"),
-                "age": m.get("age"),
-                "city": m.get("city"),
-                "match_reason": m.get("tagline") or (f"Interests: {', '.join((m.get('overlap_interests') or [])[:3])}" if (m.get('overlap_interests') or []) else "Great match!"),
-                "score": m["score"], # 0-1 score from engine
-                "overlap_interests": (m.get("overlap_interests") or [])[:5]
-            })
-            print(formatted_matches[-1])
+        with span("get_matches.format"):
+            debug = debug_enabled(user_id)
+            formatted_matches = []
+            for m in flat_matches:
+                formatted_matches.append({
+                    "user_id": m["match_user_id"],
+                    "name": m.get("name"),
+                    "age": m.get("age"),
+                    "city": m.get("city"),
+                    "match_reason": m.get("tagline") or (f"Interests: {', '.join((m.get('overlap_interests') or [])[:3])}" if (m.get('overlap_interests') or []) else "Great match!"),
+                    "score": m["score"], # 0-1 score from engine
+                    "overlap_interests": (m.get("overlap_interests") or [])[:5]
+                })
+                if debug:
+                    logger.debug("Match", extra={"match": formatted_matches[-1]})
             
         return {"status": "success", "matches": formatted_matches}
             
     except Exception as e:
-        print(f"Error fetching matches: {e}")
+        logger.error("Error fetching matches: %s", e)
         return {"status": "error", "message": str(e)}
+
+async def get_matches_async(user_id: str, limit: int = 6):
+    """
+    get_matches for the async routes, computed in a worker thread so the
+    event loop keeps serving other requests.
+    """
+    return await asyncio.to_thread(get_matches, user_id, limit)
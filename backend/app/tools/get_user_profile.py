@@ -1,13 +1,20 @@
-from app.db.client import get_supabase
+from app.db.client import get_supabase, get_async_supabase
+from app.profile_fields import PROFILE_FIELD_SETS
+from app.log import get_logger
 
-def get_user_profile(user_id: str):
+logger = get_logger(__name__)
+
+def get_user_profile(user_id: str, fields: str = "full"):
     """
     Retrieves the user's profile from the database.
+    fields picks a column set from PROFILE_FIELD_SETS ("context", "matching"
+    or "full").
     """
     supabase = get_supabase()
     
     try:
-        response = supabase.table("users").select("*").eq("user_id", user_id).execute()
+        columns = PROFILE_FIELD_SETS[fields]
+        response = supabase.table("users").select(columns).eq("user_id", user_id).execute()
         
         if response.data:
             return {"status": "success", "profile": response.data[0]}
@@ -15,5 +22,24 @@ def get_user_profile(user_id: str):
             return {"status": "success", "profile": None} # User not found is not an error
             
     except Exception as e:
-        print(f"Error fetching profile: {e}")
+        logger.error("Error fetching profile: %s", e)
+        return {"status": "error", "message": str(e)}
+
+
+async def get_user_profile_async(user_id: str, fields: str = "full"):
+    """
+    get_user_profile on the async Supabase client.
+    """
+    try:
+        columns = PROFILE_FIELD_SETS[fields]
+        supabase = await get_async_supabase()
+        response = await supabase.table("users").select(columns).eq("user_id", user_id).execute()
+
+        if response.data:
+            return {"status": "success", "profile": response.data[0]}
+        else:
+            return {"status": "success", "profile": None} # User not found is not an error
+
+    except Exception as e:
+        logger.error("Error fetching profile: %s", e)
         return {"status": "error", "message": str(e)}
@@ -1,7 +1,19 @@
+import asyncio
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from app.db.client import get_supabase
-from app.tools.generate_embedding import generate_embedding
+from app.db.client import get_supabase, get_async_supabase
+from app.tools.generate_embedding import embedding_hash
+from app.embedding_cache import embedding_cache
+from app.embedding_queue import embedding_queue, enqueue_embedding
+from app.profile_context import profile_context_cache
+from app.profile_fields import PROFILE_CONTEXT_COLUMNS
+from app.candidate_store import notify_user_changed
+from app.match_cache import match_cache
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_CONTEXT_FIELDS = set(PROFILE_CONTEXT_COLUMNS.split(","))
 
 class ProfileAttributes(BaseModel):
     name: Optional[str] = None
@@ -48,32 +60,118 @@ def should_embed(u: Dict[str, Any]) -> bool:
         u.get("occupation")
     )
 
+def schedule_embedding(user_id: str, user_row: Dict[str, Any]):
+    """
+    Embed + write in the background, unless the stored embedding was made
+    from this same profile text.
+    """
+    if not should_embed(user_row):
+        return
+    profile_text = build_profile_text(user_row)
+    text_hash = embedding_hash(profile_text)
+    has_embedding = user_row.get("has_embedding", bool(user_row.get("embedding")))
+    if has_embedding and user_row.get("embedding_hash") == text_hash:
+        embedding_cache.record_unchanged()
+        # An older text may still be queued for this user
+        embedding_queue.discard(user_id)
+    else:
+        enqueue_embedding(user_id, profile_text, text_hash)
+
+def build_save_payload(user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The attributes to write. When the cached profile context predicts the
+    merged profile text and its embedding is already in memory, the embedding
+    goes into the same write.
+    """
+    payload = dict(data)
+    cached, stored_hash = profile_context_cache.peek(user_id)
+    if cached is None:
+        return payload
+    merged = {**cached, **data}
+    if should_embed(merged):
+        text_hash = embedding_hash(build_profile_text(merged))
+        if text_hash == stored_hash:
+            # The stored embedding already matches
+            return payload
+        emb = embedding_cache.peek(text_hash)
+        if emb is not None:
+            payload["embedding"] = emb
+            payload["embedding_hash"] = text_hash
+    return payload
+
+def after_save(user_id: str, payload: Dict[str, Any], user_row: Dict[str, Any]):
+    """
+    Refreshes the session context cache from the merged row and schedules the
+    embedding unless the save already wrote the right one.
+    """
+    profile_context_cache.invalidate(user_id)
+    if user_row:
+        has_embedding = user_row.get("has_embedding", bool(user_row.get("embedding")))
+        profile_context_cache.put(
+            user_id,
+            {k: v for k, v in user_row.items() if k in PROFILE_CONTEXT_FIELDS},
+            embedding_hash=user_row.get("embedding_hash") if has_embedding else None,
+        )
+
+    if "embedding_hash" in payload and user_row.get("embedding_hash") == payload["embedding_hash"]:
+        embedding_queue.discard(user_id)
+    else:
+        schedule_embedding(user_id, user_row)
+    notify_user_changed(user_id)
+    match_cache.invalidate(user_id)
+
+def _fallback_save(supabase, user_id: str, payload: Dict[str, Any]):
+    # Without migrations/009: a plain upsert (returns every column)
+    return supabase.table("users").upsert({**payload, "user_id": user_id}, on_conflict="user_id")
+
 def save_profile_section(user_id: str, attributes: Dict[str, Any]):
+    """
+    One round trip: save_profile (migrations/009) upserts the attributes and
+    returns the merged row.
+    """
     supabase = get_supabase()
     data = {k: v for k, v in attributes.items() if v is not None}
-    data["user_id"] = user_id
 
     try:
-        existing = supabase.table("users").select("user_id").eq("user_id", user_id).execute()
+        payload = build_save_payload(user_id, data)
+        try:
+            response = supabase.rpc("save_profile", {"p_user_id": user_id, "p_attributes": payload}).execute()
+        except Exception as e:
+            logger.warning("Error in save_profile, falling back to upsert: %s", e)
+            response = _fallback_save(supabase, user_id, payload).execute()
+
+        user_row = response.data[0] if response.data else {}
+        after_save(user_id, payload, user_row)
 
-        if existing.data:
-            response = supabase.table("users").update(data).eq("user_id", user_id).execute()
-        else:
-            response = supabase.table("users").insert(data).execute()
+        return {"status": "success", "data": response.data}
+
+    except Exception as e:
+        logger.error("Error saving profile: %s", e)
+        return {"status": "error", "message": str(e)}
 
-        # fetch fresh row
-        user_row_res = supabase.table("users").select("*").eq("user_id", user_id).single().execute()
-        user_row = user_row_res.data or {}
 
-        # embed + write
-        if should_embed(user_row):
-            profile_text = build_profile_text(user_row)
-            emb = generate_embedding(profile_text)
-            if emb:
-                supabase.table("users").update({"embedding": emb}).eq("user_id", user_id).execute()
+async def save_profile_section_async(user_id: str, attributes: Dict[str, Any]):
+    """
+    save_profile_section on the async Supabase client.
+    """
+    data = {k: v for k, v in attributes.items() if v is not None}
+
+    try:
+        supabase = await get_async_supabase()
+        payload = build_save_payload(user_id, data)
+        try:
+            response = await supabase.rpc("save_profile", {"p_user_id": user_id, "p_attributes": payload}).execute()
+        except Exception as e:
+            logger.warning("Error in save_profile, falling back to upsert: %s", e)
+            response = await _fallback_save(supabase, user_id, payload).execute()
+
+        user_row = response.data[0] if response.data else {}
+        # Only the sync fallback of the queue (EMBEDDING_QUEUE_ENABLED=0) and
+        # the candidate store patch block
+        await asyncio.to_thread(after_save, user_id, payload, user_row)
 
         return {"status": "success", "data": response.data}
 
     except Exception as e:
-        print(f"Error saving profile: {e}")
+        logger.error("Error saving profile: %s", e)
         return {"status": "error", "message": str(e)}
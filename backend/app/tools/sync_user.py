@@ -1,5 +1,11 @@
+import asyncio
 from pydantic import BaseModel
-from app.db.client import get_supabase
+from app.db.client import get_supabase, get_async_supabase
+from app.candidate_store import notify_user_changed
+from app.match_cache import match_cache
+from app.log import get_logger
+
+logger = get_logger(__name__)
 
 class SyncUserRequest(BaseModel):
     user_id: str
@@ -9,35 +15,65 @@ class SyncUserRequest(BaseModel):
 def sync_user(user_id: str, email: str | None = None, phone: str | None = None):
     """
     Ensures the user exists in the public.users table.
+    One round trip for a new user or a plain check, two when an existing
+    user's email/phone is updated.
     """
     supabase = get_supabase()
     
     try:
-        # Check if user exists
-        existing = supabase.table("users").select("user_id").eq("user_id", user_id).execute()
-        
-        if not existing.data:
-            # Insert new user
-            data = {"user_id": user_id}
-            if email:
-                data["email"] = email
-            if phone:
-                data["phone"] = phone
-            
-            response = supabase.table("users").insert(data).execute()
+        data = {"user_id": user_id}
+        updates = {}
+        if email:
+            updates["email"] = email
+        if phone:
+            updates["phone"] = phone
+
+        # Insert if missing; a row only comes back when it was created
+        response = supabase.table("users").upsert(
+            {**data, **updates}, on_conflict="user_id", ignore_duplicates=True
+        ).execute()
+        if response.data:
+            notify_user_changed(user_id)
             return {"status": "created", "data": response.data}
-        else:
-            # Update email/phone if provided
-            updates = {}
-            if email:
-                updates["email"] = email
-            if phone:
-                updates["phone"] = phone
-            
-            if updates:
-                supabase.table("users").update(updates).eq("user_id", user_id).execute()
-            return {"status": "exists"}
+
+        # Update email/phone if provided
+        if updates:
+            supabase.table("users").update(updates).eq("user_id", user_id).execute()
+            notify_user_changed(user_id)
+            match_cache.invalidate(user_id)
+        return {"status": "exists"}
             
     except Exception as e:
-        print(f"Error syncing user: {e}")
+        logger.error("Error syncing user: %s", e)
+        return {"status": "error", "message": str(e)}
+
+
+async def sync_user_async(user_id: str, email: str | None = None, phone: str | None = None):
+    """
+    sync_user on the async Supabase client.
+    """
+    try:
+        supabase = await get_async_supabase()
+        data = {"user_id": user_id}
+        updates = {}
+        if email:
+            updates["email"] = email
+        if phone:
+            updates["phone"] = phone
+
+        response = await supabase.table("users").upsert(
+            {**data, **updates}, on_conflict="user_id", ignore_duplicates=True
+        ).execute()
+        if response.data:
+            await asyncio.to_thread(notify_user_changed, user_id)
+            return {"status": "created", "data": response.data}
+
+        if updates:
+            await supabase.table("users").update(updates).eq("user_id", user_id).execute()
+            await asyncio.to_thread(notify_user_changed, user_id)
+            match_cache.invalidate(user_id)
+        return {"status": "exists"}
+
+    except Exception as e:
+        logger.error("Error syncing user: %s", e)
         return {"status": "error", "message": str(e)}
@@ -1,5 +1,8 @@
 from pydantic import BaseModel
-from app.db.client import get_supabase
+from app.db.client import get_supabase, get_async_supabase
+from app.log import get_logger
+
+logger = get_logger(__name__)
 
 class SaveThreadRequest(BaseModel):
     user_id: str
@@ -26,7 +29,7 @@ def save_thread(user_id: str, thread_id: str, title: str | None = None):
         return {"status": "success", "data": response.data}
             
     except Exception as e:
-        print(f"Error saving thread: {e}")
+        logger.error("Error saving thread: %s", e)
         return {"status": "error", "message": str(e)}
 
 def get_user_threads(user_id: str):
@@ -38,5 +41,39 @@ def get_user_threads(user_id: str):
         response = supabase.table("threads").select("*").eq("user_id", user_id).order("updated_at", desc=True).execute()
         return response.data
     except Exception as e:
-        print(f"Error fetching threads: {e}")
+        logger.error("Error fetching threads: %s", e)
+        return []
+
+
+async def save_thread_async(user_id: str, thread_id: str, title: str | None = None):
+    """
+    save_thread on the async Supabase client.
+    """
+    try:
+        supabase = await get_async_supabase()
+        data = {
+            "user_id": user_id,
+            "thread_id": thread_id,
+            "updated_at": "now()"
+        }
+        if title:
+            data["title"] = title
+
+        response = await supabase.table("threads").upsert(data).execute()
+        return {"status": "success", "data": response.data}
+
+    except Exception as e:
+        logger.error("Error saving thread: %s", e)
+        return {"status": "error", "message": str(e)}
+
+async def get_user_threads_async(user_id: str):
+    """
+    get_user_threads on the async Supabase client.
+    """
+    try:
+        supabase = await get_async_supabase()
+        response = await supabase.table("threads").select("*").eq("user_id", user_id).order("updated_at", desc=True).execute()
+        return response.data
+    except Exception as e:
+        logger.error("Error fetching threads: %s", e)
         return []
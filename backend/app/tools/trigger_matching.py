@@ -1,56 +1,134 @@
-import logging
-from app.db.client import get_supabase
-from app.matching_engine import compute_matches_for_user
+import asyncio
+from app.db.client import get_supabase, get_async_supabase
+from app.match_cache import recompute_matches
+from app.log import get_logger
 
-# Configure logging
-# logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
+
+def build_match_records(user_id: str, flat_matches):
+    """
+    Rows for the matches table from the engine's flat match list.
+    """
+    match_records = []
+    for match in flat_matches:
+        match_records.append({
+            "user_id": user_id,
+            "match_user_id": match["match_user_id"],
+            "score": round(match["score"], 2),
+            "overlap_interests": match.get("overlap_interests", [])
+        })
+    return match_records
+
+# match_id lists per DELETE, to keep the request URL short
+DELETE_CHUNK = 200
+# Rows per select page (PostgREST caps responses, 1000 by default on Supabase)
+PAGE_SIZE = 1000
+
+def _unchanged(existing, record):
+    return (
+        existing.get("score") == record["score"]
+        and set(existing.get("overlap_interests") or []) == set(record["overlap_interests"])
+    )
+
+def _existing_matches_query(supabase, user_ids, start):
+    return (
+        supabase.table("matches")
+        .select("match_id,user_id,match_user_id,score,overlap_interests")
+        .in_("user_id", list(user_ids))
+        .order("match_id")
+        .range(start, start + PAGE_SIZE - 1)
+    )
+
+def diff_matches(existing_rows, match_records):
+    """
+    (records to upsert, match_ids to delete) turning existing_rows into
+    match_records.
+    """
+    existing = {(r["user_id"], r["match_user_id"]): r for r in existing_rows}
+    changed = []
+    for record in match_records:
+        old = existing.pop((record["user_id"], record["match_user_id"]), None)
+        if old is None or not _unchanged(old, record):
+            changed.append(record)
+    return changed, [r["match_id"] for r in existing.values()]
+
+def persist_matches(user_ids, match_records):
+    """
+    Reconciles the matches table for user_ids with match_records instead of
+    delete-then-insert: new or re-scored pairs are upserted on
+    (user_id, match_user_id), pairs that dropped out are deleted, and pairs
+    that did not change are left alone. status and created_at are never
+    sent, so existing rows keep them. One select page per PAGE_SIZE existing
+    rows, at most one upsert and one delete per DELETE_CHUNK dropped rows.
+    Returns (upserted, deleted) row counts.
+    """
+    supabase = get_supabase()
+    existing = []
+    start = 0
+    while True:
+        page = _existing_matches_query(supabase, user_ids, start).execute().data or []
+        existing.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+    changed, dropped = diff_matches(existing, match_records)
+    if changed:
+        supabase.table("matches").upsert(changed, on_conflict="user_id,match_user_id").execute()
+    for start in range(0, len(dropped), DELETE_CHUNK):
+        supabase.table("matches").delete().in_("match_id", dropped[start:start + DELETE_CHUNK]).execute()
+
+    return len(changed), len(dropped)
+
+async def persist_matches_async(user_ids, match_records):
+    """
+    persist_matches on the async Supabase client.
+    """
+    supabase = await get_async_supabase()
+    existing = []
+    start = 0
+    while True:
+        page = (await _existing_matches_query(supabase, user_ids, start).execute()).data or []
+        existing.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+
+    changed, dropped = diff_matches(existing, match_records)
+    if changed:
+        await supabase.table("matches").upsert(changed, on_conflict="user_id,match_user_id").execute()
+    for start in range(0, len(dropped), DELETE_CHUNK):
+        await supabase.table("matches").delete().in_("match_id", dropped[start:start + DELETE_CHUNK]).execute()
+
+    return len(changed), len(dropped)
 
 def trigger_matching(user_id: str):
     """
     Run the matching algorithm for a given user.
     Uses the advanced matching engine to compute matches on the fly.
     """
-    # logger.info(f"Triggering matching for user: {user_id}")
-    supabase = get_supabase()
-    
+    logger.debug("Triggering matching", extra={"user_id": user_id})
     try:
-        # 1. Compute matches using the engine
-        result = compute_matches_for_user(user_id)
+        # 1. Compute matches using the engine (also refreshes get_matches' cache)
+        result = recompute_matches(user_id)
         
         if result.get("status") != "success":
-            # logger.error(f"Matching engine failed: {result.get('message')}")
+            logger.warning("Matching engine failed: %s", result.get("message"), extra={"user_id": user_id})
             return result
             
         flat_matches = result["flat_matches"]
-        # logger.info(f"Found {len(flat_matches)} matches")
+        logger.debug("Found %d matches", len(flat_matches), extra={"user_id": user_id})
         
         # 2. Persist matches to DB
-        # First, clear old matches for this user to avoid duplicates
+        # Only write what changed so accepted/rejected matches keep their status
+        match_records = build_match_records(user_id, flat_matches)
         try:
-            supabase.table("matches").delete().eq("user_id", user_id).execute()
+            persist_matches([user_id], match_records)
+            logger.debug("Matches saved to database", extra={"user_id": user_id})
         except Exception as e:
-            pass
-            # logger.warning(f"Warning: Could not clear old matches: {e}")
-
-        match_records = []
-        for match in flat_matches:
-            match_records.append({
-                "user_id": user_id,
-                "match_user_id": match["match_user_id"],
-                "score": round(match["score"], 2),
-                "overlap_interests": match.get("overlap_interests", [])
-            })
-            
-        if match_records:
-            try:
-                supabase.table("matches").insert(match_records).execute()
-                # logger.info("Matches saved to database")
-            except Exception as e:
-                # logger.error(f"Failed to insert matches: {e}")
-                # If insert fails (e.g. schema mismatch), we still return the matches 
-                # so the user sees them in the UI this time, even if they aren't saved.
-                pass
+            logger.error("Failed to persist matches: %s", e, extra={"user_id": user_id})
+            # If the write fails (e.g. schema mismatch), we still return the matches 
+            # so the user sees them in the UI this time, even if they aren't saved.
             
         # 3. Return simplified response to the Agent
         # The agent only needs to know it worked. The frontend will fetch the full data.
@@ -59,5 +137,32 @@ def trigger_matching(user_id: str):
         }
             
     except Exception as e:
-        # logger.exception("Critical error in trigger_matching")
-        return {"status": "error", "message": "Internal error during matching"}
\ No newline at end of file
+        logger.exception("Critical error in trigger_matching", extra={"user_id": user_id})
+        return {"status": "error", "message": "Internal error during matching"}
+
+async def trigger_matching_async(user_id: str):
+    """
+    trigger_matching for the async routes: scoring is CPU-bound and runs in a
+    worker thread, persisting uses the async Supabase client.
+    """
+    logger.debug("Triggering matching", extra={"user_id": user_id})
+    try:
+        result = await asyncio.to_thread(recompute_matches, user_id)
+
+        if result.get("status") != "success":
+            logger.warning("Matching engine failed: %s", result.get("message"), extra={"user_id": user_id})
+            return result
+
+        match_records = build_match_records(user_id, result["flat_matches"])
+        try:
+            await persist_matches_async([user_id], match_records)
+        except Exception as e:
+            logger.error("Failed to persist matches: %s", e, extra={"user_id": user_id})
+
+        return {
+            "status": "success"
+        }
+
+    except Exception as e:
+        logger.exception("Critical error in trigger_matching", extra={"user_id": user_id})
+        return {"status": "error", "message": "Internal error during matching"}
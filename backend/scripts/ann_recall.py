@@ -0,0 +1,132 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.profile_fields import EMBEDDING_DIM
+from app.candidate_matrix import CandidateMatrix
+from app.matching_engine import cosine_similarity
+from app.ann_index import IVFIndex, QuantizedIndex
+
+
+def synthetic_matrix(count, clusters, dim=EMBEDDING_DIM, seed=0):
+    """
+    Synthetic users whose embeddings sit around a few topic centres, so the
+    ANN lists have real structure to find.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centres[labels] + rng.normal(scale=0.6, size=(count, dim)).astype(np.float32)
+    rows = [{"user_id": f"synthetic_{i}"} for i in range(count)]
+    return CandidateMatrix(rows, dim=dim, embeddings=vectors, has_embedding=np.ones(count, dtype=bool))
+
+
+def live_matrix():
+    from app.candidate_store import candidate_store
+    candidate_store.load()
+    return candidate_store.matrix()
+
+
+def exact_top_k(matrix, query, k, keep):
+    """
+    Reference result from the original per-candidate cosine_similarity.
+    """
+    rows = np.flatnonzero(keep)
+    sims = np.array([cosine_similarity(query, matrix.embeddings[i]) for i in rows])
+    order = np.argsort(-sims, kind="stable")[:k]
+    return rows[order]
+
+
+def exact_truth(matrix, queries, k, keep):
+    """
+    (query -> exact top-k rows other than itself, ms per query).
+    """
+    truth = {}
+    started = time.time()
+    for q in queries:
+        truth[q] = set(exact_top_k(matrix, matrix.embeddings[q], k + 1, keep).tolist()) - {q}
+    return truth, (time.time() - started) / len(queries) * 1000
+
+
+def measure(index, matrix, queries, k, keep, truth):
+    hits = 0
+    started = time.time()
+    for q in queries:
+        query_keep = keep.copy()
+        query_keep[q] = False
+        found = index.search(matrix.embeddings[q], k, query_keep)
+        hits += len(set(found.tolist()) & truth[q])
+    ms = (time.time() - started) / len(queries) * 1000
+    return hits / max(1, sum(len(t) for t in truth.values())), ms
+
+
+def recall_report(matrix, queries, k, nprobes, nlist):
+    keep = matrix.alive.copy()
+    started = time.time()
+    index = IVFIndex(matrix, nlist=nlist)
+    print(f"IVF build: {len(index.centroids)} lists over {len(matrix)} rows in {time.time() - started:.2f}s")
+
+    truth, exact_ms = exact_truth(matrix, queries, k, keep)
+
+    print(f"{'nprobe':>8} {'recall@' + str(k):>10} {'ms/query':>10}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_ms:>10.2f}")
+    for nprobe in nprobes:
+        index.nprobe = nprobe
+        recall, ms = measure(index, matrix, queries, k, keep, truth)
+        print(f"{nprobe:>8} {recall:>10.3f} {ms:>10.2f}")
+
+
+def quantized_report(matrix, queries, k, reranks):
+    """
+    Resident embedding memory per layout, then recall@k of the int8 index
+    (ANN_INDEX=int8) against exact cosine_similarity for each re-rank depth
+    (0 = int8 scores only).
+    """
+    n, dim = len(matrix), matrix.dim
+    index = QuantizedIndex(matrix)
+    print(f"{'layout':>14} {'MB':>10}")
+    print(f"{'python lists':>14} {n * dim * 32 / 1e6:>10.1f}")   # 24-byte float + 8-byte pointer
+    print(f"{'float64':>14} {n * dim * 8 / 1e6:>10.1f}")
+    print(f"{'float32':>14} {matrix.embeddings.nbytes / 1e6:>10.1f}")
+    print(f"{'int8':>14} {(matrix.codes.nbytes + matrix.scales.nbytes) / 1e6:>10.1f}")
+
+    keep = matrix.alive.copy()
+    truth, exact_ms = exact_truth(matrix, queries, k, keep)
+    print(f"{'index':>8} {'rerank':>8} {'recall@' + str(k):>10} {'ms/query':>10}")
+    print(f"{'exact':>8} {'-':>8} {1.0:>10.3f} {exact_ms:>10.2f}")
+    for rerank in reranks:
+        index.rerank = rerank
+        recall, ms = measure(index, matrix, queries, k, keep, truth)
+        print(f"{'int8':>8} {rerank:>8} {recall:>10.3f} {ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall of the overall_vibe indexes against exact cosine search.")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--clusters", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--quantized", action="store_true", help="Report the int8 index instead of IVF")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 50, 200, 500])
+    parser.add_argument("--live", action="store_true", help="Use the users table instead of synthetic data")
+    args = parser.parse_args()
+
+    if args.live:
+        matrix = live_matrix()
+    else:
+        matrix = synthetic_matrix(args.users, args.clusters)
+
+    rng = np.random.default_rng(1)
+    candidates = np.flatnonzero(matrix.alive & matrix.has_embedding)
+    queries = rng.choice(candidates, size=min(args.queries, len(candidates)), replace=False).tolist()
+    if args.quantized:
+        quantized_report(matrix, queries, args.k, args.rerank)
+    else:
+        recall_report(matrix, queries, args.k, args.nprobe, args.nlist)
@@ -0,0 +1,290 @@
+import sys
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from postgrest.types import ReturnMethod
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Users per upsert request
+IMPORT_CHUNK = 500
+# Profile texts per embeddings request
+EMBED_BATCH = 256
+# Columns an import may set; updated_at is left to the database so the
+# candidate store's incremental refresh sees every imported row
+IMPORT_COLUMNS = (
+    "user_id", "email", "phone", "name", "age", "age_range", "city", "area", "gender", "occupation",
+    "interests", "personality_traits", "looking_for", "meeting_preferences", "dealbreakers", "tagline",
+    "created_at", "embedding", "embedding_hash",
+)
+LIST_COLUMNS = ("interests", "personality_traits", "looking_for", "dealbreakers")
+
+
+def read_source(path, fmt=None):
+    """
+    Streams raw user dicts from a .jsonl or .csv file ("-" reads stdin).
+    """
+    fmt = fmt or ("csv" if path.endswith(".csv") else "jsonl")
+    f = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def synthetic_source(count, clusters, seed):
+    from app.synthetic_population import SyntheticPopulation
+    for rows in SyntheticPopulation(count, clusters=clusters, seed=seed).rows(IMPORT_CHUNK):
+        yield from rows
+
+
+def clean_row(raw):
+    """
+    The importable columns of a raw record with CSV-style values parsed
+    (lists from JSON or comma separated text, "" as null), or None when it
+    has no user_id.
+    """
+    from app.profile_fields import parse_list_field
+    row = {}
+    for column in IMPORT_COLUMNS:
+        if column not in raw:
+            continue
+        value = raw[column]
+        if value == "":
+            value = None
+        if column in LIST_COLUMNS and value is not None:
+            value = parse_list_field(value)
+        elif column == "age" and value is not None:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                value = None
+        row[column] = value
+    if not row.get("user_id"):
+        return None
+    row["user_id"] = str(row["user_id"])
+    return row
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ImportStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.read = 0
+        self.skipped = 0
+        self.embedded = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            return {
+                "read": self.read,
+                "skipped": self.skipped,
+                "embedded": self.embedded,
+                "written": self.written,
+                "failed": self.failed,
+                "retries": self.retries,
+                "elapsed_s": elapsed,
+                "rows_per_s": self.written / max(elapsed, 1e-9),
+            }
+
+
+def prepare_embeddings(rows, mode, stats, dim):
+    """
+    Validates given embeddings as one float32 batch and, with mode
+    "generate", embeds the profile text of rows that have none, EMBED_BATCH
+    texts per provider request. Unusable embeddings are dropped.
+    """
+    from app.candidate_matrix import parse_embedding_row
+
+    given = [row for row in rows if row.get("embedding") is not None]
+    if given:
+        batch = np.zeros((len(given), dim), dtype=np.float32)
+        ok = np.zeros(len(given), dtype=bool)
+        for i, row in enumerate(given):
+            batch[i], ok[i] = parse_embedding_row(row["embedding"], dim)
+        ok &= np.isfinite(batch).all(axis=1) & batch.any(axis=1)
+        for row, vec, good in zip(given, batch.tolist(), ok):
+            if good:
+                row["embedding"] = vec
+            else:
+                del row["embedding"]
+                row.pop("embedding_hash", None)
+
+    if mode != "generate":
+        return
+    missing = [row for row in rows if row.get("embedding") is None]
+    if not missing:
+        return
+    # Imported only when needed: the OpenAI client wants credentials
+    from app.tools.generate_embedding import generate_embeddings, embedding_hash
+    from app.tools.save_profile_section import build_profile_text, should_embed
+    wanted = [row for row in missing if should_embed(row)]
+    for start in range(0, len(wanted), EMBED_BATCH):
+        batch_rows = wanted[start:start + EMBED_BATCH]
+        texts = [build_profile_text(row) for row in batch_rows]
+        embeddings = generate_embeddings(texts)
+        for row, text, emb in zip(batch_rows, texts, embeddings):
+            if emb is not None:
+                row["embedding"] = np.asarray(emb, dtype=np.float32).tolist()
+                row["embedding_hash"] = embedding_hash(text)
+                stats.add(embedded=1)
+
+
+def upsert_with_retry(rows, retries, stats):
+    """
+    One multi-row upsert per column set (so a record missing a column does
+    not null it on existing rows), retried with exponential backoff. Rows
+    are not sent back.
+    """
+    from app.db.client import get_supabase
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    failed = []
+    for group in groups.values():
+        for attempt in range(retries + 1):
+            try:
+                get_supabase().table("users").upsert(
+                    group, on_conflict="user_id", returning=ReturnMethod.minimal
+                ).execute()
+                stats.add(written=len(group))
+                break
+            except Exception as e:
+                if attempt == retries:
+                    print(f"Error importing {len(group)} users: {e}")
+                    stats.add(failed=len(group))
+                    failed.extend(group)
+                else:
+                    stats.add(retries=1)
+                    time.sleep(min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+    return failed
+
+
+def run_import(records, chunk_size=IMPORT_CHUNK, concurrency=4, retries=3, embeddings="generate",
+               failed_path=None, progress_every=5.0, quiet=False):
+    """
+    Cleans, embeds and upserts records chunk by chunk. The main thread reads
+    and embeds the next chunk while up to concurrency upserts are in flight.
+    """
+    from app.profile_fields import EMBEDDING_DIM
+    stats = ImportStats()
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+    failed_file = open(failed_path, "w") if failed_path else None
+    failed_lock = threading.Lock()
+    last_report = [time.perf_counter()]
+
+    def report():
+        s = stats.snapshot()
+        print(f"⚙️  {s['written']} written, {s['failed']} failed, {s['read']} read "
+              f"({s['rows_per_s']:.0f} rows/s)")
+
+    def write(chunk):
+        try:
+            failed = upsert_with_retry(chunk, retries, stats)
+            if failed and failed_file:
+                with failed_lock:
+                    for row in failed:
+                        failed_file.write(json.dumps(row) + "\n")
+        finally:
+            in_flight.release()
+
+    def cleaned():
+        for raw in records:
+            stats.add(read=1)
+            row = clean_row(raw)
+            if row is None:
+                stats.add(skipped=1)
+                continue
+            yield row
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="import") as pool:
+        for chunk in chunked(cleaned(), chunk_size):
+            # Later records win over earlier ones for the same user in a chunk
+            chunk = list({row["user_id"]: row for row in chunk}.values())
+            prepare_embeddings(chunk, embeddings, stats, EMBEDDING_DIM)
+            in_flight.acquire()
+            pool.submit(write, chunk)
+            if not quiet and time.perf_counter() - last_report[0] >= progress_every:
+                last_report[0] = time.perf_counter()
+                report()
+
+    if failed_file:
+        failed_file.close()
+    return stats.snapshot()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import users from JSONL/CSV (or synthetic users).")
+    parser.add_argument("source", nargs="?", help=".jsonl or .csv file, or - for stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the extension)")
+    parser.add_argument("--synthetic", type=int, help="Import this many synthetic users instead of a file")
+    parser.add_argument("--clusters", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", choices=["supabase", "local"], help="Storage backend (default: STORAGE_BACKEND)")
+    parser.add_argument("--local-db", help="SQLite file for --target local (default: LOCAL_DB_PATH)")
+    parser.add_argument("--embeddings", choices=["generate", "keep"], default="generate",
+                        help="generate: embed profiles without one; keep: import embeddings as given only")
+    parser.add_argument("--chunk", type=int, default=IMPORT_CHUNK, help="Users per upsert")
+    parser.add_argument("--concurrency", type=int, default=4, help="Upserts in flight")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--failed", help="Write records that still failed after retries to this JSONL file")
+    parser.add_argument("--progress", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    if not args.source and not args.synthetic:
+        parser.error("give a source file or --synthetic N")
+    # app.db.client picks the backend at import time
+    if args.target:
+        os.environ["STORAGE_BACKEND"] = args.target
+    if args.local_db:
+        os.environ["LOCAL_DB_PATH"] = args.local_db
+
+    if args.synthetic:
+        records = synthetic_source(args.synthetic, args.clusters, args.seed)
+    else:
+        records = read_source(args.source, args.format)
+    result = run_import(records, chunk_size=args.chunk, concurrency=args.concurrency, retries=args.retries,
+                        embeddings=args.embeddings, failed_path=args.failed, progress_every=args.progress,
+                        quiet=args.json)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"✅ Imported {result['written']} users in {result['elapsed_s']:.1f}s "
+              f"({result['rows_per_s']:.0f} rows/s): {result['embedded']} embedded, "
+              f"{result['skipped']} skipped, {result['failed']} failed, {result['retries']} retries")
+    sys.exit(1 if result["failed"] else 0)
@@ -0,0 +1,75 @@
+import sys
+import os
+import json
+import time
+import resource
+import argparse
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.candidate_store import CandidateStore, CANDIDATE_SNAPSHOT_DIR
+from app.candidate_snapshot import write_snapshot
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write(directory):
+    """
+    Full users table load, written as the newest snapshot under directory.
+    """
+    store = CandidateStore()
+    started = time.perf_counter()
+    rows = list(store._fetch_pages())
+    fetched = time.perf_counter() - started
+    for row in rows:
+        store._put(row)
+    store.ready = True
+    path = write_snapshot(store, directory)
+    return {"users": len(store), "fetch_s": fetched, "total_s": time.perf_counter() - started, "path": path}
+
+
+def check(directory):
+    """
+    What a starting worker does: map the snapshot, fetch the delta, build
+    the matrix (and ANN index). Reports the time until matches can be served.
+    """
+    store = CandidateStore()
+    started = time.perf_counter()
+    if not store.load_snapshot(directory):
+        return None
+    store.matrix()
+    return {
+        "users": len(store),
+        "ready_ms": (time.perf_counter() - started) * 1000,
+        "mapped": type(store.embeddings).__name__ == "memmap",
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a candidate store snapshot, or time loading one.")
+    parser.add_argument("--dir", default=CANDIDATE_SNAPSHOT_DIR or "candidate_snapshot")
+    parser.add_argument("--check", action="store_true", help="Time a worker start from the newest snapshot")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    if args.check:
+        result = check(args.dir)
+        if result is None:
+            print(f"No usable snapshot in {args.dir}")
+            sys.exit(1)
+    else:
+        result = write(args.dir)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    elif args.check:
+        print(f"⚡ {result['users']} users ready in {result['ready_ms']:.0f} ms "
+              f"(mapped: {result['mapped']}, peak RSS {result['peak_rss_mb']:.0f} MB)")
+    else:
+        print(f"💾 Wrote {result['users']} users to {result['path']} "
+              f"(fetch {result['fetch_s']:.1f}s, total {result['total_s']:.1f}s)")
@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+import json
+import asyncio
+import argparse
+import subprocess
+import httpx
+
+# Add the backend directory to sys.path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+async def run_load(base_url, paths, requests, concurrency, method="GET", body=None):
+    """
+    Fires `requests` requests round-robin over paths with `concurrency` in
+    flight at once. Returns latency percentiles (ms), RPS and error count.
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                path = paths[i % len(paths)]
+                started = time.perf_counter()
+                try:
+                    res = await client.request(method, path, json=body)
+                    if res.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def start_server(async_mode, port):
+    env = dict(os.environ, ASYNC_MODE="1" if async_mode else "0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not start")
+
+
+def print_report(label, stats):
+    print(f"{label:>6}  {stats['rps']:>8.1f} rps  p50 {stats['p50_ms']:>8.1f} ms  "
+          f"p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms  errors {stats['errors']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API; --compare runs it against sync and async mode.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server to hit (ignored with --compare)")
+    parser.add_argument("--path", action="append", help="Path to request, repeatable (default: get_user_profile of --user-id)")
+    parser.add_argument("--user-id", default="test_user_1")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", help="JSON body for POST paths")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--compare", action="store_true", help="Start uvicorn with ASYNC_MODE=0 and =1 and test both")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    paths = args.path or [f"/api/tools/get_user_profile/{args.user_id}"]
+    body = json.loads(args.body) if args.body else None
+
+    def measure(url):
+        asyncio.run(run_load(url, paths, args.warmup, min(args.concurrency, args.warmup), args.method, body))
+        return asyncio.run(run_load(url, paths, args.requests, args.concurrency, args.method, body))
+
+    results = {}
+    if args.compare:
+        for label, async_mode in (("sync", False), ("async", True)):
+            proc = start_server(async_mode, args.port)
+            try:
+                results[label] = measure(f"http://127.0.0.1:{args.port}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    else:
+        results["run"] = measure(args.url)
+
+    if args.json:
+        print(json.dumps({"paths": paths, "results": results}, indent=2))
+    else:
+        print(f"{len(paths)} path(s), {args.requests} requests, concurrency {args.concurrency}")
+        for label, stats in results.items():
+            print_report(label, stats)
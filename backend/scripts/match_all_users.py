@@ -0,0 +1,189 @@
+import sys
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.client import get_supabase
+from app.profile_fields import CANDIDATE_COLUMNS, normalize_location
+from app.candidate_matrix import CandidateMatrix
+from app.matching_engine import score_matrix, classify_matches
+from app.tools.trigger_matching import build_match_records, persist_matches
+
+# Candidates plus what each user needs as the matching side
+JOB_COLUMNS = CANDIDATE_COLUMNS + ",dealbreakers"
+PAGE_SIZE = 1000
+WRITE_CHUNK = 200
+
+# Set in the parent before the pool forks, so workers share it copy-on-write
+_matrix = None
+
+
+def load_users():
+    supabase = get_supabase()
+    rows = []
+    start = 0
+    while True:
+        res = supabase.table("users").select(JOB_COLUMNS).order("user_id").range(start, start + PAGE_SIZE - 1).execute()
+        page = res.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def select_cohort(matrix, city=None, user_ids=None, done=()):
+    """
+    Row indices of the users to match: everyone, or only a city / id list,
+    minus users a previous run already finished.
+    """
+    city = normalize_location(city) if city else None
+    wanted = set(user_ids) if user_ids else None
+    done = set(done)
+    cohort = []
+    for i, row in enumerate(matrix.rows):
+        uid = row.get("user_id")
+        if uid in done:
+            continue
+        if wanted is not None and uid not in wanted:
+            continue
+        if city is not None and normalize_location(row.get("city")) != city:
+            continue
+        cohort.append(i)
+    return cohort
+
+
+def _init_worker(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def match_block(slots):
+    """
+    Matches for a block of users. The semantic scores of the whole block
+    against every candidate come from one matrix-matrix product.
+    """
+    semantic = _matrix.block_semantic_scores(slots)
+    results = []
+    for b, slot in enumerate(slots):
+        profile = _matrix.rows[slot]
+        matches = score_matrix(profile, None, _matrix, exclude=slot, semantic_all=semantic[b])
+        flat = classify_matches(matches)["flat_matches"]
+        results.append((profile["user_id"], build_match_records(profile["user_id"], flat)))
+    return results
+
+
+def write_results(results):
+    """
+    trigger_matching's persistence for a chunk of users at a time: only new,
+    re-scored and dropped pairs are written.
+    """
+    upserted = deleted = 0
+    for start in range(0, len(results), WRITE_CHUNK):
+        chunk = results[start:start + WRITE_CHUNK]
+        u, d = persist_matches([uid for uid, _ in chunk], [r for _, recs in chunk for r in recs])
+        upserted += u
+        deleted += d
+    return upserted, deleted
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def append_checkpoint(path, user_ids):
+    if not path:
+        return
+    with open(path, "a") as f:
+        for uid in user_ids:
+            f.write(uid + "\n")
+
+
+def pool_for(workers, matrix):
+    if "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    # No fork (e.g. Windows): each worker gets its own pickled copy of the matrix
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,))
+
+
+def match_all_users(workers=None, block_size=64, city=None, user_ids=None, checkpoint=None, dry_run=False):
+    global _matrix
+
+    started = time.time()
+    rows = load_users()
+    _matrix = CandidateMatrix(rows)
+    print(f"📥 Loaded {len(rows)} users in {time.time() - started:.1f}s")
+
+    done = read_checkpoint(checkpoint)
+    cohort = select_cohort(_matrix, city=city, user_ids=user_ids, done=done)
+    if done:
+        print(f"↩️  Resuming: {len(done)} users already matched, {len(cohort)} to go")
+    if not cohort:
+        print("Nothing to do.")
+        return
+
+    blocks = [cohort[i:i + block_size] for i in range(0, len(cohort), block_size)]
+    workers = workers or os.cpu_count() or 1
+    matched = upserted = deleted = 0
+    pending = []
+    started = time.time()
+
+    with pool_for(workers, _matrix) as pool:
+        futures = [pool.submit(match_block, block) for block in blocks]
+        for future in as_completed(futures):
+            pending.extend(future.result())
+            if len(pending) >= WRITE_CHUNK:
+                if not dry_run:
+                    u, d = write_results(pending)
+                    upserted += u
+                    deleted += d
+                append_checkpoint(checkpoint, [uid for uid, _ in pending])
+                matched += len(pending)
+                pending = []
+                elapsed = time.time() - started
+                print(f"⚙️  {matched}/{len(cohort)} users, {matched / elapsed:.1f} users/s")
+
+    if pending:
+        if not dry_run:
+            u, d = write_results(pending)
+            upserted += u
+            deleted += d
+        append_checkpoint(checkpoint, [uid for uid, _ in pending])
+        matched += len(pending)
+
+    elapsed = time.time() - started
+    print(f"✅ Matched {matched} users in {elapsed:.1f}s ({matched / max(elapsed, 1e-9):.1f} users/s, {workers} workers)")
+    if not dry_run:
+        print(f"💾 {upserted} match rows upserted, {deleted} deleted")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute and store matches for every user (or a cohort).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--block-size", type=int, default=64, help="Users per matrix-matrix block")
+    parser.add_argument("--city", help="Only match users in this city")
+    parser.add_argument("--user-ids", help="File with one user_id per line to match")
+    parser.add_argument("--checkpoint", help="Progress file; rerun with the same path to resume")
+    parser.add_argument("--dry-run", action="store_true", help="Compute but don't write to the matches table")
+    args = parser.parse_args()
+
+    ids = None
+    if args.user_ids:
+        with open(args.user_ids) as f:
+            ids = [line.strip() for line in f if line.strip()]
+
+    match_all_users(
+        workers=args.workers,
+        block_size=args.block_size,
+        city=args.city,
+        user_ids=ids,
+        checkpoint=args.checkpoint,
+        dry_run=args.dry_run,
+    )
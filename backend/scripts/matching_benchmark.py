@@ -0,0 +1,299 @@
+import sys
+import os
+import json
+import time
+import platform
+import resource
+import argparse
+import subprocess
+import numpy as np
+
+# Add the backend directory to sys.path
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+# Engine variants: module settings applied before timing. "exact" is the
+# reference every other variant's results are compared against.
+VARIANTS = {
+    "exact": {"ANN_INDEX": "exact", "LOCATION_PARTITIONING": False},
+    "ivf": {"ANN_INDEX": "ivf", "LOCATION_PARTITIONING": False},
+    "int8": {"ANN_INDEX": "int8", "LOCATION_PARTITIONING": False},
+    "location": {"ANN_INDEX": "exact", "LOCATION_PARTITIONING": True},
+}
+REFERENCE = "exact"
+SIZES = [1000, 10000, 100000, 1000000]
+# Resident bytes per user beyond the float32 embedding (rows, tags, indexes)
+OVERHEAD_PER_USER = 4096
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def fill_store(store, population):
+    """
+    Loads the population straight into the candidate store (no users table
+    round trip), with a synthetic updated_at per user.
+    """
+    from app.candidate_matrix import quantize_int8
+    base = np.datetime64("2025-01-01T00:00:00", "s")
+    n = 0
+    with store.lock:
+        store._grow(population.count + 1)
+        for chunk, embeddings in population.chunks():
+            slots = []
+            for row in chunk:
+                row["updated_at"] = f"{base + n}+00:00"
+                store._put(row)
+                slots.append(store.index[row["user_id"]])
+                n += 1
+            store.embeddings[slots] = embeddings
+            store.norms[slots] = np.linalg.norm(embeddings, axis=1)
+            if store.codes is not None:
+                store.codes[slots], store.scales[slots] = quantize_int8(embeddings / store.norms[slots, None])
+        store.ready = True
+        store.loaded_at = store.refreshed_at = time.time()
+    # Nothing else writes: never refresh from the (empty) users table
+    store.ttl = store.refresh_interval = float("inf")
+
+
+def use_variant(store, settings):
+    import app.ann_index as ann_index
+    import app.candidate_store as candidate_store
+    import app.matching_engine as matching_engine
+    from app.candidate_matrix import quantize_int8
+    ann_index.ANN_INDEX = candidate_store.ANN_INDEX = settings["ANN_INDEX"]
+    matching_engine.LOCATION_PARTITIONING = settings["LOCATION_PARTITIONING"]
+    with store.lock:
+        # int8 codes next to the resident float32 rows, for latency and
+        # agreement only: scripts/ann_recall.py --quantized has the memory
+        store.quantized = settings["ANN_INDEX"] == "int8"
+        store.codes = store.scales = None
+        if store.quantized:
+            store.codes = np.zeros(store.embeddings.shape, dtype=np.int8)
+            store.scales = np.ones(len(store.embeddings), dtype=np.float32)
+            for start in range(0, len(store.embeddings), 8192):
+                block = slice(start, start + 8192)
+                store.codes[block], store.scales[block] = quantize_int8(store.embeddings[block] / store.norms[block, None])
+        store._matrix = None
+        store._index = None
+        store.changed = None
+
+
+def agreement(result, reference):
+    """
+    Share of the reference's matches the result also returned, for the flat
+    list and averaged over the category buckets.
+    """
+    def ids(matches):
+        return {m["match_user_id"] for m in matches}
+
+    flat = len(ids(result["flat_matches"]) & ids(reference["flat_matches"])) / max(1, len(reference["flat_matches"]))
+    buckets = [
+        len(ids(result["classified_matches"][key]) & ids(matches)) / max(1, len(matches))
+        for key, matches in reference["classified_matches"].items()
+    ]
+    vibe = reference["classified_matches"]["overall_vibe"]
+    return flat, float(np.mean(buckets)), len(ids(result["classified_matches"]["overall_vibe"]) & ids(vibe)) / max(1, len(vibe))
+
+
+def run_size(count, clusters, queries, seed, variants):
+    """
+    One population size, in this process: fill the candidate store, then time
+    compute_matches_for_user for each variant on the same query users.
+    """
+    from app.db.client import get_supabase
+    from app.candidate_store import candidate_store
+    from app.matching_engine import compute_matches_for_user
+    from app.synthetic_population import SyntheticPopulation
+
+    population = SyntheticPopulation(count, clusters=clusters, seed=seed)
+    started = time.perf_counter()
+    fill_store(candidate_store, population)
+    build_s = time.perf_counter() - started
+    store_rss_mb = peak_rss_mb()
+
+    # The query users' own profiles are read through get_user_profile
+    picked = np.random.default_rng(seed + 1).choice(count, size=min(queries, count), replace=False)
+    query_ids = [population.user_id(i) for i in picked]
+    profiles = []
+    for user_id in query_ids:
+        slot = candidate_store.index[user_id]
+        profiles.append({**candidate_store.rows[slot], "embedding": candidate_store.embeddings[slot].tolist()})
+    get_supabase().table("users").upsert(profiles).execute()
+
+    results = {}
+    reference = {}
+    for name in [REFERENCE] + [v for v in variants if v != REFERENCE]:
+        use_variant(candidate_store, VARIANTS[name])
+        started = time.perf_counter()
+        compute_matches_for_user(query_ids[0])
+        first_ms = (time.perf_counter() - started) * 1000
+
+        latencies = []
+        scores = []
+        started = time.perf_counter()
+        for user_id in query_ids:
+            t = time.perf_counter()
+            result = compute_matches_for_user(user_id)
+            latencies.append((time.perf_counter() - t) * 1000)
+            if result.get("status") != "success":
+                raise RuntimeError(f"{name}: {result}")
+            if name == REFERENCE:
+                reference[user_id] = result
+            scores.append(agreement(result, reference[user_id]))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        flat, buckets, vibe = np.mean(scores, axis=0) if scores else (1.0, 1.0, 1.0)
+        results[name] = {
+            "first_ms": first_ms,
+            "mean_ms": float(np.mean(latencies)),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "throughput_qps": len(query_ids) / elapsed,
+            "flat_agreement": float(flat),
+            "bucket_agreement": float(buckets),
+            "vibe_recall": float(vibe),
+        }
+
+    return {
+        "users": count,
+        "queries": len(query_ids),
+        "build_s": build_s,
+        "store_rss_mb": store_rss_mb,
+        "peak_rss_mb": peak_rss_mb(),
+        "variants": {name: results[name] for name in variants if name in results},
+    }
+
+
+def available_mb():
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def run_child(count, args):
+    """
+    Runs one size in a fresh interpreter, so peak RSS is that size's alone.
+    """
+    from app.profile_fields import EMBEDDING_DIM
+    needed = count * (EMBEDDING_DIM * 4 + OVERHEAD_PER_USER) / 2 ** 20
+    free = available_mb()
+    if free is not None and needed > free:
+        return {"users": count, "skipped": f"needs ~{needed:.0f} MB, {free:.0f} MB available"}
+
+    env = dict(os.environ, STORAGE_BACKEND="local", LOCAL_DB_PATH=":memory:",
+               EMBEDDING_PROVIDER="fake", CANDIDATE_STORE_ENABLED="1", CANDIDATE_SNAPSHOT_DIR="")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(count),
+           "--clusters", str(args.clusters), "--queries", str(args.queries), "--seed", str(args.seed),
+           "--variants", *args.variants]
+    proc = subprocess.run(cmd, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"users": count, "error": (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(report):
+    print(f"{'users':>9} {'variant':>9} {'first ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'q/s':>8} {'flat':>6} {'bucket':>6} {'vibe':>6} {'RSS MB':>8}")
+    for size in report["results"]:
+        if "variants" not in size:
+            print(f"{size['users']:>9} {size.get('skipped') or size.get('error')}")
+            continue
+        for name, r in size["variants"].items():
+            print(f"{size['users']:>9} {name:>9} {r['first_ms']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                  f"{r['p99_ms']:>8.2f} {r['throughput_qps']:>8.1f} {r['flat_agreement']:>6.3f} "
+                  f"{r['bucket_agreement']:>6.3f} {r['vibe_recall']:>6.3f} {size['peak_rss_mb']:>8.0f}")
+
+
+def compare(report, baseline, tolerance):
+    """
+    Lists p50 latency and agreement regressions against a previous report.
+    """
+    before = {
+        (size["users"], name): r
+        for size in baseline["results"] for name, r in size.get("variants", {}).items()
+    }
+    regressions = []
+    for size in report["results"]:
+        for name, r in size.get("variants", {}).items():
+            old = before.get((size["users"], name))
+            if old is None:
+                continue
+            if r["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{size['users']} {name}: p50 {old['p50_ms']:.2f} -> {r['p50_ms']:.2f} ms")
+            for key in ("flat_agreement", "bucket_agreement", "vibe_recall"):
+                if r[key] < old[key] - 0.01:
+                    regressions.append(f"{size['users']} {name}: {key} {old[key]:.3f} -> {r[key]:.3f}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark compute_matches_for_user on synthetic populations.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--clusters", type=int, default=40, help="Personas the embeddings cluster around")
+    parser.add_argument("--queries", type=int, default=50, help="Users matched per variant and size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", help="Earlier JSON report to flag regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown vs the baseline")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_size(args.child, args.clusters, args.queries, args.seed, args.variants)))
+        sys.exit(0)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "machine": {"python": platform.python_version(), "numpy": np.__version__,
+                    "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {"clusters": args.clusters, "queries": args.queries, "seed": args.seed, "reference": REFERENCE},
+        "results": [],
+    }
+    for count in args.sizes:
+        if not args.json:
+            print(f"⏱️  {count} users...")
+        report["results"].append(run_child(count, args))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+        for line in regressions:
+            print(f"⚠️  {line}")
+        if args.baseline and not regressions:
+            print("✅ No regressions against the baseline")
+    sys.exit(1 if regressions else 0)
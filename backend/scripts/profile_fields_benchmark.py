@@ -0,0 +1,60 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.client import get_supabase
+from app.profile_fields import PROFILE_FIELD_SETS
+from app.tools.get_user_profile import get_user_profile
+
+
+def benchmark(user_ids, repeats):
+    """
+    Bytes of profile JSON returned and latency per get_user_profile call,
+    for every field set. "full" is what every caller fetched before.
+    """
+    results = {}
+    for fields in PROFILE_FIELD_SETS:
+        sizes, latencies = [], []
+        for _ in range(repeats):
+            for user_id in user_ids:
+                started = time.perf_counter()
+                res = get_user_profile(user_id, fields)
+                latencies.append((time.perf_counter() - started) * 1000)
+                sizes.append(len(json.dumps(res.get("profile")).encode("utf-8")))
+        latencies.sort()
+        results[fields] = {
+            "calls": len(latencies),
+            "avg_bytes": sum(sizes) / len(sizes),
+            "p50_ms": latencies[len(latencies) // 2],
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bytes and latency of get_user_profile per field set.")
+    parser.add_argument("--users", type=int, default=20, help="Number of users to sample")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    res = get_supabase().table("users").select("user_id").limit(args.users).execute()
+    user_ids = [r["user_id"] for r in res.data or []]
+    if not user_ids:
+        print("No users found. Run seed_data.py first.")
+        sys.exit(1)
+
+    results = benchmark(user_ids, args.repeats)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        full = results["full"]
+        print(f"{'fields':>10} {'bytes':>10} {'p50 ms':>8} {'p95 ms':>8} {'vs full':>8}")
+        for fields, r in results.items():
+            ratio = r["avg_bytes"] / full["avg_bytes"] if full["avg_bytes"] else 0.0
+            print(f"{fields:>10} {r['avg_bytes']:>10.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {ratio:>7.0%}")
@@ -0,0 +1,75 @@
+import sys
+import os
+
+# Add the backend directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.client import get_supabase
+from app.matching_engine import compute_matches_for_user, compute_matches_rpc
+
+CATEGORY_KEYS = {
+    "location_based": "location_score",
+    "interest_based": "interest_score",
+    "activity_based": "activity_score",
+    "personality_based": "personality_score",
+    "overall_vibe": "semantic_score",
+}
+TOLERANCE = 1e-6
+
+
+def category_scores(result):
+    """
+    Per-category score lists. Users with equal scores may be ordered
+    differently by the two paths, so the scores are compared, not the ids.
+    """
+    return {
+        category: [m[key] for m in result["classified_matches"][category]]
+        for category, key in CATEGORY_KEYS.items()
+    }
+
+
+def compare(user_id):
+    sql_result = compute_matches_rpc(user_id)
+    if not sql_result:
+        return ["compute_user_matches returned no rows"]
+    py_result = compute_matches_for_user(user_id, mode="loop")
+
+    problems = []
+    sql_scores, py_scores = category_scores(sql_result), category_scores(py_result)
+    for category in CATEGORY_KEYS:
+        a, b = sql_scores[category], py_scores[category]
+        if len(a) != len(b) or any(abs(x - y) > TOLERANCE for x, y in zip(a, b)):
+            problems.append(f"{category}: sql={[round(x, 4) for x in a]} python={[round(x, 4) for x in b]}")
+
+    # Every returned row must carry the same breakdown as the Python engine
+    py_rows = {m["match_user_id"]: m for m in py_result["flat_matches"]}
+    for m in sql_result["flat_matches"]:
+        other = py_rows.get(m["match_user_id"])
+        if other and abs(other["score"] - m["score"]) > TOLERANCE:
+            problems.append(f"{m['match_user_id']}: score sql={m['score']:.6f} python={other['score']:.6f}")
+    return problems
+
+
+def test_matching_rpc_parity(sample=10):
+    supabase = get_supabase()
+    res = supabase.table("users").select("user_id, name").limit(sample).execute()
+    if not res.data:
+        print("No users found. Run seed_data.py first.")
+        return
+
+    failures = 0
+    for user in res.data:
+        problems = compare(user["user_id"])
+        if problems:
+            failures += 1
+            print(f"❌ {user['name']} ({user['user_id']})")
+            for p in problems:
+                print(f"   {p}")
+        else:
+            print(f"✅ {user['name']} ({user['user_id']})")
+
+    print(f"\n{len(res.data) - failures}/{len(res.data)} users match between SQL and Python paths.")
+
+
+if __name__ == "__main__":
+    test_matching_rpc_parity(int(sys.argv[1]) if len(sys.argv) > 1 else 10)